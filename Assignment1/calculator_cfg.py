@@ -3,16 +3,35 @@
 Calculator implementation using Lark parser and recursive AST evaluation.
 """
 
+import os
 import sys
 import math
+import json
+import time
+import functools
+import mmap
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from lark import Lark, Transformer, v_args
+from lark.exceptions import VisitError
 
-# Load the grammar from grammar.lark
-with open('grammar.lark', 'r') as f:
+# NumPy is only needed by evaluate_array
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Load the grammar from grammar.lark next to this file, so the calculator runs from any directory
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'grammar.lark')
+with open(GRAMMAR_PATH, 'r') as f:
     grammar = f.read()
 
 # Create parser instance
-parser = Lark(grammar, parser='lalr', transformer=None)
+# The LALR tables are saved in grammar.lark.cache and loaded from there on the next start.
+# Lark stores a hash of the grammar, the options and its own version with them and builds
+# the tables again when any of these change.
+parser = Lark(grammar, parser='lalr', transformer=None, cache=GRAMMAR_PATH + '.cache')
 
 
 class CalculatorTransformer(Transformer):
@@ -21,6 +40,14 @@ class CalculatorTransformer(Transformer):
     Each method corresponds to a rule in the grammar and returns the computed result.
     """
 
+    def __init__(self, variables=None):
+        """
+        Args:
+            variables: Optional dict mapping variable names to their values
+        """
+        super().__init__()
+        self.variables = variables or {}
+
     @v_args(inline=True)
     def number(self, token):
         """
@@ -34,6 +61,25 @@ class CalculatorTransformer(Transformer):
         """
         return float(token)
 
+    @v_args(inline=True)
+    def variable(self, token):
+        """
+        Look up the value of a variable.
+        
+        Args:
+            token: The NAME token from the parser
+            
+        Returns:
+            float: The value bound to the variable
+            
+        Raises:
+            NameError: If no value is bound to the variable
+        """
+        name = str(token)
+        if name not in self.variables:
+            raise NameError(f"Unknown variable '{name}'")
+        return float(self.variables[name])
+
     @v_args(inline=True)
     def add(self, a, b):
         """
@@ -119,18 +165,274 @@ class CalculatorTransformer(Transformer):
         return math.log(value) / math.log(base)
 
 
-def evaluate(expression):
+class ArrayTransformer(CalculatorTransformer):
+    """
+    CalculatorTransformer for NumPy arrays.
+    
+    Variables are bound to float64 arrays, so every operation of the expression
+    is done once on whole arrays instead of once per row. +, -, * and ^ are the
+    inherited methods (Python operators on arrays are NumPy's element-wise
+    operations); only the logarithm needs np.log instead of math.log.
+    Subexpressions without variables are still computed on floats.
+    """
+
+    @v_args(inline=True)
+    def variable(self, token):
+        """
+        Look up the array bound to a variable.
+        
+        Args:
+            token: The NAME token from the parser
+            
+        Returns:
+            numpy.ndarray: The values bound to the variable as float64
+            
+        Raises:
+            NameError: If no array is bound to the variable
+        """
+        name = str(token)
+        if name not in self.variables:
+            raise NameError(f"Unknown variable '{name}'")
+        return np.asarray(self.variables[name], dtype=np.float64)
+
+    @v_args(inline=True)
+    def log(self, value, base):
+        """
+        Element-wise logarithm: log(value) base base.
+        
+        Args:
+            value: The values to take the logarithm of (array or float)
+            base: The logarithm bases (array or float)
+            
+        Returns:
+            numpy.ndarray: log(value) / log(base) for every element
+        """
+        return np.log(value) / np.log(base)
+
+
+class Compiler(Transformer):
+    """
+    Transformer that turns a parse tree into straight-line Python code.
+    
+    Every method returns either a number, when its subtree has no variables and
+    was computed at compile time (constant folding), or the name of the local
+    that holds the value of the subtree when the code runs. Every operation on
+    a variable becomes one assignment, in the order CalculatorTransformer would
+    compute it, so the code raises the same errors and rounds the same way.
+    Flat code also keeps deeply nested expressions within CPython's limits on
+    nested parentheses.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+        self.constants = {}
+        self.loaded = {}
+
+    def operand(self, value):
+        """
+        Name an operand in the generated code.
+        
+        Args:
+            value: A folded number or the name of a local
+            
+        Returns:
+            str: The local, or a new global holding the number (repr would not
+            work for inf, nan or the complex results of negative ^ fraction)
+        """
+        if isinstance(value, str):
+            return value
+        name = f"k{len(self.constants)}"
+        self.constants[name] = value
+        return name
+
+    def emit(self, expression):
+        """
+        Add an assignment of expression to a new local.
+        
+        Args:
+            expression: Python expression over operands
+            
+        Returns:
+            str: The name of the new local
+        """
+        name = f"t{len(self.lines)}"
+        self.lines.append(f"{name} = {expression}")
+        return name
+
+    def binary(self, a, b, fold, operator):
+        """
+        Fold a binary operation on two numbers, or emit it.
+        
+        An operation that fails on its constants is emitted as well, so it
+        fails when the code runs, in the same order as in CalculatorTransformer.
+        
+        Args:
+            a: Left operand (number or local)
+            b: Right operand (number or local)
+            fold: Function computing the operation on two numbers
+            operator: The Python operator for the generated code
+            
+        Returns:
+            The folded number or the local holding the result
+        """
+        if not isinstance(a, str) and not isinstance(b, str):
+            try:
+                return fold(a, b)
+            except (ArithmeticError, ValueError):
+                pass
+        return self.emit(f"{self.operand(a)} {operator} {self.operand(b)}")
+
+    @v_args(inline=True)
+    def number(self, token):
+        """Convert NUMBER token to float (a constant)."""
+        return float(token)
+
+    @v_args(inline=True)
+    def variable(self, token):
+        """Load a variable into a local the first time it is used."""
+        name = str(token)
+        if name not in self.loaded:
+            self.loaded[name] = self.emit(f"float(variables[{name!r}])")
+        return self.loaded[name]
+
+    @v_args(inline=True)
+    def add(self, a, b):
+        """Compile a + b."""
+        return self.binary(a, b, lambda x, y: x + y, '+')
+
+    @v_args(inline=True)
+    def sub(self, a, b):
+        """Compile a - b."""
+        return self.binary(a, b, lambda x, y: x - y, '-')
+
+    @v_args(inline=True)
+    def mul(self, a, b):
+        """Compile a * b."""
+        return self.binary(a, b, lambda x, y: x * y, '*')
+
+    @v_args(inline=True)
+    def pow(self, base, exponent):
+        """Compile base ^ exponent."""
+        return self.binary(base, exponent, lambda x, y: x ** y, '**')
+
+    @v_args(inline=True)
+    def neg(self, value):
+        """Compile -value."""
+        if not isinstance(value, str):
+            return -value
+        return self.emit(f"-{value}")
+
+    @v_args(inline=True)
+    def log(self, value, base):
+        """Compile log value base base."""
+        if not isinstance(value, str) and not isinstance(base, str):
+            try:
+                return math.log(value) / math.log(base)
+            except (ArithmeticError, ValueError):
+                pass
+        return self.emit(f"log({self.operand(value)}) / log({self.operand(base)})")
+
+
+def compile_expression(expression):
+    """
+    Compile an expression into a Python function.
+    
+    The expression is parsed once, constant subexpressions are computed at
+    compile time and the rest becomes straight-line Python code (see Compiler),
+    which is compiled by Python into a code object.
+    
+    Args:
+        expression: String containing the mathematical expression
+        
+    Returns:
+        function: f(variables=None) computing the expression for a dict of
+        variable values; its source is in f.source
+        
+    Raises:
+        lark.exceptions.UnexpectedInput: If the expression is syntactically invalid
+    """
+    compiler = Compiler()
+    result = transform(compiler, parser.parse(expression))
+    if not isinstance(result, str):
+        # folded completely, there is no code to run
+        def constant(variables=None):
+            return result
+        constant.source = f"return {result!r}"
+        return constant
+    source = "\n".join(
+        ["def compiled(variables=None):",
+         "    if variables is None:",
+         "        variables = {}",
+         "    try:"]
+        + [f"        {line}" for line in compiler.lines]
+        + [f"        return {result}",
+           "    except KeyError as e:",
+           "        raise NameError(f\"Unknown variable '{e.args[0]}'\") from None"])
+    namespace = {'log': math.log, **compiler.constants}
+    exec(compile(source, f"<calculator {expression!r}>", 'exec'), namespace)
+    compiled = namespace['compiled']
+    compiled.source = source
+    return compiled
+
+
+# evaluate() compiles each distinct expression once and keeps the most recently used
+# CACHE_SIZE functions, so an expression seen before is neither parsed nor compiled again
+CACHE_SIZE = 1024
+cached_compile = functools.lru_cache(maxsize=CACHE_SIZE)(compile_expression)
+
+
+def set_cache_size(size):
+    """
+    Change the number of compiled expressions kept by evaluate (the cache is emptied).
+    
+    Args:
+        size: Maximum number of cached expressions, None for no limit, 0 to disable
+    """
+    global cached_compile
+    cached_compile = functools.lru_cache(maxsize=size)(compile_expression)
+
+
+def cache_info():
+    """
+    Statistics of the cache of compiled expressions.
+    
+    Returns:
+        functools._CacheInfo: hits, misses, maxsize and currsize
+    """
+    return cached_compile.cache_info()
+
+
+def parse(expression):
+    """
+    Parse an expression without evaluating it.
+    
+    The parse tree can be evaluated any number of times with evaluate_array,
+    e.g. once for every batch of rows.
+    
+    Args:
+        expression: String containing the mathematical expression
+        
+    Returns:
+        lark.Tree: The parse tree
+    """
+    return parser.parse(expression)
+
+
+def evaluate(expression, variables=None):
     """
     Parse and evaluate a mathematical expression.
     
     This function:
     1. Takes a raw expression string as input
-    2. Parses it using the Lark parser to create a parse tree
-    3. Applies the CalculatorTransformer to recursively evaluate the tree
+    2. Looks up its compiled function in the cache, on a miss parses and
+       compiles it (see compile_expression)
+    3. Calls the function with the variables
     4. Returns the final computed result
     
     Args:
         expression: String containing the mathematical expression
+        variables: Optional dict mapping variable names to numbers
         
     Returns:
         float: The result of evaluating the expression
@@ -139,15 +441,270 @@ def evaluate(expression):
         lark.exceptions.UnexpectedInput: If the expression is syntactically invalid
         lark.exceptions.UnexpectedCharacters: If the expression contains invalid characters
         ZeroDivisionError: If division by zero occurs (including in logarithms)
+        NameError: If the expression uses a variable that is not in variables
+    """
+    # Compile the expression (or find it in the cache) and run it
+    return cached_compile(expression)(variables)
+
+
+def transform(calculator, tree):
+    """
+    Apply a transformer to a parse tree.
+    
+    Lark wraps an exception raised inside a transformer method in a VisitError;
+    the original exception (e.g. ZeroDivisionError or NameError) is raised instead.
+    
+    Args:
+        calculator: The CalculatorTransformer to apply
+        tree: The parse tree
+        
+    Returns:
+        The result of the transformation
+    """
+    try:
+        return calculator.transform(tree)
+    except VisitError as e:
+        raise e.orig_exc from None
+
+
+def evaluate_array(expression, variables):
+    """
+    Evaluate an expression over NumPy arrays bound to its variables.
+    
+    The expression is evaluated once, with every operation applied to whole
+    arrays, which replaces a Python loop calling evaluate() for every row.
+    Arrays of different shapes are broadcast against each other.
+    
+    On the same inputs the results equal those of evaluate up to rounding in
+    the last place (NumPy's vectorized log and power may round differently
+    from the math library), except where evaluate fails or leaves the reals:
+    the logarithm of 0 or of a negative number, or a fractional power of a
+    negative number, gives -inf or nan (with a NumPy RuntimeWarning) instead
+    of an exception or a complex number.
+    
+    Args:
+        expression: String containing the expression, or a tree returned by parse
+        variables: Dict mapping variable names to arrays (or anything np.asarray accepts)
+        
+    Returns:
+        numpy.ndarray: The result for every row, as float64
+        
+    Raises:
+        ImportError: If NumPy is not installed
+        NameError: If the expression uses a variable that is not in variables
+    """
+    if np is None:
+        raise ImportError("evaluate_array needs NumPy (pip install numpy)")
+    tree = parser.parse(expression) if isinstance(expression, str) else expression
+    return np.asarray(transform(ArrayTransformer(variables), tree), dtype=np.float64)
+
+
+def format_result(result):
+    """
+    Format a result for printing.
+    
+    Args:
+        result: The value returned by evaluate
+        
+    Returns:
+        str: The result as an int if it's a whole number, otherwise as a float
+    """
+    if isinstance(result, float) and result.is_integer():
+        return str(int(result))
+    return str(result)
+
+
+def error_message(error):
+    """
+    Reduce an exception to a single line, so it can be reported in place of a result.
+    
+    Lark's syntax errors span several lines (the input with a caret under the
+    offending character and the expected tokens); only the first line is kept.
+    
+    Args:
+        error: The exception raised while evaluating an expression
+        
+    Returns:
+        str: The first line of the message, or the exception type if it has none
+    """
+    lines = str(error).strip().splitlines()
+    return lines[0] if lines else type(error).__name__
+
+
+def run_batch(lines, output, json_lines=False, timing=False):
+    """
+    Evaluate one expression per line and write one result per line.
+    
+    This is the long-lived mode of the calculator: the parser is built once and
+    compiled expressions are cached, so a repeated expression is not parsed
+    again. An expression that fails is answered with "Error: <message>" on its
+    line and the next one is evaluated.
+    Output is flushed after every line, so another program can talk to the
+    calculator through a pipe, one expression at a time.
+    
+    With json_lines, every input line is a JSON string or an object with an
+    "expression" key (and optional "variables" and an "id" that is copied to
+    the answer), and every output line is an object with "result" or "error".
+    
+    Args:
+        lines: Iterable of input lines, e.g. sys.stdin
+        output: File to write the results to, e.g. sys.stdout
+        json_lines: Read and write JSON lines instead of plain text
+        timing: Also report the time spent on each expression in milliseconds
+        
+    Returns:
+        int: The number of expressions that failed
+    """
+    failures = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        answer = {}
+        start = time.perf_counter()
+        try:
+            request = json.loads(line) if json_lines else line
+            variables = None
+            if isinstance(request, dict):
+                if 'id' in request:
+                    answer['id'] = request['id']
+                variables = request.get('variables')
+                request = request['expression']
+            answer['result'] = evaluate(request, variables)
+        except Exception as e:
+            answer['error'] = error_message(e)
+            failures += 1
+        elapsed = (time.perf_counter() - start) * 1000
+        
+        if json_lines:
+            if timing:
+                answer['time_ms'] = round(elapsed, 3)
+            output.write(json.dumps(answer) + "\n")
+        else:
+            text = format_result(answer['result']) if 'result' in answer else f"Error: {answer['error']}"
+            if timing:
+                text += f"\t{elapsed:.3f} ms"
+            output.write(text + "\n")
+        output.flush()
+    return failures
+
+
+# Bulk file mode reads the input in chunks of about CHUNK_SIZE bytes
+CHUNK_SIZE = 1 << 20
+
+
+def line_chunks(path, chunk_size=CHUNK_SIZE):
+    """
+    Split a file into chunks of whole lines.
+    
+    The file is memory-mapped and only the bytes around each boundary are
+    looked at, so finding the chunks reads almost nothing.
+    
+    Args:
+        path: Path of the input file
+        chunk_size: Approximate size of a chunk in bytes
+        
+    Yields:
+        tuple: (start, end) byte offsets of a chunk, end is just after a newline
+        (or the end of the file)
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            while start < size:
+                end = mapped.find(b'\n', min(start + chunk_size, size) - 1)
+                end = size if end == -1 else end + 1
+                yield start, end
+                start = end
+
+
+def evaluate_chunk(path, start, end, binary=False):
+    """
+    Evaluate the expressions in one chunk of a file (runs in a worker process).
+    
+    Every line gives exactly one result, so results line up with the input:
+    in text mode the formatted result or "Error: <message>", in binary mode a
+    float64 (nan for an expression that fails or has a complex result).
+    
+    Args:
+        path: Path of the input file
+        start: Byte offset of the first line of the chunk
+        end: Byte offset just after the last line of the chunk
+        binary: Produce packed float64 values instead of text lines
+        
+    Returns:
+        tuple: (output bytes, number of lines, number of failures)
     """
-    # Parse the expression into a parse tree
-    tree = parser.parse(expression)
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            lines = mapped[start:end].decode().splitlines()
+    failures = 0
+    if binary:
+        results = array('d')
+        for line in lines:
+            try:
+                results.append(evaluate(line))
+            except Exception:
+                results.append(math.nan)
+                failures += 1
+        return results.tobytes(), len(lines), failures
+    results = []
+    for line in lines:
+        try:
+            results.append(format_result(evaluate(line)))
+        except Exception as e:
+            results.append(f"Error: {error_message(e)}")
+            failures += 1
+    results.append('')
+    return "\n".join(results).encode(), len(lines), failures
+
+
+def evaluate_file(path, output, binary=False, workers=None, chunk_size=CHUNK_SIZE):
+    """
+    Evaluate a file of newline-separated expressions, streaming the results.
     
-    # Transform the tree using our CalculatorTransformer to get the final result
-    transformer = CalculatorTransformer()
-    result = transformer.transform(tree)
+    The file is memory-mapped and split into chunks of whole lines (see
+    line_chunks), the chunks are evaluated in a pool of worker processes and
+    their results are written in input order. At most two chunks per worker
+    are in flight, so memory use does not grow with the size of the file.
     
-    return result
+    Args:
+        path: Path of the input file
+        output: Binary file to write to (e.g. sys.stdout.buffer)
+        binary: Write packed float64 values (native byte order) instead of text lines
+        workers: Number of worker processes (default: number of CPUs), 1 runs in this process
+        chunk_size: Approximate size of a chunk in bytes
+        
+    Returns:
+        tuple: (number of lines, number of failures)
+    """
+    workers = workers or os.cpu_count() or 1
+    lines = failures = 0
+    if workers == 1:
+        for start, end in line_chunks(path, chunk_size):
+            data, count, failed = evaluate_chunk(path, start, end, binary)
+            output.write(data)
+            lines += count
+            failures += failed
+        return lines, failures
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for start, end in line_chunks(path, chunk_size):
+            pending.append(pool.submit(evaluate_chunk, path, start, end, binary))
+            while len(pending) > 2 * workers or (pending and pending[0].done()):
+                data, count, failed = pending.popleft().result()
+                output.write(data)
+                lines += count
+                failures += failed
+        while pending:
+            data, count, failed = pending.popleft().result()
+            output.write(data)
+            lines += count
+            failures += failed
+    return lines, failures
 
 
 def main():
@@ -158,23 +715,59 @@ def main():
     evaluates it, and prints the result. The result is converted to int
     if it's a whole number, otherwise printed as a float.
     
+    Without an expression, expressions are read from standard input, one per
+    line, and answered one per line (see run_batch). With --file, a file of
+    expressions is evaluated in bulk (see evaluate_file).
+    
     Usage: python calculator_cfg.py "expression"
+           python calculator_cfg.py [--json] [--time] < expressions.txt
+           python calculator_cfg.py --file expressions.txt [--output results] [--binary] [--workers N]
     Example: python calculator_cfg.py "1+2*3"
     """
-    if len(sys.argv) != 2:
-        print("Usage: python calculator_cfg.py <expression>", file=sys.stderr)
+    # Options are picked out by hand: an expression such as "-2^2" must not be taken for one
+    usage = ("Usage: python calculator_cfg.py [--json] [--time] [<expression>]\n"
+             "       python calculator_cfg.py --file <input> [--output <file>] [--binary] [--workers <n>]")
+    flags = ('--json', '--time', '--binary')
+    settings = ('--file', '--output', '--workers')
+    options = {}
+    arguments = []
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg in flags:
+            options[arg] = True
+        elif arg in settings:
+            options[arg] = next(args, None)
+            if options[arg] is None:
+                print(usage, file=sys.stderr)
+                sys.exit(1)
+        else:
+            arguments.append(arg)
+    if len(arguments) > 1 or (arguments and '--file' in options):
+        print(usage, file=sys.stderr)
         sys.exit(1)
     
-    expression = sys.argv[1]
+    if '--file' in options:
+        workers = int(options['--workers']) if '--workers' in options else None
+        if '--output' in options:
+            with open(options['--output'], 'wb') as output:
+                lines, failures = evaluate_file(options['--file'], output, '--binary' in options, workers)
+        else:
+            lines, failures = evaluate_file(options['--file'], sys.stdout.buffer, '--binary' in options, workers)
+        if failures:
+            print(f"{failures} of {lines} expressions failed", file=sys.stderr)
+        sys.exit(1 if failures else 0)
+    
+    if not arguments:
+        failures = run_batch(sys.stdin, sys.stdout, '--json' in options, '--time' in options)
+        sys.exit(1 if failures else 0)
+    
+    expression = arguments[0]
     
     try:
         result = evaluate(expression)
         
         # Convert to int if it's a whole number for cleaner output
-        if isinstance(result, float) and result.is_integer():
-            print(int(result))
-        else:
-            print(result)
+        print(format_result(result))
             
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
@@ -0,0 +1,255 @@
+from calculator_cfg import evaluate, evaluate_array, parse, np, evaluate_file, line_chunks, format_result, error_message
+from calculator_cfg import compile_expression, set_cache_size, cache_info, CACHE_SIZE, CalculatorTransformer, transform
+from calculator_cfg import run_batch
+import calculator_cfg
+import json
+import math
+import io
+import os
+import tempfile
+from array import array
+from lark.exceptions import UnexpectedInput
+from colorama import Fore, Style
+
+# evaluate_array gives the results of evaluate for every row (up to rounding in the last
+# place) wherever evaluate gives a real number
+def test_evaluate_array():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    if np is None:
+        print("NumPy is not installed, evaluate_array is not tested")
+        return
+
+    xs = [-2.0, -0.5, 0.0, 0.5, 1.0, 2.0, 3.0, 8.0]
+    ys = [4.0, 2.0, 1.0, 0.0, -1.0, 0.25, 9.0, 16.0]
+    tests = [
+        "x + y",
+        "x - 2*y",
+        "-x^2",
+        "x^3 - y*x",
+        "2^x^2",
+        "y^0.5",
+        "log y base 2",
+        "log 8 base y",
+        "log (x*x + 1) base 2",
+        "log8 base2 + x",
+        "logx * basey + 1",
+        "loglog 16 base 2 base y",
+    ]
+    for expression in tests:
+        variables = {'x': xs, 'y': ys, 'logx': xs, 'basey': ys}
+        with np.errstate(all='ignore'):
+            results = evaluate_array(expression, variables)
+            assert np.array_equal(evaluate_array(parse(expression), variables), results, equal_nan=True)
+        assert results.shape == (len(xs),) and results.dtype == np.float64
+        compared = 0
+        for row, (x, y) in enumerate(zip(xs, ys)):
+            try:
+                expected = evaluate(expression, {'x': x, 'y': y, 'logx': x, 'basey': y})
+            except (ArithmeticError, ValueError):
+                continue
+            if isinstance(expected, complex):
+                assert math.isnan(results[row])
+            else:
+                assert math.isclose(results[row], expected, rel_tol=1e-12, abs_tol=1e-300)
+            compared += 1
+        assert compared > 0
+        print(f"ARRAY {MAGENTA}{expression}{RESET} == evaluate on {compared} of {len(xs)} rows")
+
+    # where evaluate fails or leaves the reals, evaluate_array gives inf or nan
+    with np.errstate(all='ignore'):
+        assert list(evaluate_array("log x base 2", {'x': [0.0, 8.0]})) == [-math.inf, 3.0]
+        assert math.isnan(evaluate_array("log x base 2", {'x': [-1.0]})[0])
+        assert math.isnan(evaluate_array("x^0.5", {'x': [-8.0]})[0])
+        assert evaluate_array("log 8 base x", {'x': [1.0]})[0] == math.inf
+    for expression, variables in [("log x base 2", {'x': 0.0}), ("log 8 base x", {'x': 1.0})]:
+        try:
+            evaluate(expression, variables)
+            assert False
+        except (ArithmeticError, ValueError):
+            pass
+    assert isinstance(evaluate("x^0.5", {'x': -8.0}), complex)
+    print(f"ARRAY {MAGENTA}log 0, log -1, (-8)^0.5, log base 1{RESET} == -inf, nan, nan, inf")
+
+    # log and base directly followed by a digit or by log/base are keywords, else names
+    assert evaluate("log8 base2") == evaluate_array("log8 base2", {}) == 3.0
+    assert evaluate("loglog 16 base 2 base 2") == evaluate_array("loglog 16 base 2 base 2", {}) == 2.0
+    assert evaluate("log8 base x", {'x': 2}) == evaluate_array("log8 base x", {'x': [2.0]})[0] == 3.0
+    assert evaluate("logx + basex", {'logx': 1, 'basex': 2}) == 3.0
+    try:
+        evaluate("logx + base2x", {'logx': 1, 'base2x': 2}) # base 2 x, not a name
+        assert False
+    except UnexpectedInput:
+        pass
+    assert list(evaluate_array("log x base b", {'x': [8.0, 9.0], 'b': [2.0, 3.0]})) == [3.0, 2.0]
+    for evaluator in (evaluate, lambda expression: evaluate_array(expression, {})):
+        try:
+            evaluator("logx + 1")
+            assert False
+        except NameError:
+            pass
+    print(f"ARRAY {MAGENTA}log8 base2, logx, basex{RESET} lexed the same by both")
+
+    # arrays of different shapes are broadcast against each other
+    assert evaluate_array("x * y", {'x': [[1.0], [2.0]], 'y': [1.0, 10.0]}).tolist() == [[1.0, 10.0], [2.0, 20.0]]
+
+    print("\nAll tests passed!")
+
+def test_compile_expression():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # the compiled function computes what CalculatorTransformer computes
+    tests = [("1 + 2 * 3", {}), ("-2^2", {}), ("x * (y - 1) + 2^x", {'x': 3, 'y': 0.5}),
+             ("log x base 2 + log 8 base 2", {'x': 32}), ("(x - 10)^0.5", {'x': 1})]
+    for expression, variables in tests:
+        expected = transform(CalculatorTransformer(variables), parse(expression))
+        assert compile_expression(expression)(variables) == expected
+        print(f"COMPILE {MAGENTA}{expression}{RESET} == {expected}")
+
+    # constants are folded, a constant that fails is left to fail when the function runs
+    assert compile_expression("2 * 3 + 1").source == "return 7.0"
+    failing = compile_expression("log 1 base 1 + x")
+    for variables, error in [({'x': 1}, ZeroDivisionError), ({}, ZeroDivisionError)]:
+        try:
+            failing(variables)
+            assert False
+        except error:
+            pass
+    try:
+        compile_expression("x + 1")()
+        assert False
+    except NameError:
+        pass
+
+    # evaluate keeps the most recently used functions, the cache is emptied by set_cache_size
+    try:
+        set_cache_size(2)
+        assert cache_info()[2:] == (2, 0)
+        for expression in ["1 + 1", "1 + 1", "2 + 2", "1 + 1", "3 + 3", "2 + 2"]:
+            evaluate(expression)
+        # "2 + 2" was evicted by "3 + 3" and compiled again
+        assert cache_info() == (2, 4, 2, 2)
+        assert calculator_cfg.cached_compile("1 + x") is calculator_cfg.cached_compile("1 + x")
+        print(f"CACHE {MAGENTA}size 2{RESET}: {cache_info()}")
+
+        set_cache_size(0)
+        assert evaluate("1 + 1") == evaluate("1 + 1") == 2.0
+        assert cache_info() == (0, 2, 0, 0)
+
+        set_cache_size(None)
+        for i in range(2 * CACHE_SIZE):
+            evaluate(f"{i} + 1")
+        assert cache_info() == (0, 2 * CACHE_SIZE, None, 2 * CACHE_SIZE)
+        print(f"CACHE {MAGENTA}unbounded{RESET}: {cache_info()}")
+    finally:
+        set_cache_size(CACHE_SIZE)
+    assert cache_info() == (0, 0, CACHE_SIZE, 0)
+
+    print("\nAll tests passed!")
+
+def test_run_batch():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # one answer per expression, a failing one is answered with its error, blank lines are skipped
+    lines = ["1 + 2\n", "\n", "2 ^ 0.5\n", "1 +\n", "log 1 base 1\n", "x * 2\n", "  7 * 6  \n"]
+    output = io.StringIO()
+    assert run_batch(lines, output) == 3
+    answers = output.getvalue().splitlines()
+    assert answers[0] == "3" and answers[1] == str(2 ** 0.5) and answers[5] == "42"
+    assert answers[2].startswith("Error: Unexpected token")
+    assert answers[3] == "Error: float division by zero"
+    assert answers[4] == "Error: Unknown variable 'x'"
+    assert len(answers) == 6
+    print(f"BATCH {MAGENTA}{len(lines)} lines{RESET} == {answers}")
+
+    output = io.StringIO()
+    assert run_batch(["1 + 1", "2 + 2"], output, timing=True) == 0
+    assert [line.split("\t")[0] for line in output.getvalue().splitlines()] == ["2", "4"]
+    assert all(line.endswith(" ms") for line in output.getvalue().splitlines())
+
+    # JSON lines: a string or an object with an expression, variables and an id copied to the answer
+    requests = [
+        json.dumps("1 + 2"),
+        json.dumps({"expression": "x * y", "variables": {"x": 3, "y": 4}, "id": 7}),
+        json.dumps({"expression": "x + 1", "id": "a"}),
+        json.dumps({"variables": {}}),
+        "not json",
+        json.dumps("log 8 base 2"),
+    ]
+    output = io.StringIO()
+    assert run_batch(requests, output, json_lines=True, timing=True) == 3
+    answers = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert all(answer.pop('time_ms') >= 0 for answer in answers)
+    assert answers[0] == {'result': 3.0}
+    assert answers[1] == {'id': 7, 'result': 12.0}
+    assert answers[2] == {'id': 'a', 'error': "Unknown variable 'x'"}
+    assert answers[3] == {'error': "'expression'"}
+    assert answers[4]['error'].startswith("Expecting value")
+    assert answers[5] == {'result': 3.0}
+    print(f"BATCH {MAGENTA}JSON lines{RESET} == {answers}")
+
+    print("\nAll tests passed!")
+
+# the expected output of evaluate_file, computed line by line with evaluate
+def expected_file_output(lines, binary):
+    results = array('d') if binary else []
+    for line in lines:
+        try:
+            value = evaluate(line)
+            results.append(value if binary else format_result(value))
+        except Exception as e:
+            results.append(math.nan if binary else f"Error: {error_message(e)}")
+    return results.tobytes() if binary else "".join(result + "\n" for result in results).encode()
+
+def test_evaluate_file():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    lines = [f"{i} * 2 + 1" for i in range(40)]
+    lines[5] = "1 + (2"
+    lines[9] = "log 1 base 1"
+    lines[13] = "(-8)^0.5"
+    lines[17] = "log 2 base 2 + 1 + 2 + 3 + 4 + 5 + 6 + 7 + 8 + 9 + 10" # longer than a chunk
+    with tempfile.TemporaryDirectory() as directory:
+        for name, text in [("trailing", "\n".join(lines) + "\n"), ("no_trailing", "\n".join(lines)),
+                           ("single", "2^10"), ("empty", "")]:
+            path = os.path.join(directory, name + ".txt")
+            with open(path, "w") as f:
+                f.write(text)
+            expected_lines = text.splitlines()
+
+            # the chunks are whole lines that cover the file, in order
+            chunks = list(line_chunks(path, chunk_size=16))
+            with open(path, "rb") as f:
+                data = f.read()
+            assert [start for start, _ in chunks] == [0] + [end for _, end in chunks[:-1]] if data else chunks == []
+            assert (chunks[-1][1] if chunks else 0) == len(data)
+            assert all(data[end - 1:end] == b"\n" for _, end in chunks[:-1])
+            assert b"".join(data[start:end] for start, end in chunks).decode().splitlines() == expected_lines
+
+            for binary in (False, True):
+                for workers in (1, 2):
+                    output = io.BytesIO()
+                    count, failures = evaluate_file(path, output, binary, workers, chunk_size=16)
+                    expected = expected_file_output(expected_lines, binary)
+                    if binary:
+                        results, wanted = array('d', output.getvalue()), array('d', expected)
+                        assert len(results) == len(wanted)
+                        assert all(x == y or (math.isnan(x) and math.isnan(y)) for x, y in zip(results, wanted))
+                    else:
+                        assert output.getvalue() == expected
+                    assert count == len(expected_lines)
+                    # a complex result is written as text but is nan in binary mode
+                    assert failures == ((3 if binary else 2) if count > 1 else 0)
+            print(f"FILE {MAGENTA}{name}{RESET}: {len(chunks)} chunks, {len(expected_lines)} lines == evaluate line by line")
+
+    print("\nAll tests passed!")
+
+if __name__ == "__main__":
+    print(Fore.GREEN + "\nTEST EVALUATE ARRAY\n" + Style.RESET_ALL); test_evaluate_array()
+    print(Fore.GREEN + "\nTEST EVALUATE FILE\n" + Style.RESET_ALL); test_evaluate_file()
+    print(Fore.GREEN + "\nTEST COMPILE EXPRESSION\n" + Style.RESET_ALL); test_compile_expression()
+    print(Fore.GREEN + "\nTEST RUN BATCH\n" + Style.RESET_ALL); test_run_batch()
@@ -2,7 +2,7 @@ import sys
 from lark import Lark, Transformer
 import lark
 import os
-from typing import Tuple, Union, Literal
+from typing import Dict, Tuple, Union, Literal, Optional, Set, List, Iterator, TextIO
 
 # Type alias for our AST structure
 # AST can be a variable, lambda, or application
@@ -13,19 +13,37 @@ AST = Union[
     Tuple[Literal['app'], 'AST', 'AST']          # ('app', func, arg)
 ]
 
+# De Bruijn-indexed AST used by evaluate
+# a bound variable is the number of binders between it and its binder,
+# the name of a lambda is only kept as a hint for linearize
+DBAST = Union[
+    Tuple[Literal['idx'], int],                   # ('idx', k) bound variable
+    Tuple[Literal['var'], VarName],               # ('var', name) free variable
+    Tuple[Literal['lam'], VarName, 'DBAST'],      # ('lam', hint, body)
+    Tuple[Literal['app'], 'DBAST', 'DBAST']      # ('app', func, arg)
+]
+Scope = Tuple  # linked list (name, parent) of enclosing binders, () if empty
+
 #print(f"Python version: {sys.version}")
 #print(f"Lark version: {lark.__version__}")
 
 #  run/execute/interpret source code
 def interpret(source_code: str) -> str:
-    cst = parser.parse(source_code)
-    ast = LambdaCalculusTransformer().transform(cst)
-    result_ast = evaluate(ast)
+    result_ast = evaluate_program(source_code)
     result = linearize(result_ast)
     return result
 
+# the normal form of a program, for callers that print it with write_linearized
+def evaluate_program(source_code: str) -> DBAST:
+    cst = parser.parse(source_code)
+    ast = LambdaCalculusTransformer().transform(cst)
+    return evaluate(to_debruijn(ast))
+
 # convert concrete syntax to CST
-parser = Lark(open("grammar.lark").read(), parser='lalr')
+# the grammar is read from the directory of this file, the LALR tables are cached in
+# grammar.lark.cache and rebuilt by Lark whenever the grammar (or Lark) changes
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark")
+parser = Lark(open(GRAMMAR_PATH).read(), parser='lalr', cache=GRAMMAR_PATH + ".cache")
 
 # convert CST to AST
 class LambdaCalculusTransformer(Transformer):
@@ -43,15 +61,31 @@ class LambdaCalculusTransformer(Transformer):
     def NAME(self, token):
         return str(token)
 
+# replace bound names by De Bruijn indices, free names are kept
+def to_debruijn(tree: AST, scope: Scope = ()) -> DBAST:
+    if tree[0] == 'var':
+        k = 0
+        while scope:
+            if scope[0] == tree[1]:
+                return ('idx', k)
+            scope = scope[1]
+            k += 1
+        return tree
+    elif tree[0] == 'lam':
+        return ('lam', tree[1], to_debruijn(tree[2], (tree[1], scope)))
+    elif tree[0] == 'app':
+        return ('app', to_debruijn(tree[1], scope), to_debruijn(tree[2], scope))
+    else:
+        raise Exception('Unknown tree', tree)
+
 # reduce AST to normal form
-def evaluate(tree: AST) -> AST:
+def evaluate(tree: DBAST) -> DBAST:
     if tree[0] == 'app':
         e1 = evaluate(tree[1])
         if e1[0] == 'lam':
             body = e1[2]
-            name = e1[1]
             arg = tree[2]
-            rhs = substitute(body, name, arg)
+            rhs = substitute(body, arg)
             result = evaluate(rhs)
             pass
         else:
@@ -63,7 +97,7 @@ def evaluate(tree: AST) -> AST:
     return result
 
 # generate a fresh name 
-# needed eg for \y.x [y/x] --> \z.y where z is a fresh name)
+# needed by linearize when the hint of a binder would capture a free name)
 class NameGenerator:
     def __init__(self) -> None:
         self.counter: int = 0
@@ -75,36 +109,122 @@ class NameGenerator:
 
 name_generator = NameGenerator()
 
-# for beta reduction (capture-avoiding substitution)
-# 'replacement' for 'name' in 'tree'
-def substitute(tree: AST, name: str, replacement: AST) -> AST:
-    # tree [replacement/name] = tree with all instances of 'name' replaced by 'replacement'
-    if tree[0] == 'var':
-        if tree[1] == name:
-            return replacement # n [r/n] --> r
-        else:
-            return tree # x [r/n] --> x
+# number of enclosing binders a tree needs to be closed (0 if it has no loose index),
+# computed once per node and cached
+# tuples cannot carry an attribute, so the cache is keyed by id and keeps the node
+# alive with its bound (an id cannot be reused while the node is in the table)
+# the cache is cleared when it reaches 'loose_bound_limit' nodes
+loose_bound_cache: Dict[int, Tuple[DBAST, int]] = {}
+loose_bound_limit = 1 << 18
+
+def loose_bound(tree: DBAST) -> int:
+    entry = loose_bound_cache.get(id(tree))
+    if entry is not None:
+        return entry[1]
+    if tree[0] == 'idx':
+        return tree[1] + 1
+    elif tree[0] == 'var':
+        return 0
     elif tree[0] == 'lam':
-        if tree[1] == name:
-            return tree # \n.e [r/n] --> \n.e
+        bound = max(loose_bound(tree[2]) - 1, 0)
+    elif tree[0] == 'app':
+        bound = max(loose_bound(tree[1]), loose_bound(tree[2]))
+    else:
+        raise Exception('Unknown tree', tree)
+    if len(loose_bound_cache) >= loose_bound_limit:
+        loose_bound_cache.clear()
+    loose_bound_cache[id(tree)] = (tree, bound)
+    return bound
+
+# for beta reduction, 'replacement' for the variable bound 'depth' binders up in 'tree'
+# evaluate only reduces closed terms, so 'replacement' never needs shifting and
+# no binder has to be renamed
+# a subtree without a loose index at or above 'depth' is returned as it is,
+# so unchanged parts are shared instead of copied
+def substitute(tree: DBAST, replacement: DBAST, depth: int = 0) -> DBAST:
+    if loose_bound(tree) <= depth:
+        return tree # nothing refers to the binder of depth or above it
+    if tree[0] == 'idx':
+        if tree[1] == depth:
+            return replacement # 0 [r/0] --> r
         else:
-            fresh_name = name_generator.generate()
-            return ('lam', fresh_name, substitute(substitute(tree[2], tree[1], ('var', fresh_name)), name, replacement))
-            # \x.e [r/n] --> (\fresh.(e[fresh/x])) [r/n]
+            return ('idx', tree[1] - 1) # the binder of depth is gone
+    elif tree[0] == 'lam':
+        return ('lam', tree[1], substitute(tree[2], replacement, depth + 1))
     elif tree[0] == 'app':
-        return ('app', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
+        return ('app', substitute(tree[1], replacement, depth), substitute(tree[2], replacement, depth))
     else:
         raise Exception('Unknown tree', tree)
 
-def linearize(ast: AST) -> str:
-    if ast[0] == 'var':
-        return ast[1]
-    elif ast[0] == 'lam':
-        return "(" + "\\" + ast[1] + "." + linearize(ast[2]) + ")"
-    elif ast[0] == 'app':
-        return "(" + linearize(ast[1]) + " " + linearize(ast[2]) + ")"
-    else:
-        return ast
+# names are rebuilt here: a binder keeps its hint unless that would capture
+# a free name or shadow an enclosing binder, then it gets a fresh name
+# the text is produced as a stream of pieces, in order: the tree is walked with an
+# explicit stack of (node, names) pairs still to print and of text still to close them
+# with, so deep terms need no Python recursion and the work is linear in the output
+def linearize_parts(ast: DBAST, names: Scope = (), free: Optional[Set[str]] = None) -> Iterator[str]:
+    if free is None:
+        free = free_names(ast)
+    stack: List[Union[str, Tuple[DBAST, Scope]]] = [(ast, names)]
+    while stack:
+        item = stack.pop()
+        if type(item) is str:
+            yield item
+            continue
+        ast, names = item
+        if ast[0] == 'idx':
+            k = ast[1]
+            while k:
+                names = names[1]
+                k -= 1
+            yield names[0]
+        elif ast[0] == 'var':
+            yield ast[1]
+        elif ast[0] == 'lam':
+            name = ast[1]
+            if name in free or in_scope(names, name):
+                name = name_generator.generate()
+            yield "(" + "\\" + name + "."
+            stack += (")", (ast[2], (name, names)))
+        elif ast[0] == 'app':
+            yield "("
+            stack += (")", (ast[2], names), " ", (ast[1], names))
+        else:
+            yield ast
+
+def linearize(ast: DBAST, names: Scope = (), free: Optional[Set[str]] = None) -> str:
+    return "".join(linearize_parts(ast, names, free))
+
+# write the text of a term to a file, in blocks of 'block' pieces, so the whole
+# text is never held in memory at once
+def write_linearized(ast: DBAST, output: TextIO, block: int = 4096) -> None:
+    parts: List[str] = []
+    for part in linearize_parts(ast):
+        parts.append(part)
+        if len(parts) >= block:
+            output.write("".join(parts))
+            parts.clear()
+    output.write("".join(parts))
+
+def in_scope(names: Scope, name: str) -> bool:
+    while names:
+        if names[0] == name:
+            return True
+        names = names[1]
+    return False
+
+# walks the tree with an explicit stack, like linearize_parts
+def free_names(tree: DBAST) -> Set[str]:
+    found: Set[str] = set()
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        if tree[0] == 'var':
+            found.add(tree[1])
+        elif tree[0] == 'lam':
+            stack.append(tree[2])
+        elif tree[0] == 'app':
+            stack += (tree[2], tree[1])
+    return found
 
 def main():
     import sys
@@ -122,8 +242,11 @@ def main():
         # Otherwise, treat the input as a direct expression
         expression = input_arg
 
-    result = interpret(expression)
-    print(f"\033[95m{result}\033[0m")
+    # the result is written while it is linearized, not built as one string first
+    result_ast = evaluate_program(expression)
+    sys.stdout.write("\033[95m")
+    write_linearized(result_ast, sys.stdout)
+    sys.stdout.write("\033[0m\n")
 
 if __name__ == "__main__":
     main()
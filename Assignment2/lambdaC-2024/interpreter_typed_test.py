@@ -0,0 +1,195 @@
+import importlib.util
+import io
+import os
+from colorama import Fore, Style
+
+# interpreter-typed.py cannot be imported by name because of the '-', it is loaded from its path
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+spec = importlib.util.spec_from_file_location("interpreter_typed", os.path.join(DIRECTORY, "interpreter-typed.py"))
+typed = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(typed)
+
+interpret, evaluate, linearize = typed.interpret, typed.evaluate, typed.linearize
+to_debruijn, substitute = typed.to_debruijn, typed.substitute
+
+# convert concrete syntax to AST
+def ast(source_code):
+    return typed.LambdaCalculusTransformer().transform(typed.parser.parse(source_code))
+
+# the De Bruijn form of a term without the names of its binders, equal for alpha-equivalent terms
+def nameless(tree):
+    if tree[0] == 'lam':
+        return ('lam', nameless(tree[2]))
+    elif tree[0] == 'app':
+        return ('app', nameless(tree[1]), nameless(tree[2]))
+    else:
+        return tree
+
+# normal form of a closed De Bruijn term as a named AST: evaluate stops at a lambda, so the
+# body of every lambda is opened with a fresh free name (substitute needs a closed replacement)
+# and reduced further
+def normalize(tree):
+    tree = evaluate(tree)
+    if tree[0] == 'lam':
+        name = typed.name_generator.generate()
+        return ('lam', name, normalize(substitute(tree[2], ('var', name))))
+    elif tree[0] == 'app':
+        return ('app', normalize(tree[1]), normalize(tree[2]))
+    else:
+        return tree
+
+# the lines of a testing-data file: (interpreter, expression, expected)
+def read_testing_data(filename):
+    with open(os.path.join(DIRECTORY, filename)) as file:
+        return [tuple(part.strip() for part in line.split(", ")) for line in file if line.strip()]
+
+def test_to_debruijn():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # a bound variable is the number of binders between it and its binder, free names stay
+    assert to_debruijn(ast(r"\x.\y.x y z")) == ('lam', 'x', ('lam', 'y', ('app', ('app', ('idx', 1), ('idx', 0)), ('var', 'z'))))
+    print(f"DEBRUIJN {MAGENTA}\\x.\\y.x y z{RESET} == \\x.\\y.1 0 z")
+
+    # the innermost binder of a name wins
+    assert to_debruijn(ast(r"\x.\x.x")) == ('lam', 'x', ('lam', 'x', ('idx', 0)))
+    assert to_debruijn(ast(r"\x.(\y.x) x")) == ('lam', 'x', ('app', ('lam', 'y', ('idx', 1)), ('idx', 0)))
+    print(f"DEBRUIJN {MAGENTA}\\x.\\x.x, \\x.(\\y.x) x{RESET} == \\x.\\x.0, \\x.(\\y.1) 0")
+
+    # alpha-equivalent terms have the same nameless form
+    assert nameless(to_debruijn(ast(r"\a.\b.a b"))) == nameless(to_debruijn(ast(r"\x.\y.x y")))
+    assert nameless(to_debruijn(ast(r"\a.\b.a b"))) != nameless(to_debruijn(ast(r"\x.\y.y x")))
+
+    print("\nto_debruijn(): All tests passed!\n")
+
+def test_substitute():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # 0 [a/0] = a, a loose index above depth moves down by one
+    assert substitute(('idx', 0), ('var', 'a')) == ('var', 'a')
+    assert substitute(('app', ('idx', 0), ('idx', 1)), ('var', 'a')) == ('app', ('var', 'a'), ('idx', 0))
+    print(f"SUBST {MAGENTA}(0 1) [a/0]{RESET} == (a 0)")
+
+    # under a binder the replaced variable has the next index
+    body = to_debruijn(ast(r"\y.x y"), ('x', ())) # \y.1 0
+    assert substitute(body, ('lam', 'z', ('idx', 0))) == ('lam', 'y', ('app', ('lam', 'z', ('idx', 0)), ('idx', 0)))
+    assert substitute(body[2], ('var', 'a'), 1) == ('app', ('var', 'a'), ('idx', 0))
+    print(f"SUBST {MAGENTA}(\\y.1 0) [\\z.z/0]{RESET} == \\y.(\\z.z) 0")
+
+    # binders are never renamed: (\y.x) [y/x] cannot capture y, linearize renames the binder
+    result = evaluate(to_debruijn(ast(r"(\x.\y.x) y")))
+    assert result == ('lam', 'y', ('var', 'y'))
+    assert linearize(result).startswith(r"(\Var") and linearize(result).endswith(".y)")
+    print(f"SUBST {MAGENTA}(\\y.x) [y/x]{RESET} == {linearize(result)}")
+
+    print("\nsubstitute(): All tests passed!\n")
+
+def test_shared_substitution():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # the number of enclosing binders a term needs, 0 for a closed term
+    assert typed.loose_bound(('idx', 2)) == 3
+    assert typed.loose_bound(to_debruijn(ast(r"\x.\y.x y z"))) == 0
+    assert typed.loose_bound(to_debruijn(ast(r"\y.x y"), ('x', ()))) == 1
+    assert typed.loose_bound(to_debruijn(ast(r"(\y.w y) x"), ('x', ('w', ())))) == 2
+    print(f"BOUND {MAGENTA}2, \\x.\\y.x y z, \\y.1 0, (\\y.2 0) 0{RESET} == 3, 0, 1, 2")
+
+    # the bound of a node is computed once, the cache keeps the node so its id is not reused
+    typed.loose_bound_cache.clear()
+    tree = to_debruijn(ast(r"\y.x y"), ('x', ()))
+    assert typed.loose_bound(tree) == 1
+    assert typed.loose_bound_cache[id(tree)] == (tree, 1) and typed.loose_bound_cache[id(tree)][0] is tree
+    assert typed.loose_bound_cache[id(tree[2])] == (tree[2], 2)
+    typed.loose_bound_cache[id(tree)] = (tree, 5) # a second call only looks the node up
+    assert typed.loose_bound(tree) == 5
+    print(f"BOUND {MAGENTA}\\y.1 0{RESET} cached with its body")
+
+    # the cache is emptied when it is full
+    limit = typed.loose_bound_limit
+    try:
+        typed.loose_bound_limit = 4
+        typed.loose_bound_cache.clear()
+        typed.loose_bound(to_debruijn(ast(r"\a.\b.\c.\d.a b c d")))
+        assert 0 < len(typed.loose_bound_cache) <= 4
+    finally:
+        typed.loose_bound_limit = limit
+        typed.loose_bound_cache.clear()
+
+    # a subtree without a loose index at or above depth is not copied
+    tree = to_debruijn(ast(r"(\z.z) (a b) x"), ('x', ()))
+    result = substitute(tree, ('var', 'c'))
+    assert result == ('app', tree[1], ('var', 'c')) and result[1] is tree[1]
+    body = to_debruijn(ast(r"\y.(\z.z y) x"), ('x', ()))
+    result = substitute(body, ('var', 'c'))
+    assert result[2][1] is body[2][1]
+    print(f"SHARE {MAGENTA}((\\z.z) (a b) 0) [c/0]{RESET} keeps ((\\z.z) (a b))")
+
+    print("\nloose_bound(): All tests passed!\n")
+
+def test_testing_data():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # interpret does not reduce under a lambda and the expected results use the fresh names
+    # of the original interpreter (Var<n>, which the grammar does not accept as a name, so they
+    # are renamed to parse them), so normal forms are compared up to the names of binders
+    cases = read_testing_data("testing-data.txt")
+    assert cases
+    for _, expression, expected in cases:
+        result = normalize(typed.evaluate_program(expression))
+        assert nameless(to_debruijn(result)) == nameless(to_debruijn(ast(expected.replace("Var", "_v"))))
+        print(f"EVAL {MAGENTA}{expression}{RESET} == {interpret(expression)}, normal form {expected}")
+
+    # a result that is already normal is printed as expected
+    assert interpret(r"(\x.x) a") == interpret(r"(\x.\y.x) a b") == "a"
+    assert interpret(r"(\x.\y.x y) z") == r"(\y.(z y))"
+
+    print("\ntesting-data.txt: All tests passed!\n")
+
+def test_streaming_linearize():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # written in blocks of any size, the text is the one linearize returns, fresh names included
+    sources = [case[1] for case in read_testing_data("testing-data.txt")] + [r"(\x.\y.x y) y", r"\x.\y.x (\x.y x) z"]
+    for source in sources:
+        result = typed.evaluate_program(source)
+        for block in (1, 2, 4096):
+            counter = typed.name_generator.counter
+            output = io.StringIO()
+            typed.write_linearized(result, output, block)
+            typed.name_generator.counter = counter
+            assert output.getvalue() == linearize(result)
+        print(f"STREAM {MAGENTA}{source}{RESET} == {output.getvalue()}")
+
+    # the text is written block by block, not as one string
+    class Writes:
+        def __init__(self):
+            self.parts = []
+
+        def write(self, text):
+            self.parts.append(text)
+
+    deep = ('var', 'y')
+    for i in range(3000):
+        deep = ('lam', 'x', ('app', ('idx', 0), deep))
+    output = Writes()
+    counter = typed.name_generator.counter
+    typed.write_linearized(deep, output, block=1000)
+    typed.name_generator.counter = counter
+    text = linearize(deep)
+    assert len(output.parts) > 10 and all(len(part) < 20000 for part in output.parts)
+    assert "".join(output.parts) == text
+    assert text.count("(\\x.") == 1 and text.count("(\\Var") == 2999
+    print(f"STREAM {MAGENTA}3000 nested lambdas{RESET} in {len(output.parts)} writes")
+
+    print("\nwrite_linearized(): All tests passed!\n")
+
+if __name__ == "__main__":
+    print(Fore.GREEN + "\nTEST DE BRUIJN INDICES\n" + Style.RESET_ALL); test_to_debruijn()
+    print(Fore.GREEN + "\nTEST SUBSTITUTION\n" + Style.RESET_ALL); test_substitute()
+    print(Fore.GREEN + "\nTEST SHARED SUBSTITUTION\n" + Style.RESET_ALL); test_shared_substitution()
+    print(Fore.GREEN + "\nTEST TESTING DATA\n" + Style.RESET_ALL); test_testing_data()
+    print(Fore.GREEN + "\nTEST STREAMING LINEARIZE\n" + Style.RESET_ALL); test_streaming_linearize()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""Compare the native list builtins with their letrec definitions (the insertion sort of test.lc)"""
+
+import random
+import sys
+import time
+
+from interpreter import interpret
+
+INSERTION_SORT = r"""letrec insert = \x.\xs.
+    if xs == # then
+        x : #
+    else if (x <= (hd xs)) then
+        x : xs
+    else
+        (hd xs) : (insert x (tl xs))
+in
+letrec sort = \xs.
+    if xs == # then
+        #
+    else
+        insert (hd xs) (sort (tl xs))
+in
+"""
+
+MAP = r"letrec map = \f.\xs. if xs == # then # else (f (hd xs)) : (map f (tl xs)) in "
+
+# long literals are joined with append, the parser would recurse once per element
+def list_literal(numbers, chunk=100):
+    numbers = [str(n) for n in numbers]
+    chunks = ["(" + " : ".join(numbers[i:i + chunk] + ["#"]) + ")" for i in range(0, len(numbers), chunk)]
+    literal = chunks.pop() if chunks else "#"
+    while chunks:
+        literal = "append " + chunks.pop() + " (" + literal + ")"
+    return literal
+
+def run(source, engine, need):
+    start = time.perf_counter()
+    result = interpret(source, engine=engine, call_by_need=need)
+    return result, time.perf_counter() - start
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5, 250, 1000]
+    # under call-by-name the letrec versions take exponential time (test.lc sorts 5 numbers),
+    # so the substitution engine only gets the short lists, the recursive compiled engine
+    # only lists short enough for the Python stack
+    configurations = [('substitution', False, 10), ('machine', True, None), ('compiled', True, 100)]
+    print(f"{'program':<8} {'n':>6} {'engine':<14} {'letrec (ms)':>12} {'builtin (ms)':>13} {'speedup':>8}")
+    rng = random.Random(354)
+    for n in sizes:
+        numbers = list_literal(rng.randint(0, 999) for _ in range(n))
+        programs = [
+            ('sort', INSERTION_SORT + "sort (" + numbers + ")", "sort (" + numbers + ")"),
+            ('map', MAP + r"map (\x.x*x) (" + numbers + ")", r"map (\x.x*x) (" + numbers + ")"),
+        ]
+        for name, letrec_source, builtin_source in programs:
+            for engine, need, limit in configurations:
+                if limit is not None and n > limit:
+                    continue
+                expected, letrec_time = run(letrec_source, engine, need)
+                result, builtin_time = run(builtin_source, engine, need)
+                assert result == expected, (name, n, engine)
+                print(f"{name:<8} {n:>6} {engine + ('/need' if need else ''):<14} {letrec_time * 1000:>12.2f} "
+                      f"{builtin_time * 1000:>13.2f} {letrec_time / builtin_time:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
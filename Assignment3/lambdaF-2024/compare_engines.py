@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Run every evaluation engine on a testing-data file and compare time and allocations"""
+
+import sys
+import time
+import tracemalloc
+
+from interpreter import interpret, engines, parse_cache
+
+def read_testing_data(filename):
+    # each line is: interpreter, <expression>, <expected>
+    cases = []
+    with open(filename) as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            _, rest = line.split(', ', 1)
+            expression, expected = rest.rsplit(', ', 1)
+            cases.append((expression, expected))
+    return cases
+
+def run_engine(engine, cases):
+    passed = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    for expression, expected in cases:
+        if interpret(expression, engine=engine) == expected:
+            passed += 1
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return passed, elapsed, peak
+
+def main():
+    filename = sys.argv[1] if len(sys.argv) > 1 else 'testing-data.txt'
+    cases = read_testing_data(filename)
+    print(f"{'engine':<14} {'passed':>8} {'time (ms)':>10} {'peak (KiB)':>11}")
+    for engine in engines:
+        passed, elapsed, peak = run_engine(engine, cases)
+        print(f"{engine:<14} {passed:>4}/{len(cases):<3} {elapsed * 1000:>10.2f} {peak / 1024:>11.1f}")
+    print(parse_cache.report())
+
+if __name__ == "__main__":
+    main()
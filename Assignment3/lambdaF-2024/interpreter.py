@@ -2,20 +2,64 @@ import sys
 from lark import Lark, Transformer, Tree
 import lark
 import os
+import math
+import functools
+import hashlib
+import json
+import pickle
+import time
+from array import array
+import tracemalloc
+from collections import Counter, OrderedDict
 
 #print(f"Python version: {sys.version}")
 #print(f"Lark version: {lark.__version__}")
 
 #  run/execute/interpret source code
-def interpret(source_code):
-    cst = parser.parse(source_code)
-    ast = LambdaCalculusTransformer().transform(cst)
-    result_ast = evaluate(ast)
+#  engine selects the evaluator: 'substitution' (evaluate), 'environment' (evaluate_env)
+#  'debruijn' (evaluate_db), 'machine' (evaluate_machine), 'compiled' (compile_tree)
+#  'python' (generated Python code), 'hashcons' (evaluate with interned values) or
+#  'bytecode' (run_bytecode), the default is 'substitution'
+#  call_by_need evaluates each argument at most once (needs an engine from need_engines)
+#  stats is a Stats that is filled in with the times and counters of the run
+#  memo caches the results of letrec functions (see Memo), True for all of them
+#  optimize rewrites the program before it is evaluated (see Optimizer), True for all passes
+def interpret(source_code, engine=None, call_by_need=False, stats=None, memo=None, optimize=None):
+    result_ast = evaluate_program(source_code, engine, call_by_need, memo, optimize, stats)
+    if stats is None:
+        return linearize(result_ast)
+    start = time.perf_counter()
     result = linearize(result_ast)
+    stats.phases['linearize'] = time.perf_counter() - start
     return result
 
+# the value of a program as an AST, for callers that print it with write_linearized
+def evaluate_program(source_code, engine=None, call_by_need=False, memo=None, optimize=None, stats=None):
+    if memo or call_by_need:
+        engine = engine or 'environment'
+        if engine not in need_engines:
+            raise ValueError(f"engine {engine!r} does not support {'memoization' if memo else 'call-by-need'}")
+    engine = engine or 'substitution'
+    ast = parse_cache.parse(source_code, stats)
+    if optimize:
+        start = time.perf_counter()
+        ast = make_optimizer(optimize).run(ast)
+        if stats is not None:
+            stats.phases['optimize'] = time.perf_counter() - start
+    if memo:
+        run = lambda ast, need=False: evaluate_memoized(ast, engine, need, memo)
+    else:
+        run = engines[engine]
+    if stats is not None:
+        return evaluate_with_stats(run, ast, call_by_need, engine, stats)
+    return run(ast, need=True) if call_by_need else run(ast)
+
 # convert concrete syntax to CST
-parser = Lark(open("grammar.lark").read(), parser='lalr')
+# the grammar is read from the directory of this file, the LALR tables are cached in
+# grammar.lark.cache and rebuilt by Lark whenever the grammar (or Lark) changes
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "grammar.lark")
+grammar = open(GRAMMAR_PATH).read()
+parser = Lark(grammar, parser='lalr', cache=GRAMMAR_PATH + ".cache")
 
 # convert CST to AST
 class LambdaCalculusTransformer(Transformer):
@@ -96,18 +140,254 @@ class LambdaCalculusTransformer(Transformer):
     def NAME(self, token):
         return str(token)
 
+# cache of ASTs, keyed by a hash of the source and the grammar version
+# ASTs are tuples and never modified, so one AST can be handed out any number of times
+# the most recently used 'size' ASTs are kept in memory, with 'directory' set every AST is
+# also written there as a pickle named after its key (like a .pyc file) and read back
+# by later processes; a changed grammar or Lark version changes every key
+GRAMMAR_VERSION = hashlib.sha256((grammar + lark.__version__).encode()).hexdigest()
+
+class ParseCache:
+    def __init__(self, size=256, directory=None):
+        self.size = size
+        self.directory = directory
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, source_code):
+        return hashlib.sha256((GRAMMAR_VERSION + source_code).encode()).hexdigest()
+
+    # with 'stats' the time of parsing and of transforming is recorded separately
+    def parse(self, source_code, stats=None):
+        key = self.key(source_code)
+        ast = self.entries.get(key)
+        if ast is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            if stats is not None:
+                stats.parse_cache = 'memory'
+            return ast
+        ast = self.load(key)
+        if ast is not None:
+            self.disk_hits += 1
+            if stats is not None:
+                stats.parse_cache = 'disk'
+        elif stats is None:
+            self.misses += 1
+            ast = transformer.transform(parser.parse(source_code))
+            self.store(key, ast)
+        else:
+            self.misses += 1
+            stats.parse_cache = 'miss'
+            start = time.perf_counter()
+            cst = parser.parse(source_code)
+            stats.phases['parse'] = time.perf_counter() - start
+            start = time.perf_counter()
+            ast = transformer.transform(cst)
+            stats.phases['transform'] = time.perf_counter() - start
+            self.store(key, ast)
+        if self.size > 0:
+            self.entries[key] = ast
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return ast
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".ast")
+
+    def load(self, key):
+        if self.directory is None:
+            return None
+        try:
+            with open(self.path(key), 'rb') as file:
+                return pickle.load(file)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def store(self, key, ast):
+        # written to a temporary file first, so a reader never sees half a file
+        if self.directory is None:
+            return
+        temporary = self.path(key) + f".{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(temporary, 'wb') as file:
+                pickle.dump(ast, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, self.path(key))
+        except (OSError, RecursionError, pickle.PicklingError):
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def hit_rate(self):
+        total = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / total if total else 0.0
+
+    def report(self):
+        return (f"parsed {self.misses} sources, {self.hits} memory hits, {self.disk_hits} disk hits, "
+                f"hit rate {self.hit_rate():.1%}")
+
+parse_cache = ParseCache()
+
+# the transformer keeps no state between programs, one instance serves all of them
+transformer = LambdaCalculusTransformer()
+
+# optimization
+# between transform and evaluate, an Optimizer rewrites the AST with the passes it is given:
+#   beta    (\x.e2) e1 --> let x = e1 in e2, for the let passes to work on
+#   inline  let x = v in e --> e[v/x] for a number, #, or a variable no binder of e captures
+#   dead    let x = e1 in e2 --> e2 and letrec f = e1 in e2 --> e2 if x (f) is not free in e2
+#   fold    operations on numbers (+ - * <= == and negation) and if on a number are computed
+# every engine evaluates arguments and let bindings only when they are needed, so dropping
+# an unused binding (even one that would not terminate) does not change the result
+# the tree is rewritten bottom-up in one traversal, a let is optimized again after inlining
+# so the folds it makes possible are done too
+# a function in the result is printed with its optimized body
+optimizer_passes = ('beta', 'inline', 'dead', 'fold')
+
+class Optimizer:
+    def __init__(self, passes=optimizer_passes):
+        unknown = set(passes) - set(optimizer_passes)
+        if unknown:
+            raise ValueError(f"unknown optimizer pass {sorted(unknown)[0]!r}")
+        self.passes = frozenset(passes)
+        self.counts = Counter() # rewrites per pass
+        self.nodes_before = 0
+        self.nodes_after = 0
+        self.time = 0.0
+
+    def run(self, tree):
+        start = time.perf_counter()
+        self.nodes_before += tree_size(tree)
+        tree = self.optimize(tree)
+        self.nodes_after += tree_size(tree)
+        self.time += time.perf_counter() - start
+        return tree
+
+    def optimize(self, tree):
+        tag = tree[0]
+        if tag in ('var', 'num', 'nil', 'packed'):
+            return tree
+        tree = (tag,) + tuple(self.optimize(child) if isinstance(child, tuple) else child for child in tree[1:])
+        if tag == 'app' and tree[1][0] == 'lam' and 'beta' in self.passes:
+            self.counts['beta'] += 1
+            return self.optimize_let(('let', tree[1][1], tree[2], tree[1][2]))
+        elif tag == 'let':
+            return self.optimize_let(tree)
+        elif tag == 'letrec' and 'dead' in self.passes and tree[1] not in free_vars(tree[3]):
+            self.counts['dead'] += 1
+            return tree[3]
+        elif 'fold' in self.passes:
+            return self.fold(tree)
+        return tree
+
+    # let x = value in body, with value and body optimized
+    def optimize_let(self, tree):
+        name, value, body = tree[1], tree[2], tree[3]
+        if 'dead' in self.passes and name not in free_vars(body):
+            self.counts['dead'] += 1
+            return body
+        if 'inline' in self.passes:
+            if value[0] in ('num', 'nil') or (value[0] == 'var' and value[1] not in bound_names(body)):
+                self.counts['inline'] += 1
+                return self.optimize(substitute(body, name, value))
+        return tree
+
+    def fold(self, tree):
+        tag = tree[0]
+        if tag in arithmetic and tree[1][0] == 'num' and tree[2][0] == 'num':
+            result = ('num', arithmetic[tag](tree[1][1], tree[2][1]))
+        elif tag == 'eq' and tree[1][0] == 'num' and tree[2][0] == 'num':
+            result = ('num', 1.0 if tree[1][1] == tree[2][1] else 0.0)
+        elif tag == 'neg' and tree[1][0] == 'num':
+            result = ('num', -tree[1][1])
+        elif tag == 'if' and tree[1][0] == 'num':
+            result = tree[2] if tree[1][1] != 0 else tree[3]
+        else:
+            return tree
+        self.counts['fold'] += 1
+        return result
+
+    def to_dict(self):
+        return {
+            'passes': [name for name in optimizer_passes if name in self.passes],
+            'rewrites': {name: self.counts[name] for name in optimizer_passes if name in self.passes},
+            'nodes_before': self.nodes_before,
+            'nodes_after': self.nodes_after,
+            'time_ms': round(self.time * 1000, 3),
+        }
+
+    def report(self):
+        rewrites = ", ".join(f"{name} {count}" for name, count in self.to_dict()['rewrites'].items())
+        return (f"optimized {self.nodes_before} nodes to {self.nodes_after} in {self.time * 1000:.2f} ms: "
+                f"{rewrites or 'no passes'}")
+
+# optimize: an Optimizer, True for all passes or a collection of pass names
+def make_optimizer(optimize):
+    if isinstance(optimize, Optimizer):
+        return optimize
+    return Optimizer() if optimize is True else Optimizer(optimize)
+
+def tree_size(tree):
+    size = 0
+    todo = [tree]
+    while todo:
+        tree = todo.pop()
+        size += 1
+        todo += [child for child in tree[1:] if isinstance(child, tuple)]
+    return size
+
+# the names bound by a lambda, let or letrec anywhere in tree
+def bound_names(tree):
+    names = set()
+    todo = [tree]
+    while todo:
+        tree = todo.pop()
+        if tree[0] in ('lam', 'let', 'letrec'):
+            names.add(tree[1])
+        todo += [child for child in tree[1:] if isinstance(child, tuple)]
+    return names
+
+
+# recursive bindings
+# letrec f = e1 in e2 substitutes for f the node ('rec', f, e1, cell), a back-pointer to the
+# binding: evaluating it substitutes the node itself for f in e1 once and keeps the value
+# in the cell, so a recursive call finds the function instead of copying its body again
+# a cell compares and hashes by identity, so comparing two nodes never follows the cycle
+# linearize prints the node as fix (\f.e1)
+class Cell:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = None
+
 # reduce AST to normal form
 def evaluate(tree):
+    stats = active_stats
+    if stats is not None:
+        stats.enter(tree[0])
     if tree[0] == 'app':
         e1 = evaluate(tree[1])
         if e1[0] == 'lam':
             body = e1[2]
             name = e1[1]
             arg = tree[2]
+            if stats is not None:
+                stats.counts['beta'] += 1
+                stats.counts['substitute'] += 1
             rhs = substitute(body, name, arg)
             result = evaluate(rhs)
         else:
-            result = ('app', e1, tree[2])
+            result = tree_builtin(e1, tree[2], evaluate)
+            if result is None:
+                result = ('app', e1, tree[2])
     elif tree[0] == 'plus':
         left = evaluate(tree[1])
         right = evaluate(tree[2])
@@ -162,16 +442,29 @@ def evaluate(tree):
         body = tree[3]
         result = evaluate(('app', ('lam', name, body), value))
     elif tree[0] == 'letrec':
-        # letrec f = e1 in e2 --> let f = (fix (\f. e1)) in e2
+        # letrec f = e1 in e2 --> e2 [rec/f] where rec stands for fix (\f. e1)
         name = tree[1]
         value = tree[2]
         body = tree[3]
-        fixed = ('fix', ('lam', name, value))
-        result = evaluate(('let', name, fixed, body))
+        if stats is not None:
+            stats.counts['substitute'] += 1
+        result = evaluate(substitute(body, name, ('rec', name, value, Cell())))
+    elif tree[0] == 'rec':
+        # rec --> e1 [rec/f], evaluated once
+        cell = tree[3]
+        if cell.value is None:
+            if stats is not None:
+                stats.counts['unfold'] += 1
+                stats.counts['substitute'] += 1
+            cell.value = evaluate(substitute(tree[2], tree[1], tree))
+        result = cell.value
     elif tree[0] == 'fix':
-        # fix F --> F (fix F)
+        # fix (\f. e) --> rec, fix F --> F (fix F) if F is not a lambda
         f = evaluate(tree[1])
-        result = evaluate(('app', f, ('fix', f)))
+        if f[0] == 'lam':
+            result = evaluate(('rec', f[1], f[2], Cell()))
+        else:
+            result = evaluate(('app', f, ('fix', f)))
     elif tree[0] == 'seq':
         # Evaluate both sides and keep as sequence
         left = evaluate(tree[1])
@@ -181,40 +474,228 @@ def evaluate(tree):
         # Evaluate both head and tail
         head = evaluate(tree[1])
         tail = evaluate(tree[2])
-        result = ('cons', head, tail)
+        result = cons_value(head, tail)
     elif tree[0] == 'nil':
         result = tree
     elif tree[0] == 'hd':
         # hd (a:b) --> a
         expr = evaluate(tree[1])
-        if expr[0] == 'cons':
-            result = expr[1]
-        else:
+        result = list_head(expr)
+        if result is None:
             result = ('hd', expr)
     elif tree[0] == 'tl':
         # tl (a:b) --> b
         expr = evaluate(tree[1])
-        if expr[0] == 'cons':
-            result = expr[2]
-        else:
+        result = list_tail(expr)
+        if result is None:
             result = ('tl', expr)
     else:
         result = tree
+    if stats is not None:
+        stats.depth -= 1
     return result
 
+# packed lists
+# a fully evaluated list of numbers is the node ('packed', values, length) where values is an
+# array('d'): the list is values[length-1], values[length-2], ..., values[0], so the head is
+# the last number and the whole list is one array instead of a cons and a num node per element
+# tl is the same array with length - 1, nothing is copied
+# consing a number onto a list that ends the array appends to the array in place: a node only
+# looks at values[:length], so the nodes made before do not change, consing onto a shorter
+# view (a tl of a list that was consed onto already) copies its part of the array first
+# every engine but hashcons makes its lists with cons_value, so a list of numbers is packed,
+# the empty list stays ('nil',) and a list holding anything else stays a chain of cons nodes
+
+def cons_value(head, tail):
+    if head[0] == 'num':
+        if tail[0] == 'nil':
+            return ('packed', array('d', (head[1],)), 1)
+        elif tail[0] == 'packed':
+            values, length = tail[1], tail[2]
+            if length != len(values):
+                values = values[:length]
+            values.append(head[1])
+            return ('packed', values, length + 1)
+    return ('cons', head, tail)
+
+# head and tail of a cons or packed node, None for anything else
+def list_head(node):
+    if node[0] == 'cons':
+        return node[1]
+    elif node[0] == 'packed':
+        return ('num', node[1][node[2] - 1])
+    return None
+
+def list_tail(node):
+    if node[0] == 'cons':
+        return node[2]
+    elif node[0] == 'packed':
+        return ('packed', node[1], node[2] - 1) if node[2] > 1 else ('nil',)
+    return None
+
+def packed_equal(left, right):
+    # compares the numbers in C, nan is not equal to itself as for num nodes
+    return left[2] == right[2] and left[1][:left[2]] == right[1][:right[2]]
+
+list_tags = ('cons', 'packed')
+
 # Helper function to compare ASTs for equality (used by ==)
+# lists are compared in a loop along their tails, so long lists do not overflow the stack
 def ast_equal(left, right):
+    while left[0] in list_tags and right[0] in list_tags:
+        if left[0] == 'packed' and right[0] == 'packed':
+            return packed_equal(left, right)
+        if not ast_equal(list_head(left), list_head(right)):
+            return False
+        left, right = list_tail(left), list_tail(right)
     if left[0] != right[0]:
         return False
     if left[0] == 'num':
         return left[1] == right[1]
     elif left[0] == 'nil':
         return True
-    elif left[0] == 'cons':
-        return ast_equal(left[1], right[1]) and ast_equal(left[2], right[2])
     else:
         return left == right
 
+# native list builtins
+# length, append, map, foldl, filter and sort are predefined names, not keywords: a free
+# variable with one of these names applied to all its arguments is run here, in Python, over
+# the list value, and a program that binds the name itself (test.lc binds sort with letrec)
+# keeps using its own definition
+# they compute what the usual letrec definitions compute, e.g.
+#   letrec map = \f.\xs. if xs == # then # else (f (hd xs)) : (map f (tl xs))
+#   letrec foldl = \f.\z.\xs. if xs == # then z else foldl f (f z (hd xs)) (tl xs)
+#   letrec filter = \p.\xs. if xs == # then # else if p (hd xs) then (hd xs) : (filter p (tl xs)) else filter p (tl xs)
+# and sort puts numbers in ascending order like the insertion sort of test.lc, in O(n log n)
+# an engine passes 'force' (evaluate an argument) and 'call' (apply a function value to a value),
+# 'delay' if an argument passed to 'call' unevaluated is not the argument itself, 'defer' if
+# the application f acc x left unevaluated is not the AST of it, and 'cons' if its lists are
+# not made with cons_value
+# as in the letrec definition, every accumulator of foldl, the seed and the results of f, is
+# passed on unevaluated and only the last one is forced, so an f that ignores its accumulator
+# never evaluates it; if f always evaluates its accumulator (see strict_accumulator), forcing
+# the last one forces them all, so they are evaluated as they are made, without nesting the
+# applications
+# if the list argument is not a list ending in #, or sort gets something else than numbers,
+# run_builtin returns None and the engine keeps the application as it is, like any free variable
+
+builtin_arity = {'length': 1, 'append': 2, 'map': 2, 'foldl': 3, 'filter': 2, 'sort': 1}
+
+# the name and the arguments if 'function' applied to 'arg' is a full application of a builtin
+def builtin_call(function, arg):
+    args = [arg]
+    while function[0] == 'app':
+        args.append(function[2])
+        function = function[1]
+    if function[0] == 'var' and builtin_arity.get(function[1]) == len(args):
+        args.reverse()
+        return function[1], args
+    return None
+
+# the elements of a list value, None if it does not end in #
+def list_elements(value):
+    elements = []
+    while value[0] == 'cons':
+        elements.append(value[1])
+        value = value[2]
+    if value[0] == 'packed':
+        values = value[1]
+        elements += [('num', values[i]) for i in range(value[2] - 1, -1, -1)]
+    elif value[0] != 'nil':
+        return None
+    return elements
+
+def make_list(elements, tail, cons):
+    for element in reversed(elements):
+        tail = cons(element, tail)
+    return tail
+
+# whether evaluating 'tree' always evaluates the variable 'name': a conservative syntactic test
+# (a branch of if is not evaluated if the condition is stuck, an argument may never be)
+def strict_in(tree, name):
+    while True:
+        tag = tree[0]
+        if tag == 'var':
+            return tree[1] == name
+        elif tag in ('plus', 'minus', 'times', 'leq', 'eq', 'seq', 'cons'):
+            if strict_in(tree[1], name):
+                return True
+            tree = tree[2]
+        elif tag in ('app', 'neg', 'hd', 'tl', 'fix', 'if'):
+            tree = tree[1]
+        elif tag in ('let', 'letrec') and tree[1] != name:
+            tree = tree[3]
+        else:
+            return False
+
+# whether f = \acc.\x. body, a closure or a lambda, always evaluates acc
+def strict_accumulator(f):
+    if f[0] not in ('closure', 'lam') or f[2][0] != 'lam' or f[2][1] == f[1]:
+        return False
+    return strict_in(f[2][2], f[1])
+
+def run_builtin(name, args, force, call, cons=cons_value, delay=lambda x: x,
+                defer=lambda f, acc, x: ('app', ('app', f, acc), x)):
+    # the list is evaluated first, the other arguments only when they are needed
+    xs = force(args[0] if name == 'append' else args[-1])
+    if xs[0] == 'packed' and name == 'length':
+        return ('num', float(xs[2]))
+    elements = list_elements(xs)
+    if elements is None:
+        return None
+    if name == 'length':
+        return ('num', float(len(elements)))
+    elif name == 'append':
+        ys = force(args[1])
+        if xs[0] == 'packed' and ys[0] == 'packed':
+            # both lists back to front: the numbers of ys, then those of xs
+            return ('packed', ys[1][:ys[2]] + xs[1][:xs[2]], xs[2] + ys[2])
+        return make_list(elements, ys, cons)
+    elif name == 'map':
+        if not elements:
+            return xs
+        f = force(args[0])
+        return make_list([call(f, x) for x in elements], ('nil',), cons)
+    elif name == 'filter':
+        if not elements:
+            return xs
+        p = force(args[0])
+        kept = []
+        for x in elements:
+            test = call(p, x)
+            if test[0] != 'num':
+                return None
+            if test[1] != 0:
+                kept.append(x)
+        return make_list(kept, ('nil',), cons)
+    elif name == 'foldl':
+        if not elements:
+            return force(args[1])
+        acc = delay(args[1])
+        f = force(args[0])
+        if strict_accumulator(f):
+            for x in elements:
+                acc = call(call(f, acc), x)
+            return acc
+        for x in elements:
+            acc = defer(f, acc, x)
+        return force(acc)
+    else: # sort
+        if any(x[0] != 'num' for x in elements):
+            return None
+        if not elements:
+            return xs
+        if cons is cons_value:
+            return ('packed', array('d', sorted((x[1] for x in elements), reverse=True)), len(elements))
+        return make_list(sorted(elements, key=lambda x: x[1]), ('nil',), cons)
+
+# for the engines whose values are ASTs (evaluate, evaluate_hc, evaluate_db)
+def tree_builtin(function, arg, evaluate, cons=cons_value):
+    call = builtin_call(function, arg)
+    if call is None:
+        return None
+    return run_builtin(call[0], call[1], evaluate, lambda f, x: evaluate(('app', f, x)), cons)
+
 # generate a fresh name 
 # needed eg for \y.x [y/x] --> \z.y where z is a fresh name)
 class NameGenerator:
@@ -228,127 +709,2436 @@ class NameGenerator:
 
 name_generator = NameGenerator()
 
+# free variables of a tree, computed once per node and cached
+# tuples cannot carry an attribute, so the cache is keyed by id and keeps the node
+# alive with its set (an id cannot be reused while the node is in the table)
+# the cache is cleared when it reaches 'free_var_limit' nodes
+free_var_cache = {}
+free_var_limit = 1 << 18
+no_names = frozenset()
+
+def free_vars(tree):
+    entry = free_var_cache.get(id(tree))
+    if entry is not None:
+        return entry[1]
+    if tree[0] == 'var':
+        found = frozenset((tree[1],))
+    elif tree[0] in ('num', 'nil', 'packed'):
+        return no_names
+    elif tree[0] == 'lam':
+        found = free_vars(tree[2]) - {tree[1]}
+    elif tree[0] == 'let':
+        found = free_vars(tree[2]) | (free_vars(tree[3]) - {tree[1]})
+    elif tree[0] == 'letrec':
+        found = (free_vars(tree[2]) | free_vars(tree[3])) - {tree[1]}
+    elif tree[0] == 'rec':
+        found = free_vars(tree[2]) - {tree[1]}
+    elif len(tree) == 2:
+        found = free_vars(tree[1])
+    else:
+        found = no_names.union(*map(free_vars, tree[1:]))
+    if len(free_var_cache) >= free_var_limit:
+        free_var_cache.clear()
+    free_var_cache[id(tree)] = (tree, found)
+    return found
+
 # for beta reduction (capture-avoiding substitution)
 # 'replacement' for 'name' in 'tree'
+# a subtree in which 'name' is not free is returned as it is, so unchanged parts are shared
+# a binder is only renamed if it would capture a free variable of 'replacement'
 def substitute(tree, name, replacement):
     # tree [replacement/name] = tree with all instances of 'name' replaced by 'replacement'
+    if name not in free_vars(tree):
+        return tree # e [r/n] --> e if n is not free in e (covers \n.e, num, nil, ...)
     if tree[0] == 'var':
-        if tree[1] == name:
-            return replacement # n [r/n] --> r
-        else:
-            return tree # x [r/n] --> x
-    elif tree[0] == 'lam':
-        if tree[1] == name:
-            return tree # \n.e [r/n] --> \n.e
+        return replacement # n [r/n] --> r
+    if active_stats is not None:
+        active_stats.counts['built'] += 1 # every case below makes one new node
+    if tree[0] == 'lam':
+        if tree[1] not in free_vars(replacement):
+            return ('lam', tree[1], substitute(tree[2], name, replacement)) # no capture possible
         else:
             fresh_name = name_generator.generate()
             return ('lam', fresh_name, substitute(substitute(tree[2], tree[1], ('var', fresh_name)), name, replacement))
             # \x.e [r/n] --> (\fresh.(e[fresh/x])) [r/n]
-    elif tree[0] == 'app':
-        return ('app', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'num':
-        return tree
-    elif tree[0] == 'plus':
-        return ('plus', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'minus':
-        return ('minus', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'times':
-        return ('times', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'neg':
-        return ('neg', substitute(tree[1], name, replacement))
-    elif tree[0] == 'leq':
-        return ('leq', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'eq':
-        return ('eq', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'if':
-        return ('if', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement), substitute(tree[3], name, replacement))
     elif tree[0] == 'let':
         # let x = e1 in e2
-        if tree[1] == name:
-            # x is shadowed in e2, only substitute in e1
+        if tree[1] == name or name not in free_vars(tree[3]):
+            # x is shadowed in e2 or n does not occur there, only substitute in e1
             return ('let', tree[1], substitute(tree[2], name, replacement), tree[3])
+        elif tree[1] not in free_vars(replacement):
+            return ('let', tree[1], substitute(tree[2], name, replacement), substitute(tree[3], name, replacement))
         else:
             fresh_name = name_generator.generate()
             new_body = substitute(substitute(tree[3], tree[1], ('var', fresh_name)), name, replacement)
             return ('let', fresh_name, substitute(tree[2], name, replacement), new_body)
     elif tree[0] == 'letrec':
-        # letrec f = e1 in e2 (f is bound in both e1 and e2)
-        if tree[1] == name:
-            return tree  # name is shadowed
+        # letrec f = e1 in e2 (f is bound in both e1 and e2, and is not 'name' since 'name' is free)
+        if tree[1] not in free_vars(replacement):
+            return ('letrec', tree[1], substitute(tree[2], name, replacement), substitute(tree[3], name, replacement))
         else:
             fresh_name = name_generator.generate()
             new_value = substitute(substitute(tree[2], tree[1], ('var', fresh_name)), name, replacement)
             new_body = substitute(substitute(tree[3], tree[1], ('var', fresh_name)), name, replacement)
             return ('letrec', fresh_name, new_value, new_body)
+    elif tree[0] in ('app', 'plus', 'minus', 'times', 'leq', 'eq', 'seq', 'cons'):
+        return (tree[0], substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
+    elif tree[0] in ('neg', 'fix', 'hd', 'tl'):
+        return (tree[0], substitute(tree[1], name, replacement))
+    elif tree[0] == 'if':
+        return ('if', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement), substitute(tree[3], name, replacement))
+    elif tree[0] == 'rec':
+        # a free name of e1 is replaced, the new binding needs its own cell
+        return ('rec', tree[1], substitute(tree[2], name, replacement), Cell())
+    else:
+        raise Exception('Unknown tree', tree)
+
+# hash-consing of values: structurally equal numbers and lists are one shared object
+# make() looks a node up by its tag, its number and the identities of its (already interned)
+# children, so the key is flat and hashing it never walks a list
+# evaluate_hc interns every value it builds, so similar lists share their common parts and
+# == on two values is mostly an identity check
+# terms made by substitute are not interned: substitute already shares the unchanged parts and
+# the new spine is nearly always unique, so the table would only keep garbage alive
+# the table is bounded, when it reaches 'limit' nodes a new generation starts
+
+class HashConsing:
+    def __init__(self, limit=1 << 20):
+        self.limit = limit
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+        self.generations = 1
+
+    def make(self, *node):
+        key = node if node[0] != 'cons' else ('cons', id(node[1]), id(node[2]))
+        shared = self.table.get(key)
+        if shared is not None:
+            self.hits += 1
+            return shared
+        self.misses += 1
+        if len(self.table) >= self.limit:
+            self.table.clear()
+            self.generations += 1
+        self.table[key] = node
+        return node
+
+    def clear(self):
+        self.table.clear()
+        self.hits = 0
+        self.misses = 0
+        self.generations = 1
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def report(self):
+        return (f"interned {len(self.table)} values, {self.hits} hits, {self.misses} misses, "
+                f"hit rate {self.hit_rate():.1%}, {self.generations} generation(s)")
+
+hashcons = HashConsing()
+
+# evaluate with interned values
+def evaluate_hc(tree):
+    make = hashcons.make
+    stats = active_stats
+    if stats is not None:
+        stats.enter(tree[0])
+    if tree[0] == 'app':
+        e1 = evaluate_hc(tree[1])
+        if e1[0] == 'lam':
+            if stats is not None:
+                stats.counts['beta'] += 1
+                stats.counts['substitute'] += 1
+            result = evaluate_hc(substitute(e1[2], e1[1], tree[2]))
+        else:
+            result = tree_builtin(e1, tree[2], evaluate_hc, lambda head, tail: make('cons', head, tail))
+            if result is None:
+                result = ('app', e1, tree[2])
+    elif tree[0] in ('plus', 'minus', 'times', 'leq'):
+        left = evaluate_hc(tree[1])
+        right = evaluate_hc(tree[2])
+        if left[0] == 'num' and right[0] == 'num':
+            result = make('num', arithmetic[tree[0]](left[1], right[1]))
+        else:
+            result = (tree[0], left, right)
+    elif tree[0] == 'neg':
+        operand = evaluate_hc(tree[1])
+        result = make('num', -operand[1]) if operand[0] == 'num' else ('neg', operand)
+    elif tree[0] == 'eq':
+        left = evaluate_hc(tree[1])
+        right = evaluate_hc(tree[2])
+        # identical values are equal (except nan), others may still be equal across generations
+        if left is right and left[0] != 'num':
+            equal = True
+        else:
+            equal = ast_equal(left, right)
+        result = make('num', 1.0 if equal else 0.0)
+    elif tree[0] == 'if':
+        cond = evaluate_hc(tree[1])
+        if cond[0] == 'num':
+            result = evaluate_hc(tree[2] if cond[1] != 0 else tree[3])
+        else:
+            result = ('if', cond, tree[2], tree[3])
+    elif tree[0] == 'let':
+        result = evaluate_hc(('app', ('lam', tree[1], tree[3]), tree[2]))
+    elif tree[0] == 'letrec':
+        if stats is not None:
+            stats.counts['substitute'] += 1
+        result = evaluate_hc(substitute(tree[3], tree[1], ('rec', tree[1], tree[2], Cell())))
+    elif tree[0] == 'rec':
+        cell = tree[3]
+        if cell.value is None:
+            if stats is not None:
+                stats.counts['unfold'] += 1
+                stats.counts['substitute'] += 1
+            cell.value = evaluate_hc(substitute(tree[2], tree[1], tree))
+        result = cell.value
     elif tree[0] == 'fix':
-        return ('fix', substitute(tree[1], name, replacement))
+        f = evaluate_hc(tree[1])
+        if f[0] == 'lam':
+            result = evaluate_hc(('rec', f[1], f[2], Cell()))
+        else:
+            result = evaluate_hc(('app', f, ('fix', f)))
     elif tree[0] == 'seq':
-        return ('seq', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
+        result = ('seq', evaluate_hc(tree[1]), evaluate_hc(tree[2]))
     elif tree[0] == 'cons':
-        return ('cons', substitute(tree[1], name, replacement), substitute(tree[2], name, replacement))
-    elif tree[0] == 'nil':
+        # lists stay interned cons chains here instead of packed arrays (see cons_value):
+        # equal lists and common tails are shared already and == on them is an identity check
+        result = make('cons', evaluate_hc(tree[1]), evaluate_hc(tree[2]))
+    elif tree[0] == 'hd':
+        expr = evaluate_hc(tree[1])
+        result = expr[1] if expr[0] == 'cons' else ('hd', expr)
+    elif tree[0] == 'tl':
+        expr = evaluate_hc(tree[1])
+        result = expr[2] if expr[0] == 'cons' else ('tl', expr)
+    elif tree[0] in ('num', 'nil'):
+        result = make(*tree)
+    else:
+        result = tree
+    if stats is not None:
+        stats.depth -= 1
+    return result
+
+def evaluate_hashconsed(tree):
+    hashcons.clear()
+    return evaluate_hc(tree)
+
+# environment-based evaluation (closures instead of substitution)
+# a lambda evaluates to ('closure', name, body, env) and variables are looked up in env,
+# so bodies are never copied or renamed during evaluation
+# an environment is a linked list of frames (name, value, parent), () is the empty environment
+# arguments are passed unevaluated as thunks, which keeps the non-strict semantics of evaluate
+
+# with need=True (call-by-need) a thunk is shared: it is evaluated at most once and
+# every later use of the parameter gets the remembered value
+
+# a thunk made by compiled code (see compile_tree) runs 'code' instead of evaluate_env
+
+class Thunk:
+    __slots__ = ('tree', 'env', 'shared', 'value', 'code')
+
+    def __init__(self, tree, env, shared=False, code=None):
+        self.tree = tree
+        self.env = env
+        self.shared = shared
+        self.value = None
+        self.code = code
+
+    def force(self):
+        if self.value is not None:
+            return self.value
+        if self.code is not None:
+            value = self.code(self.env)
+        else:
+            value = evaluate_env(self.tree, self.env, self.shared)
+        if self.shared:
+            self.update(value)
+        return value
+
+    def update(self, value):
+        # the environment is no longer needed, dropping it lets long loops run in constant memory
+        self.value = value
+        self.tree = self.env = self.code = None
+
+def lookup(env, name):
+    while env:
+        if env[0] == name:
+            return env[1]
+        env = env[2]
+    return None
+
+# the frame of a recursive binding refers to itself: 'name' is bound to a thunk of 'tree'
+# in the frame, so a recursive call is a lookup and the closure for 'tree' is made once
+# (call-by-need) or once per use (call-by-name), never by unfolding fix
+# it is a list [name, value, parent, tree] so the cycle can be closed after it is made,
+# readback_term recognises it by its length and reads the binding back as fix (\name.tree)
+def recursive_frame(name, tree, env, need, code=None):
+    if active_stats is not None:
+        active_stats.counts['unfold'] += 1
+    frame = [name, None, env, tree]
+    frame[1] = Thunk(tree, frame, need, code)
+    return frame
+
+def evaluate_env(tree, env=(), need=False):
+    stats = active_stats
+    if stats is not None:
+        stats.enter(tree[0])
+    if tree[0] == 'var':
+        value = lookup(env, tree[1])
+        if value is None:
+            result = tree # free variable
+        elif isinstance(value, Thunk):
+            result = value.force()
+        else:
+            result = value
+    elif tree[0] == 'lam':
+        result = ('closure', tree[1], tree[2], env)
+    elif tree[0] == 'app':
+        e1 = evaluate_env(tree[1], env, need)
+        if e1[0] == 'closure':
+            if stats is not None:
+                stats.counts['beta'] += 1
+            name, body, closure_env = e1[1], e1[2], e1[3]
+            frame = (name, Thunk(tree[2], env, need), closure_env)
+            if active_memo is not None and id(body) in active_memo.functions:
+                result = active_memo.call(body, frame, lambda frame: evaluate_env(body, frame, need))
+            else:
+                result = evaluate_env(body, frame, need)
+        else:
+            result = env_builtin(e1, Thunk(tree[2], env, need), need)
+            if result is None:
+                result = ('app', readback(e1), readback_term(tree[2], env))
+    elif tree[0] in ('plus', 'minus', 'times', 'leq'):
+        left = evaluate_env(tree[1], env, need)
+        right = evaluate_env(tree[2], env, need)
+        if left[0] == 'num' and right[0] == 'num':
+            result = ('num', arithmetic[tree[0]](left[1], right[1]))
+        else:
+            result = (tree[0], readback(left), readback(right))
+    elif tree[0] == 'neg':
+        operand = evaluate_env(tree[1], env, need)
+        if operand[0] == 'num':
+            result = ('num', -operand[1])
+        else:
+            result = ('neg', readback(operand))
+    elif tree[0] == 'eq':
+        left = evaluate_env(tree[1], env, need)
+        right = evaluate_env(tree[2], env, need)
+        result = ('num', 1.0 if values_equal(left, right) else 0.0)
+    elif tree[0] == 'if':
+        cond = evaluate_env(tree[1], env, need)
+        if cond[0] == 'num':
+            if cond[1] != 0:
+                result = evaluate_env(tree[2], env, need)
+            else:
+                result = evaluate_env(tree[3], env, need)
+        else:
+            result = ('if', readback(cond), readback_term(tree[2], env), readback_term(tree[3], env))
+    elif tree[0] == 'let':
+        # let x = e1 in e2 --> e2 in env extended with x = e1
+        result = evaluate_env(tree[3], (tree[1], Thunk(tree[2], env, need), env), need)
+    elif tree[0] == 'letrec':
+        # letrec f = e1 in e2 --> e2 in env extended with f = e1, where e1 sees its own binding
+        result = evaluate_env(tree[3], recursive_frame(tree[1], tree[2], env, need), need)
+    elif tree[0] == 'fix':
+        # fix (\f. e) --> e in the closure environment extended with f = e itself
+        f = evaluate_env(tree[1], env, need)
+        if f[0] == 'closure':
+            result = recursive_frame(f[1], f[2], f[3], need)[1].force()
+        else:
+            f = readback(f)
+            result = ('app', f, ('fix', f))
+    elif tree[0] == 'seq':
+        result = ('seq', evaluate_env(tree[1], env, need), evaluate_env(tree[2], env, need))
+    elif tree[0] == 'cons':
+        result = cons_value(evaluate_env(tree[1], env, need), evaluate_env(tree[2], env, need))
+    elif tree[0] == 'hd':
+        expr = evaluate_env(tree[1], env, need)
+        result = list_head(expr)
+        if result is None:
+            result = ('hd', readback(expr))
+    elif tree[0] == 'tl':
+        expr = evaluate_env(tree[1], env, need)
+        result = list_tail(expr)
+        if result is None:
+            result = ('tl', readback(expr))
+    else:
+        result = tree # num, nil, packed
+    if stats is not None:
+        stats.depth -= 1
+    return result
+
+arithmetic = {
+    'plus': lambda a, b: a + b,
+    'minus': lambda a, b: a - b,
+    'times': lambda a, b: a * b,
+    'leq': lambda a, b: 1.0 if a <= b else 0.0,
+}
+
+# convert a value of evaluate_env back into an AST (for linearize and for stuck terms)
+def readback(value):
+    if isinstance(value, Thunk):
+        if value.value is not None:
+            return readback(value.value)
+        return readback_term(value.tree, value.env)
+    elif value[0] == 'closure':
+        return readback_term(('lam', value[1], value[2]), value[3])
+    elif value[0] in ('cons', 'seq'):
+        # walk the spine iteratively, long lists would overflow the Python stack
+        spine = []
+        while value[0] in ('cons', 'seq'):
+            spine.append((value[0], readback(value[1])))
+            value = value[2]
+        result = readback(value)
+        for tag, head in reversed(spine):
+            result = (tag, head, result)
+        return result
+    else:
+        return value
+
+# substitute all bindings of env into tree (capture-avoiding, binders get fresh names)
+def readback_term(tree, env):
+    if not env:
         return tree
+    if tree[0] == 'var':
+        frame = env
+        while frame and frame[0] != tree[1]:
+            frame = frame[2]
+        if not frame:
+            return tree
+        elif len(frame) == 4:
+            # recursive binding, reading back its value would not terminate
+            fresh_name = name_generator.generate()
+            rec_env = (frame[0], ('var', fresh_name), frame[2])
+            return ('fix', ('lam', fresh_name, readback_term(frame[3], rec_env)))
+        return readback(frame[1])
+    elif tree[0] == 'lam':
+        fresh_name = name_generator.generate()
+        return ('lam', fresh_name, readback_term(tree[2], (tree[1], ('var', fresh_name), env)))
+    elif tree[0] == 'let':
+        fresh_name = name_generator.generate()
+        body_env = (tree[1], ('var', fresh_name), env)
+        return ('let', fresh_name, readback_term(tree[2], env), readback_term(tree[3], body_env))
+    elif tree[0] == 'letrec':
+        fresh_name = name_generator.generate()
+        rec_env = (tree[1], ('var', fresh_name), env)
+        return ('letrec', fresh_name, readback_term(tree[2], rec_env), readback_term(tree[3], rec_env))
+    elif tree[0] in ('num', 'nil', 'packed'):
+        return tree
+    else:
+        return (tree[0],) + tuple(readback_term(child, env) for child in tree[1:])
+
+# builtins (see run_builtin) for the values of evaluate_env, evaluate_machine and compile_tree
+# the arguments before the last are ASTs read back into the stuck application, the last is a thunk
+# 'evaluate' evaluates a tree in an environment: the machine passes run_machine, so the thunks
+# a builtin forces and the closures it applies run on a machine and not on the Python stack
+def env_builtin(function, arg, need, evaluate=evaluate_env):
+    call = builtin_call(function, arg)
+    if call is None:
+        return None
+    def force(x):
+        if not isinstance(x, Thunk):
+            return evaluate(x, (), need)
+        if x.value is not None or x.code is not None or evaluate is evaluate_env:
+            return x.force()
+        value = evaluate(x.tree, x.env, x.shared)
+        if x.shared:
+            x.update(value)
+        return value
+    def delay(x):
+        return x if isinstance(x, Thunk) else Thunk(x, (), need)
+    def defer(f, acc, x):
+        # read back (and run by the machine) as the application in an environment of its parts
+        step = lambda env: apply_value(apply_value(f, acc, need, evaluate), x, need, evaluate)
+        return Thunk(foldl_step, ('x', x, ('acc', acc, ('f', f, ()))), need, step)
+    return run_builtin(call[0], call[1], force, lambda f, x: apply_value(f, x, need, evaluate), delay=delay, defer=defer)
+
+foldl_step = ('app', ('app', ('var', 'f'), ('var', 'acc')), ('var', 'x'))
+
+def apply_value(f, x, need, evaluate=evaluate_env):
+    if f[0] == 'closure':
+        frame = (f[1], x, f[3])
+        run = f[4] if len(f) == 5 else lambda frame: evaluate(f[2], frame, need)
+        if active_memo is not None and id(f[2]) in active_memo.functions:
+            return active_memo.call(f[2], frame, run)
+        return run(frame)
+    value = Thunk(None, None)
+    value.value = x
+    result = env_builtin(f, value, need, evaluate)
+    return result if result is not None else ('app', readback(f), readback(x))
+
+def evaluate_environment(tree, need=False):
+    return readback(evaluate_env(tree, (), need))
+
+# iterative evaluation with an explicit continuation stack (CEK machine)
+# same closures, environments and thunks as evaluate_env, but every pending computation
+# is a frame on 'stack' instead of a Python call
+# tail positions (the body of an applied closure, the chosen if branch, the body of let and
+# forcing a call-by-name thunk) push no frame, so letrec loops run in constant stack space
+# with need=True a forced thunk pushes an 'update' frame that stores its value
+# a builtin runs what it forces and applies on a machine of its own (see env_builtin), so
+# only nested builtin calls nest Python calls
+
+def evaluate_machine(tree, need=False, env=()):
+    stack = []
+    stats = active_stats
+    profile = active_profile
+    memo = active_memo
+    watched = stats is not None or profile is not None
+    while True:
+        # control: evaluate tree in env, either descend (push a frame) or produce a value
+        if tree is not None:
+            tag = tree[0]
+            if watched:
+                if stats is not None:
+                    stats.nodes[tag] += 1
+                    stats.max_depth = max(stats.max_depth, len(stack))
+                if profile is not None:
+                    profile.steps += 1
+            if tag == 'var':
+                value = lookup(env, tree[1])
+                if value is None:
+                    value = tree # free variable
+                elif isinstance(value, Thunk):
+                    if value.value is None:
+                        if value.shared:
+                            stack.append(('update', value))
+                        tree, env = value.tree, value.env
+                        continue
+                    value = value.value
+            elif tag == 'lam':
+                value = ('closure', tree[1], tree[2], env)
+            elif tag == 'app':
+                stack.append(('arg', tree[2], env))
+                tree = tree[1]
+                continue
+            elif tag in ('plus', 'minus', 'times', 'leq', 'eq', 'seq', 'cons'):
+                stack.append(('right', tag, tree[2], env))
+                tree = tree[1]
+                continue
+            elif tag in ('neg', 'hd', 'tl', 'fix'):
+                stack.append((tag,))
+                tree = tree[1]
+                continue
+            elif tag == 'if':
+                stack.append(('if', tree[2], tree[3], env))
+                tree = tree[1]
+                continue
+            elif tag == 'let':
+                env = (tree[1], Thunk(tree[2], env, need), env)
+                tree = tree[3]
+                continue
+            elif tag == 'letrec':
+                env = recursive_frame(tree[1], tree[2], env, need)
+                tree = tree[3]
+                continue
+            else:
+                value = tree # num, nil, packed
+            tree = None
+
+        # continuation: return value to the innermost frame
+        if not stack:
+            return value
+        frame = stack.pop()
+        kind = frame[0]
+        if kind == 'arg':
+            if value[0] == 'closure':
+                if stats is not None:
+                    stats.counts['beta'] += 1
+                env = (value[1], Thunk(frame[1], frame[2], need), value[3])
+                tree = value[2]
+                if profile is not None:
+                    name = profile.names.get(id(tree))
+                    if name is not None and stack and stack[-1][0] == 'return' and profile.stack[-1][1].name == name:
+                        # a tail call of the function running goes on in its frame
+                        profile.tail_call()
+                    elif name is not None:
+                        # the call ends when the value of the body reaches this frame
+                        profile.enter(name)
+                        stack.append(('return',))
+                if memo is not None and id(tree) in memo.functions:
+                    key, env, cached = memo.prepare(tree, env)
+                    if cached is not None:
+                        value, tree = cached, None
+                    elif key is not None:
+                        stack.append(('memo', key))
+            else:
+                if profile is None:
+                    result = env_builtin(value, Thunk(frame[1], frame[2], need), need, run_machine)
+                else:
+                    result = profile.builtin(value, Thunk(frame[1], frame[2], need), need)
+                if result is None:
+                    result = ('app', readback(value), readback_term(frame[1], frame[2]))
+                value = result
+        elif kind == 'right':
+            stack.append(('left', frame[1], value))
+            tree, env = frame[2], frame[3]
+        elif kind == 'left':
+            op, left = frame[1], frame[2]
+            if op in arithmetic:
+                if left[0] == 'num' and value[0] == 'num':
+                    value = ('num', arithmetic[op](left[1], value[1]))
+                else:
+                    value = (op, readback(left), readback(value))
+            elif op == 'eq':
+                value = ('num', 1.0 if values_equal(left, value) else 0.0)
+            elif op == 'cons':
+                value = cons_value(left, value)
+            else:
+                value = (op, left, value) # seq
+        elif kind == 'if':
+            if value[0] == 'num':
+                tree = frame[1] if value[1] != 0 else frame[2]
+                env = frame[3]
+            else:
+                value = ('if', readback(value), readback_term(frame[1], frame[3]), readback_term(frame[2], frame[3]))
+        elif kind == 'neg':
+            value = ('num', -value[1]) if value[0] == 'num' else ('neg', readback(value))
+        elif kind in ('hd', 'tl'):
+            selected = list_head(value) if kind == 'hd' else list_tail(value)
+            value = selected if selected is not None else (kind, readback(value))
+        elif kind == 'fix':
+            if value[0] == 'closure':
+                # force the recursive binding, so with need=True its value is shared
+                env = recursive_frame(value[1], value[2], value[3], need)
+                tree = ('var', value[1])
+            else:
+                f = readback(value)
+                value = ('app', f, ('fix', f))
+        elif kind == 'update':
+            frame[1].update(value)
+        elif kind == 'return':
+            profile.leave()
+        elif kind == 'memo':
+            memo.store(frame[1], value)
+
+# == on values of evaluate_env and evaluate_machine, iterative along lists
+def values_equal(left, right):
+    while left[0] in list_tags and right[0] in list_tags:
+        if left[0] == 'packed' and right[0] == 'packed':
+            return packed_equal(left, right)
+        if not values_equal(list_head(left), list_head(right)):
+            return False
+        left, right = list_tail(left), list_tail(right)
+    if left[0] != right[0]:
+        return False # readback keeps the tag of every value except closures
+    elif left[0] == 'num':
+        return left[1] == right[1]
+    elif left[0] == 'nil':
+        return True
+    return ast_equal(readback(left), readback(right))
+
+# evaluate_machine with the arguments of evaluate_env
+def run_machine(tree, env, need):
+    return evaluate_machine(tree, need, env)
+
+def evaluate_iterative(tree, need=False):
+    return readback(evaluate_machine(tree, need))
+
+# closure compilation
+# compile_tree turns an AST into a Python closure run(env) -> value, choosing the action
+# for every node once, at compile time, so running the program does no dispatch on tags
+# variables are resolved to their depth in the environment at compile time
+# values, environments and thunks are those of evaluate_env, so readback and linearize
+# work on the results, a closure carries its compiled body as a fifth component
+
+def compile_program(source_code, call_by_need=False):
+    ast = parse_cache.parse(source_code)
+    code = compile_tree(ast, (), call_by_need)
+    def program():
+        return linearize(readback(code(())))
+    return program
+
+def compile_tree(tree, scope, need):
+    if tree[0] == 'var':
+        return compile_var(tree, scope)
+    elif tree[0] == 'lam':
+        return compile_lam(tree, scope, need)
+    elif tree[0] == 'app':
+        return compile_app(tree, scope, need)
+    elif tree[0] in arithmetic:
+        return compile_arithmetic(tree, scope, need)
+    elif tree[0] == 'neg':
+        return compile_neg(tree, scope, need)
+    elif tree[0] == 'eq':
+        return compile_eq(tree, scope, need)
+    elif tree[0] == 'if':
+        return compile_if(tree, scope, need)
+    elif tree[0] == 'let':
+        return compile_let(tree, scope, need)
+    elif tree[0] == 'letrec':
+        return compile_letrec(tree, scope, need)
+    elif tree[0] == 'fix':
+        return compile_fix(tree, scope, need)
+    elif tree[0] in ('seq', 'cons'):
+        return compile_pair(tree, scope, need)
+    elif tree[0] in ('hd', 'tl'):
+        return compile_select(tree, scope, need)
+    else:
+        return lambda env: tree # num, nil, packed
+
+def compile_var(tree, scope):
+    depth = 0
+    while scope and scope[0] != tree[1]:
+        scope = scope[1]
+        depth += 1
+    if not scope:
+        return lambda env: tree # free variable
+    def run(env):
+        for _ in range(depth):
+            env = env[2]
+        value = env[1]
+        return value.force() if isinstance(value, Thunk) else value
+    def run_innermost(env):
+        value = env[1]
+        return value.force() if isinstance(value, Thunk) else value
+    return run_innermost if depth == 0 else run
+
+def compile_lam(tree, scope, need):
+    name, body = tree[1], tree[2]
+    body_code = compile_tree(body, (name, scope), need)
+    def run(env):
+        return ('closure', name, body, env, body_code)
+    return run
+
+def compile_app(tree, scope, need):
+    function_code = compile_tree(tree[1], scope, need)
+    arg = tree[2]
+    arg_code = compile_tree(arg, scope, need)
+    def run(env):
+        f = function_code(env)
+        if f[0] == 'closure':
+            if active_stats is not None:
+                active_stats.counts['beta'] += 1
+            frame = (f[1], Thunk(arg, env, need, arg_code), f[3])
+            if active_memo is not None and id(f[2]) in active_memo.functions:
+                return active_memo.call(f[2], frame, f[4])
+            return f[4](frame)
+        result = env_builtin(f, Thunk(arg, env, need, arg_code), need)
+        if result is None:
+            result = ('app', readback(f), readback_term(arg, env))
+        return result
+    return run
+
+def compile_arithmetic(tree, scope, need):
+    tag, op = tree[0], arithmetic[tree[0]]
+    left_code = compile_tree(tree[1], scope, need)
+    right_code = compile_tree(tree[2], scope, need)
+    def run(env):
+        left = left_code(env)
+        right = right_code(env)
+        if left[0] == 'num' and right[0] == 'num':
+            return ('num', op(left[1], right[1]))
+        return (tag, readback(left), readback(right))
+    return run
+
+def compile_neg(tree, scope, need):
+    operand_code = compile_tree(tree[1], scope, need)
+    def run(env):
+        operand = operand_code(env)
+        if operand[0] == 'num':
+            return ('num', -operand[1])
+        return ('neg', readback(operand))
+    return run
+
+def compile_eq(tree, scope, need):
+    left_code = compile_tree(tree[1], scope, need)
+    right_code = compile_tree(tree[2], scope, need)
+    def run(env):
+        return ('num', 1.0 if values_equal(left_code(env), right_code(env)) else 0.0)
+    return run
+
+def compile_if(tree, scope, need):
+    cond_code = compile_tree(tree[1], scope, need)
+    then_code = compile_tree(tree[2], scope, need)
+    else_code = compile_tree(tree[3], scope, need)
+    def run(env):
+        cond = cond_code(env)
+        if cond[0] == 'num':
+            return then_code(env) if cond[1] != 0 else else_code(env)
+        return ('if', readback(cond), readback_term(tree[2], env), readback_term(tree[3], env))
+    return run
+
+def compile_let(tree, scope, need):
+    name, value = tree[1], tree[2]
+    value_code = compile_tree(value, scope, need)
+    body_code = compile_tree(tree[3], (name, scope), need)
+    def run(env):
+        return body_code((name, Thunk(value, env, need, value_code), env))
+    return run
+
+def compile_letrec(tree, scope, need):
+    name, value = tree[1], tree[2]
+    inner = (name, scope)
+    value_code = compile_tree(value, inner, need)
+    body_code = compile_tree(tree[3], inner, need)
+    def run(env):
+        return body_code(recursive_frame(name, value, env, need, value_code))
+    return run
+
+def compile_fix(tree, scope, need):
+    function_code = compile_tree(tree[1], scope, need)
+    def run(env):
+        f = function_code(env)
+        if f[0] == 'closure':
+            # the body of F is compiled already, the frame only has to close the cycle
+            return recursive_frame(f[1], f[2], f[3], need, f[4])[1].force()
+        f = readback(f)
+        return ('app', f, ('fix', f))
+    return run
+
+def compile_pair(tree, scope, need):
+    tag = tree[0]
+    left_code = compile_tree(tree[1], scope, need)
+    right_code = compile_tree(tree[2], scope, need)
+    if tag == 'cons':
+        def run(env):
+            return cons_value(left_code(env), right_code(env))
+    else:
+        def run(env):
+            return (tag, left_code(env), right_code(env))
+    return run
+
+def compile_select(tree, scope, need):
+    tag, select = tree[0], list_head if tree[0] == 'hd' else list_tail
+    list_code = compile_tree(tree[1], scope, need)
+    def run(env):
+        expr = list_code(env)
+        selected = select(expr)
+        if selected is not None:
+            return selected
+        return (tag, readback(expr))
+    return run
+
+def evaluate_compiled(tree, need=False):
+    return readback(compile_tree(tree, (), need)(()))
+
+# bytecode
+# compile_bytecode translates an AST into flat bytecode: the instructions of the program and of
+# every function body and thunk are opcodes followed by their operands in one array('l'), the
+# numbers of arithmetic with a constant in an array('d'), and whatever else an instruction
+# refers to (values, names, the trees kept for readback, blocks) in a list of constants
+# run_bytecode executes it in a single loop with an operand stack and a stack of return frames,
+# so running a program makes no Python call per node and dispatches on small integers, not on
+# the tags of tree nodes
+# values, environments and thunks are those of evaluate_env: a closure carries the Block of its
+# body as fifth component and a thunk the Block of its expression as code, so readback,
+# linearize, the builtins and memo work on them, and Python code (a builtin applying a
+# function, Thunk.force) runs a block by calling it
+# the arrays are the compact form of the program, the loop reads list copies of them, as
+# indexing a list is about twice as fast as indexing an array
+# like the machine, tail calls and a variable forced in tail position push no frame
+# an argument (or let binding) that is a variable, a number, # or a lambda is passed as its
+# value instead of a thunk, and one of the form x op n or x op y where x and y are numbers
+# already is computed when the call is made (see Speculated): neither can fail or loop
+
+# (name, operands), the opcode is the position in this list
+bytecode_instructions = [
+    ('LOAD0', 0),          # push the innermost variable, forced
+    ('LOAD', 1),           # depth: push a variable, forced
+    ('TAILLOAD', 1),       # depth: return a variable, forced without a frame
+    ('CALL_VAR', 2),       # depth tree: apply a variable to the argument on the stack
+    ('TAILCALL_VAR', 2),   # depth tree: same, returning what the function returns
+    ('CALL', 1),           # argument tree: apply the function below the argument
+    ('TAILCALL', 1),       # argument tree: same, returning what the function returns
+    ('RETURN', 0),         # return the top of the stack to the innermost frame
+    ('ARG_OP', 4),         # op depth number block: push x op n if x is a number, else a thunk
+    ('ARG_OP_VAR', 4),     # op depth depth block: push x op y if both are numbers, else a thunk
+    ('TEST_CONST', 5),     # op number target tree end: OP_CONST and JUMP_IF_FALSE in one
+    ('OP_CONST', 2),       # op number: arithmetic (or ==) on the top value and a number
+    ('OP', 1),             # op: arithmetic on the top two values
+    ('CONST', 1),          # constant: push a value
+    ('ARG', 1),            # depth: push a variable as it is, thunk or value
+    ('JUMP_IF_FALSE', 3),  # target tree end: pop a number, jump to target if it is 0
+    ('THUNK', 1),          # block: push a thunk of the block in env
+    ('CLOSURE', 1),        # block: push a closure of the function in env
+    ('JUMP', 1),           # target
+    ('LET', 1),            # name: bind the top of the stack in env
+    ('END_LET', 0),        # drop the innermost frame of env
+    ('LETREC_LAM', 1),     # block: bind the block's name to a closure of it, in its own frame
+    ('LETREC', 1),         # block: bind the block's name to a thunk of it, in its own frame
+    ('EQ', 0),
+    ('CONS', 0),
+    ('HD', 0),
+    ('TL', 0),
+    ('NEG', 0),
+    ('SEQ', 0),
+    ('FIX', 0),            # pop a function, push its fixed point
+]
+bytecode_opcodes = {name: opcode for opcode, (name, _) in enumerate(bytecode_instructions)}
+
+# the opcodes by name, for run_bytecode
+(LOAD0, LOAD, TAILLOAD, CALL_VAR, TAILCALL_VAR, CALL, TAILCALL, RETURN, ARG_OP, ARG_OP_VAR, TEST_CONST,
+ OP_CONST, OP, CONST, ARG, JUMP_IF_FALSE, THUNK, CLOSURE, JUMP, LET, END_LET, LETREC_LAM, LETREC, EQ, CONS,
+ HD, TL, NEG, SEQ, FIX) = (bytecode_opcodes[name] for name in (
+    'LOAD0', 'LOAD', 'TAILLOAD', 'CALL_VAR', 'TAILCALL_VAR', 'CALL', 'TAILCALL', 'RETURN', 'ARG_OP', 'ARG_OP_VAR',
+    'TEST_CONST', 'OP_CONST', 'OP', 'CONST', 'ARG', 'JUMP_IF_FALSE', 'THUNK', 'CLOSURE', 'JUMP', 'LET', 'END_LET',
+    'LETREC_LAM', 'LETREC', 'EQ', 'CONS', 'HD', 'TL', 'NEG', 'SEQ', 'FIX'))
+# run_bytecode tests a group of opcodes with one comparison, which needs each group to be
+# contiguous and in the order of its tests
+assert LOAD0 == 0 and LOAD0 + 1 == LOAD and LOAD + 1 == TAILLOAD
+assert TAILLOAD + 1 == CALL_VAR and CALL_VAR + 1 == TAILCALL_VAR and TAILCALL_VAR + 1 == CALL and CALL + 1 == TAILCALL
+assert TAILCALL + 1 == RETURN and RETURN + 1 == ARG_OP and ARG_OP + 1 == ARG_OP_VAR
+assert ARG_OP_VAR + 1 == TEST_CONST and TEST_CONST + 1 == OP_CONST and OP_CONST + 1 == OP
+
+# the op operand of ARG_OP, ARG_OP_VAR and OP (the first four), OP_CONST and TEST_CONST
+bytecode_operators = ('plus', 'minus', 'times', 'leq', 'eq')
+OP_PLUS, OP_MINUS, OP_TIMES, OP_LEQ, OP_EQ = range(len(bytecode_operators))
+
+# an argument x op n or x op y computed when the call was made: until it is forced it reads
+# back as the thunk it stands for, so a stuck term prints the same as with a thunk
+# forcing it with need=True also forces the arguments it was computed from, as the thunk would
+class Speculated(Thunk):
+    __slots__ = ('result', 'operands')
+
+    def __init__(self, tree, env, shared, code, result, operands):
+        self.tree = tree
+        self.env = env
+        self.shared = shared
+        self.value = None
+        self.code = code
+        self.result = result
+        self.operands = operands
+
+    def force(self):
+        if self.shared and self.value is None:
+            todo = [self] # iterative: the accumulator of a loop is a chain of these
+            while todo:
+                thunk = todo.pop()
+                if thunk.value is None:
+                    for x in thunk.operands:
+                        if type(x) is Speculated and x.value is None:
+                            todo.append(x)
+                    thunk.value = thunk.result
+                    thunk.tree = thunk.env = thunk.code = thunk.operands = None
+        return self.result
+
+# a function body, a thunk or the program: the code from 'entry' computes 'tree' (for a
+# function the lambda, for a letrec thunk the bound expression, named 'name')
+class Block:
+    __slots__ = ('program', 'entry', 'tree', 'name')
+
+    def __init__(self, program, tree, name=None):
+        self.program = program
+        self.entry = None
+        self.tree = tree
+        self.name = name
+
+    def __call__(self, env):
+        return run_bytecode(self.program, self.entry, env)
+
+class Bytecode:
+    def __init__(self, need):
+        self.need = need
+        self.code = array('l')
+        self.numbers = array('d')
+        self.instructions = self.number_values = None # list copies for run_bytecode
+        self.constants = []
+        self.constant_index = {} # id of a constant -> its index
+        self.blocks = []
+
+    def constant(self, value):
+        index = self.constant_index.get(id(value))
+        if index is None:
+            index = self.constant_index[id(value)] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def number(self, value):
+        self.numbers.append(value)
+        return len(self.numbers) - 1
+
+    def block(self, tree, name=None):
+        block = Block(self, tree, name)
+        self.blocks.append(block)
+        return self.constant(block)
+
+    def emit(self, name, *operands):
+        self.code.append(bytecode_opcodes[name])
+        self.code.extend(operands)
+        return len(self.code) - len(operands) # position of the first operand
+
+    # every block with its instructions, one per line: position, name, operands and what they mean
+    def disassemble(self):
+        lines = []
+        starts = {block.entry: block for block in self.blocks}
+        pc = 0
+        while pc < len(self.code):
+            if pc in starts:
+                block = starts[pc]
+                index = self.blocks.index(block)
+                if index == 0:
+                    title = "program"
+                elif block.tree[0] == 'lam' and block.name is None:
+                    title = "function \\" + block.tree[1]
+                else:
+                    title = (block.name + " = " if block.name else "thunk ") + shorten(linearize(block.tree))
+                lines.append(("" if pc == 0 else "\n") + f"block {index}: {title}")
+            name, count = bytecode_instructions[self.code[pc]]
+            operands = list(self.code[pc + 1:pc + 1 + count])
+            lines.append(f"{pc:>6}  {name:<14}{' '.join(str(x) for x in operands):<14}{self.describe(name, operands)}".rstrip())
+            pc += 1 + count
+        return "\n".join(lines)
+
+    def describe(self, name, operands):
+        if name in ('CONST', 'LET'):
+            value = self.constants[operands[0]]
+            return value if isinstance(value, str) else shorten(linearize(value))
+        elif name in ('THUNK', 'CLOSURE', 'LETREC', 'LETREC_LAM'):
+            return f"block {self.blocks.index(self.constants[operands[0]])}"
+        elif name in ('ARG_OP', 'ARG_OP_VAR'):
+            op, depth, other, block = operands
+            other = format_number(self.numbers[other]) if name == 'ARG_OP' else f"variable {other}"
+            return (f"variable {depth} {infix_operators[bytecode_operators[op]].strip()} {other}, "
+                    f"else block {self.blocks.index(self.constants[block])}")
+        elif name in ('CALL', 'TAILCALL', 'CALL_VAR', 'TAILCALL_VAR'):
+            return shorten(linearize(self.constants[operands[-1]]))
+        elif name == 'JUMP_IF_FALSE':
+            return f"else {operands[0]}, end {operands[2]}"
+        elif name == 'TEST_CONST':
+            op, number, target, _, end = operands
+            return (f"{infix_operators[bytecode_operators[op]].strip()} {format_number(self.numbers[number])}, "
+                    f"else {target}, end {end}")
+        elif name == 'OP':
+            return infix_operators[bytecode_operators[operands[0]]].strip()
+        elif name == 'OP_CONST':
+            return infix_operators[bytecode_operators[operands[0]]].strip() + " " + format_number(self.numbers[operands[1]])
+        return ""
+
+def shorten(text, width=50):
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+# the program is block 0, its code starts at 0; need=True makes the thunks shared
+def compile_bytecode(tree, need=False):
+    program = Bytecode(need)
+    program.block(tree)
+    todo = [(program.blocks[0], ())] # blocks still to compile, with their scope
+    while todo:
+        block, scope = todo.pop()
+        block.entry = len(program.code)
+        tree = block.tree
+        if tree[0] == 'lam' and block is not program.blocks[0]:
+            if block.name is not None: # letrec of a lambda, the name is bound around it
+                scope = (block.name, scope)
+            tree, scope = tree[2], (tree[1], scope)
+        elif block.name is not None:
+            scope = (block.name, scope)
+        emit_bytecode(program, tree, scope, True, todo)
+    program.instructions = program.code.tolist()
+    program.number_values = program.numbers.tolist()
+    return program
+
+def scope_depth(scope, name):
+    depth = 0
+    while scope and scope[0] != name:
+        scope = scope[1]
+        depth += 1
+    return depth if scope else None
+
+# code leaving the value of tree on the stack, or returning it if tail is set
+# blocks of functions and thunks are added to todo
+def emit_bytecode(program, tree, scope, tail, todo):
+    emit = program.emit
+    tag = tree[0]
+    if tag == 'var':
+        depth = scope_depth(scope, tree[1])
+        if depth is None:
+            emit('CONST', program.constant(tree)) # free variable
+        elif tail:
+            emit('TAILLOAD', depth)
+            emit('RETURN') # for a value, a thunk returns by itself
+            return
+        elif depth == 0:
+            emit('LOAD0')
+        else:
+            emit('LOAD', depth)
+    elif tag == 'lam':
+        emit('CLOSURE', program.block(tree))
+        todo.append((program.blocks[-1], scope))
+    elif tag == 'app':
+        depth = scope_depth(scope, tree[1][1]) if tree[1][0] == 'var' else None
+        if depth is not None:
+            emit_argument(program, tree[2], scope, todo)
+            emit('TAILCALL_VAR' if tail else 'CALL_VAR', depth, program.constant(tree[2]))
+        else:
+            emit_bytecode(program, tree[1], scope, False, todo)
+            emit_argument(program, tree[2], scope, todo)
+            emit('TAILCALL' if tail else 'CALL', program.constant(tree[2]))
+        if tail:
+            emit('RETURN') # for a function that is not a closure
+        return
+    elif tag in bytecode_operators and tree[2][0] == 'num':
+        emit_bytecode(program, tree[1], scope, False, todo)
+        emit('OP_CONST', bytecode_operators.index(tag), program.number(tree[2][1]))
+    elif tag in arithmetic:
+        emit_bytecode(program, tree[1], scope, False, todo)
+        emit_bytecode(program, tree[2], scope, False, todo)
+        emit('OP', bytecode_operators.index(tag))
+    elif tag in ('eq', 'cons', 'seq'):
+        emit_bytecode(program, tree[1], scope, False, todo)
+        emit_bytecode(program, tree[2], scope, False, todo)
+        emit(tag.upper())
+    elif tag in ('neg', 'hd', 'tl', 'fix'):
+        emit_bytecode(program, tree[1], scope, False, todo)
+        emit(tag.upper())
+    elif tag == 'if':
+        cond = tree[1]
+        if cond[0] in bytecode_operators and cond[2][0] == 'num':
+            emit_bytecode(program, cond[1], scope, False, todo)
+            jump = emit('TEST_CONST', bytecode_operators.index(cond[0]), program.number(cond[2][1]),
+                        0, program.constant(tree), 0) + 2
+        else:
+            emit_bytecode(program, cond, scope, False, todo)
+            jump = emit('JUMP_IF_FALSE', 0, program.constant(tree), 0)
+        emit_bytecode(program, tree[2], scope, tail, todo)
+        if not tail:
+            end_jump = emit('JUMP', 0)
+        program.code[jump] = len(program.code)
+        emit_bytecode(program, tree[3], scope, tail, todo)
+        program.code[jump + 2] = len(program.code)
+        if tail:
+            emit('RETURN') # for a condition that is not a number
+            return
+        program.code[end_jump] = len(program.code)
+    elif tag == 'let':
+        emit_argument(program, tree[2], scope, todo)
+        emit('LET', program.constant(tree[1]))
+        emit_bytecode(program, tree[3], (tree[1], scope), tail, todo)
+        if not tail:
+            emit('END_LET')
+        return
+    elif tag == 'letrec':
+        emit('LETREC_LAM' if tree[2][0] == 'lam' else 'LETREC', program.block(tree[2], tree[1]))
+        todo.append((program.blocks[-1], scope))
+        emit_bytecode(program, tree[3], (tree[1], scope), tail, todo)
+        if not tail:
+            emit('END_LET')
+        return
+    else:
+        emit('CONST', program.constant(tree)) # num, nil, packed
+    if tail:
+        emit('RETURN')
+
+# code pushing what an argument or a let binding is bound to: a value, or a thunk
+def emit_argument(program, tree, scope, todo):
+    tag = tree[0]
+    if tag == 'var':
+        depth = scope_depth(scope, tree[1])
+        if depth is not None:
+            program.emit('ARG', depth)
+            return
+    elif tag == 'lam':
+        emit_bytecode(program, tree, scope, False, todo)
+        return
+    elif tag in arithmetic and tree[1][0] == 'var' and tree[2][0] in ('num', 'var'):
+        left = scope_depth(scope, tree[1][1])
+        right = scope_depth(scope, tree[2][1]) if tree[2][0] == 'var' else None
+        if left is not None and (tree[2][0] == 'num' or right is not None):
+            block = program.block(tree)
+            todo.append((program.blocks[-1], scope))
+            op = bytecode_operators.index(tag)
+            if right is None:
+                program.emit('ARG_OP', op, left, program.number(tree[2][1]), block)
+            else:
+                program.emit('ARG_OP_VAR', op, left, right, block)
+            return
+    if tag in ('var', 'num', 'nil', 'packed'):
+        program.emit('CONST', program.constant(tree)) # a free variable or a constant
+        return
+    program.emit('THUNK', program.block(tree))
+    todo.append((program.blocks[-1], scope))
+
+# the value of the code of 'program' from 'pc' in env; the instructions that run most are
+# tested first, some groups of them with one comparison (see the asserts after bytecode_opcodes)
+def run_bytecode(program, pc, env):
+    code, numbers, constants, need = program.instructions, program.number_values, program.constants, program.need
+    stack = []
+    push, pop = stack.append, stack.pop
+    # (return pc, env) of a call or a forced thunk, (-1, thunk) to update, (-2, key) to memoize
+    frames = []
+    stats, memo = active_stats, active_memo
+    while True:
+        op = code[pc]
+        if op <= TAILLOAD:
+            if op == LOAD0:
+                value = env[1]
+                pc += 1
+            else:
+                frame, depth = env, code[pc + 1]
+                while depth:
+                    frame = frame[2]
+                    depth -= 1
+                value = frame[1]
+                pc += 2
+            kind = type(value)
+            if kind is Speculated:
+                if need and value.value is None:
+                    value.force()
+                value = value.result
+            elif kind is Thunk:
+                if value.value is None:
+                    block = value.code
+                    if type(block) is not Block or block.program is not program:
+                        push(value.force())
+                        continue
+                    if op != TAILLOAD:
+                        frames.append((pc, env))
+                    if value.shared:
+                        frames.append((-1, value))
+                    pc, env = block.entry, value.env
+                    continue
+                value = value.value
+            push(value)
+        elif op <= TAILCALL:
+            arg = pop()
+            if op <= TAILCALL_VAR:
+                frame, depth = env, code[pc + 1]
+                while depth:
+                    frame = frame[2]
+                    depth -= 1
+                f = frame[1]
+                if type(f) is not tuple:
+                    # a function bound to a thunk is forced by a nested run
+                    f = f.force()
+                pc += 3
+            else:
+                f = pop()
+                pc += 2
+            if f[0] == 'closure':
+                if stats is not None:
+                    stats.counts['beta'] += 1
+                body_env = (f[1], arg, f[3])
+                key = None
+                if memo is not None and id(f[2]) in memo.functions:
+                    key, body_env, cached = memo.prepare(f[2], body_env)
+                    if cached is not None:
+                        push(cached)
+                        continue # a tail call is followed by a RETURN
+                if op == CALL_VAR or op == CALL:
+                    frames.append((pc, env))
+                if key is not None:
+                    frames.append((-2, key))
+                pc, env = f[4].entry, body_env
+            else:
+                if not isinstance(arg, Thunk):
+                    value, arg = arg, Thunk(None, None)
+                    arg.value = value
+                result = env_builtin(f, arg, need)
+                if result is None:
+                    result = ('app', readback(f), readback_term(constants[code[pc - 1]], env))
+                push(result)
+        elif op == RETURN:
+            while frames:
+                pc, env = frames.pop()
+                if pc >= 0:
+                    break
+                elif pc == -1:
+                    env.update(stack[-1])
+                else:
+                    memo.store(env, stack[-1])
+            else:
+                return pop()
+        elif op <= ARG_OP_VAR:
+            frame, depth = env, code[pc + 2]
+            while depth:
+                frame = frame[2]
+                depth -= 1
+            x = left = frame[1]
+            kind = type(left)
+            if kind is Speculated:
+                left = left.result
+            elif kind is Thunk:
+                left = left.value
+            if op == ARG_OP:
+                y, right = None, ('num', numbers[code[pc + 3]])
+            else:
+                frame, depth = env, code[pc + 3]
+                while depth:
+                    frame = frame[2]
+                    depth -= 1
+                y = right = frame[1]
+                kind = type(right)
+                if kind is Speculated:
+                    right = right.result
+                elif kind is Thunk:
+                    right = right.value
+            block = constants[code[pc + 4]]
+            if left is not None and right is not None and left[0] == 'num' and right[0] == 'num':
+                operator = code[pc + 1]
+                if operator == OP_MINUS:
+                    result = ('num', left[1] - right[1])
+                elif operator == OP_PLUS:
+                    result = ('num', left[1] + right[1])
+                elif operator == OP_TIMES:
+                    result = ('num', left[1] * right[1])
+                else:
+                    result = ('num', 1.0 if left[1] <= right[1] else 0.0)
+                push(Speculated(block.tree, env, need, block, result, (x, y)))
+            else:
+                push(Thunk(block.tree, env, need, block))
+            pc += 5
+        elif op <= OP_CONST:
+            left = pop() if op == TEST_CONST else stack[-1]
+            operator = code[pc + 1]
+            number = numbers[code[pc + 2]]
+            if left[0] == 'num':
+                if operator == OP_LEQ:
+                    result = 1.0 if left[1] <= number else 0.0
+                elif operator == OP_EQ:
+                    result = 1.0 if left[1] == number else 0.0
+                elif operator == OP_MINUS:
+                    result = left[1] - number
+                elif operator == OP_PLUS:
+                    result = left[1] + number
+                else:
+                    result = left[1] * number
+            elif operator == OP_EQ:
+                result = 1.0 if values_equal(left, ('num', number)) else 0.0
+            else:
+                result = (bytecode_operators[operator], readback(left), ('num', number))
+            if op == OP_CONST:
+                stack[-1] = ('num', result) if type(result) is float else result
+                pc += 3
+            elif type(result) is float:
+                pc = pc + 6 if result != 0 else code[pc + 3]
+            else:
+                tree = constants[code[pc + 4]]
+                push(('if', result, readback_term(tree[2], env), readback_term(tree[3], env)))
+                pc = code[pc + 5]
+        elif op == OP:
+            right = pop()
+            left = stack[-1]
+            tag = bytecode_operators[code[pc + 1]]
+            if left[0] == 'num' and right[0] == 'num':
+                stack[-1] = ('num', arithmetic[tag](left[1], right[1]))
+            else:
+                stack[-1] = (tag, readback(left), readback(right))
+            pc += 2
+        elif op == CONST:
+            push(constants[code[pc + 1]])
+            pc += 2
+        elif op == ARG:
+            frame, depth = env, code[pc + 1]
+            while depth:
+                frame = frame[2]
+                depth -= 1
+            push(frame[1])
+            pc += 2
+        elif op == JUMP_IF_FALSE:
+            cond = pop()
+            if cond[0] == 'num':
+                pc = pc + 4 if cond[1] != 0 else code[pc + 1]
+            else:
+                tree = constants[code[pc + 2]]
+                push(('if', readback(cond), readback_term(tree[2], env), readback_term(tree[3], env)))
+                pc = code[pc + 3]
+        elif op == THUNK:
+            block = constants[code[pc + 1]]
+            push(Thunk(block.tree, env, need, block))
+            pc += 2
+        elif op == CLOSURE:
+            block = constants[code[pc + 1]]
+            push(('closure', block.tree[1], block.tree[2], env, block))
+            pc += 2
+        elif op == JUMP:
+            pc = code[pc + 1]
+        elif op == LET:
+            env = (constants[code[pc + 1]], pop(), env)
+            pc += 2
+        elif op == END_LET:
+            env = env[2]
+            pc += 1
+        elif op == LETREC_LAM:
+            # the closure is the value the thunk of recursive_frame would have
+            block = constants[code[pc + 1]]
+            if stats is not None:
+                stats.counts['unfold'] += 1
+            env = [block.name, None, env, block.tree]
+            env[1] = ('closure', block.tree[1], block.tree[2], env, block)
+            pc += 2
+        elif op == LETREC:
+            block = constants[code[pc + 1]]
+            env = recursive_frame(block.name, block.tree, env, need, block)
+            pc += 2
+        elif op == EQ:
+            right = pop()
+            stack[-1] = ('num', 1.0 if values_equal(stack[-1], right) else 0.0)
+            pc += 1
+        elif op == CONS:
+            right = pop()
+            stack[-1] = cons_value(stack[-1], right)
+            pc += 1
+        elif op == HD or op == TL:
+            value = stack[-1]
+            selected = list_head(value) if op == HD else list_tail(value)
+            stack[-1] = selected if selected is not None else ('hd' if op == HD else 'tl', readback(value))
+            pc += 1
+        elif op == NEG:
+            value = stack[-1]
+            stack[-1] = ('num', -value[1]) if value[0] == 'num' else ('neg', readback(value))
+            pc += 1
+        elif op == SEQ:
+            right = pop()
+            stack[-1] = ('seq', stack[-1], right)
+            pc += 1
+        elif op == FIX:
+            f = pop()
+            pc += 1
+            if f[0] == 'closure':
+                # force the recursive binding, so with need=True its value is shared
+                thunk = recursive_frame(f[1], f[2], f[3], need, f[4])[1]
+                frames.append((pc, env))
+                if need:
+                    frames.append((-1, thunk))
+                pc, env = f[4].entry, thunk.env
+            else:
+                f = readback(f)
+                push(('app', f, ('fix', f)))
+        else:
+            raise ValueError(f"bad opcode {op} at {pc}")
+
+def evaluate_bytecode(tree, need=False):
+    program = compile_bytecode(tree, need)
+    return readback(run_bytecode(program, 0, ()))
+
+# the disassembled bytecode of a program, for inspection
+def disassemble(source_code, call_by_need=False):
+    return compile_bytecode(parse_cache.parse(source_code), call_by_need).disassemble()
+
+# Python code generation for numeric letrec kernels
+# a program in the compilable subset is translated into Python source (letrec and let of a
+# lambda become a def, if becomes a Python conditional, arithmetic works on floats) and
+# compiled with compile(), so CPython bytecode does the work
+# the subset: first-order functions bound by let/letrec and always called with all their
+# arguments, numbers, lists, if, let and the primitives; anything else raises NotCompilable
+# arguments are evaluated eagerly, so whenever the generated code gets stuck (a list where a
+# number is expected, hd of #: Stuck is raised) or recurses too deep the program is run again
+# with the fallback engine, which gives the non-strict result
+
+class NotCompilable(Exception):
+    pass
+
+# raised by the generated code where evaluate would return a stuck term
+class Stuck(Exception):
+    pass
+
+# a list used as a number by the generated code (arithmetic, <=) is stuck
+class ListValue:
+    __slots__ = ()
+
+    def stuck(self, *other):
+        raise Stuck('list used as a number')
+
+    __add__ = __radd__ = __sub__ = __rsub__ = __mul__ = __rmul__ = __neg__ = __le__ = __ge__ = stuck
+
+# lists of the generated code, == compares them like ast_equal does
+class Cons(ListValue):
+    __slots__ = ('head', 'tail')
+
+    def __init__(self, head, tail):
+        self.head = head
+        self.tail = tail
+
+    def __eq__(self, other):
+        left, right = self, other
+        while isinstance(left, Cons) and isinstance(right, Cons):
+            if not left.head == right.head:
+                return False
+            left, right = left.tail, right.tail
+        return left is right or (left.__class__ is float and left == right)
+
+    __hash__ = None
+
+class Nil(ListValue):
+    __slots__ = ()
+
+NIL = Nil()
+
+def truth(cond):
+    if cond.__class__ is float:
+        return cond != 0
+    raise Stuck('condition is not a number')
+
+def head(value):
+    if value.__class__ is Cons:
+        return value.head
+    raise Stuck('hd of a number or #')
+
+def tail(value):
+    if value.__class__ is Cons:
+        return value.tail
+    raise Stuck('tl of a number or #')
+
+class PythonGenerator:
+    def __init__(self):
+        self.lines = []
+        self.counter = 0
+
+    def fresh(self, name):
+        self.counter += 1
+        return name + '_' + str(self.counter)
+
+    def emit(self, indent, line):
+        self.lines.append('    ' * indent + line)
+
+    # scope is a linked list (name, kind, python_name, arity, parent), kind is 'val' or 'fun'
+    def lookup(self, scope, name):
+        while scope:
+            if scope[0] == name:
+                return scope
+            scope = scope[4]
+        raise NotCompilable('free variable ' + name)
+
+    # statements computing tree and returning it
+    def body(self, tree, scope, indent):
+        if tree[0] == 'if':
+            self.emit(indent, 'if ' + self.condition(tree[1], scope) + ':')
+            self.body(tree[2], scope, indent + 1)
+            self.emit(indent, 'else:')
+            self.body(tree[3], scope, indent + 1)
+        elif tree[0] in ('let', 'letrec') and tree[2][0] == 'lam':
+            # a function binding becomes a def, letrec lets the body see the function itself
+            params, fun_body = [], tree[2]
+            while fun_body[0] == 'lam':
+                params.append(fun_body[1])
+                fun_body = fun_body[2]
+            python_name = self.fresh(tree[1])
+            fun = (tree[1], 'fun', python_name, len(params), scope)
+            inner = fun if tree[0] == 'letrec' else scope
+            python_params = []
+            for param in params:
+                python_params.append(self.fresh(param))
+                inner = (param, 'val', python_params[-1], 0, inner)
+            self.emit(indent, 'def ' + python_name + '(' + ', '.join(python_params) + '):')
+            self.body(fun_body, inner, indent + 1)
+            self.body(tree[3], fun, indent)
+        elif tree[0] == 'let':
+            python_name = self.fresh(tree[1])
+            self.emit(indent, python_name + ' = ' + self.expression(tree[2], scope))
+            self.body(tree[3], (tree[1], 'val', python_name, 0, scope), indent)
+        else:
+            self.emit(indent, 'return ' + self.expression(tree, scope))
+
+    def condition(self, tree, scope):
+        if tree[0] == 'leq':
+            return self.expression(tree[1], scope) + ' <= ' + self.expression(tree[2], scope)
+        elif tree[0] == 'eq':
+            return self.expression(tree[1], scope) + ' == ' + self.expression(tree[2], scope)
+        else:
+            return 'truth(' + self.expression(tree, scope) + ')'
+
+    def expression(self, tree, scope):
+        if tree[0] == 'num':
+            if not math.isfinite(tree[1]):
+                raise NotCompilable('number ' + str(tree[1]))
+            return repr(tree[1])
+        elif tree[0] == 'nil':
+            return 'NIL'
+        elif tree[0] == 'var':
+            binding = self.lookup(scope, tree[1])
+            if binding[1] != 'val':
+                raise NotCompilable('function ' + tree[1] + ' used as a value')
+            return binding[2]
+        elif tree[0] in ('plus', 'minus', 'times'):
+            op = {'plus': ' + ', 'minus': ' - ', 'times': ' * '}[tree[0]]
+            return '(' + self.expression(tree[1], scope) + op + self.expression(tree[2], scope) + ')'
+        elif tree[0] == 'neg':
+            return '(-' + self.expression(tree[1], scope) + ')'
+        elif tree[0] in ('leq', 'eq'):
+            return '(1.0 if ' + self.condition(tree, scope) + ' else 0.0)'
+        elif tree[0] == 'if':
+            return ('(' + self.expression(tree[2], scope) + ' if ' + self.condition(tree[1], scope)
+                    + ' else ' + self.expression(tree[3], scope) + ')')
+        elif tree[0] == 'cons':
+            return 'Cons(' + self.expression(tree[1], scope) + ', ' + self.expression(tree[2], scope) + ')'
+        elif tree[0] == 'hd':
+            return 'head(' + self.expression(tree[1], scope) + ')'
+        elif tree[0] == 'tl':
+            return 'tail(' + self.expression(tree[1], scope) + ')'
+        elif tree[0] == 'app':
+            args = []
+            while tree[0] == 'app':
+                args.append(tree[2])
+                tree = tree[1]
+            if tree[0] != 'var':
+                raise NotCompilable('application of a ' + tree[0])
+            binding = self.lookup(scope, tree[1])
+            if binding[1] != 'fun' or binding[3] != len(args):
+                raise NotCompilable('partial or higher-order application of ' + tree[1])
+            return binding[2] + '(' + ', '.join(self.expression(arg, scope) for arg in reversed(args)) + ')'
+        else:
+            raise NotCompilable(tree[0] + ' inside an expression')
+
+# Python source for a program without ;; (defines main()), raises NotCompilable
+def generate_python(tree):
+    generator = PythonGenerator()
+    generator.emit(0, 'def main():')
+    generator.body(tree, (), 1)
+    return '\n'.join(generator.lines) + '\n'
+
+# code objects are cached by AST, so a program that is run again is not compiled again
+@functools.lru_cache(maxsize=256)
+def compile_python(tree):
+    try:
+        return compile(generate_python(tree), '<lambdaF>', 'exec')
+    except NotCompilable:
+        return None
+
+def python_to_ast(value):
+    spine = []
+    while isinstance(value, Cons):
+        spine.append(python_to_ast(value.head))
+        value = value.tail
+    result = ('nil',) if value is NIL else ('num', value)
+    for head in reversed(spine):
+        result = cons_value(head, result)
+    return result
+
+# run each ;;-separated part as Python if it is in the compilable subset, else with fallback
+def evaluate_python(tree, fallback=evaluate):
+    if tree[0] == 'seq':
+        return ('seq', evaluate_python(tree[1], fallback), evaluate_python(tree[2], fallback))
+    code = compile_python(tree)
+    if code is not None:
+        namespace = {'Cons': Cons, 'NIL': NIL, 'truth': truth, 'head': head, 'tail': tail}
+        exec(code, namespace)
+        try:
+            return python_to_ast(namespace['main']())
+        except (Stuck, NotCompilable):
+            pass
+        except RecursionError:
+            pass # deeper than the Python stack allows, left to the fallback
+    return fallback(tree)
+
+# generated Python source of every compilable part of a program, for inspection
+def python_source(source_code):
+    ast = parse_cache.parse(source_code)
+    parts = []
+    while ast[0] == 'seq':
+        parts.append(ast[2])
+        ast = ast[1]
+    parts.append(ast)
+    sources = []
+    for part in reversed(parts):
+        try:
+            sources.append(generate_python(part))
+        except NotCompilable as error:
+            sources.append('# not compilable: ' + str(error) + '\n')
+    return '\n'.join(sources)
+
+# De Bruijn-indexed evaluation (beta reduction without fresh names)
+# a bound variable becomes ('idx', k) where k counts the binders between it and its binder,
+# free variables stay ('var', name), and binders keep their name only as a hint for from_debruijn
+# evaluate_db only ever sees closed terms, so an argument never needs shifting when it
+# is substituted under binders and no binder has to be renamed
+
+def to_debruijn(tree, scope=()):
+    # scope is a linked list (name, parent) of the enclosing binders, innermost first
+    if tree[0] == 'var':
+        k = 0
+        while scope:
+            if scope[0] == tree[1]:
+                return ('idx', k)
+            scope = scope[1]
+            k += 1
+        return tree
+    elif tree[0] == 'lam':
+        return ('lam', tree[1], to_debruijn(tree[2], (tree[1], scope)))
+    elif tree[0] == 'let':
+        return ('let', tree[1], to_debruijn(tree[2], scope), to_debruijn(tree[3], (tree[1], scope)))
+    elif tree[0] == 'letrec':
+        rec_scope = (tree[1], scope)
+        return ('letrec', tree[1], to_debruijn(tree[2], rec_scope), to_debruijn(tree[3], rec_scope))
+    elif tree[0] in ('num', 'nil', 'packed'):
+        return tree
+    else:
+        return (tree[0],) + tuple(to_debruijn(child, scope) for child in tree[1:])
+
+# tree [arg/depth] for the body of a lambda, arg is closed
+def instantiate(tree, arg, depth=0):
+    if tree[0] == 'idx':
+        if tree[1] == depth:
+            return arg
+        elif tree[1] < depth:
+            return tree
+    elif tree[0] in ('var', 'num', 'nil', 'packed', 'rec'):
+        return tree # a rec node is closed
+    if active_stats is not None:
+        active_stats.counts['built'] += 1 # every case below makes one new node
+    if tree[0] == 'idx':
+        return ('idx', tree[1] - 1)
+    elif tree[0] == 'lam':
+        return ('lam', tree[1], instantiate(tree[2], arg, depth + 1))
+    elif tree[0] == 'let':
+        return ('let', tree[1], instantiate(tree[2], arg, depth), instantiate(tree[3], arg, depth + 1))
+    elif tree[0] == 'letrec':
+        return ('letrec', tree[1], instantiate(tree[2], arg, depth + 1), instantiate(tree[3], arg, depth + 1))
+    else:
+        return (tree[0],) + tuple(instantiate(child, arg, depth) for child in tree[1:])
+
+def evaluate_db(tree):
+    stats = active_stats
+    if stats is not None:
+        stats.enter(tree[0])
+    if tree[0] == 'app':
+        e1 = evaluate_db(tree[1])
+        if e1[0] == 'lam':
+            if stats is not None:
+                stats.counts['beta'] += 1
+                stats.counts['substitute'] += 1
+            result = evaluate_db(instantiate(e1[2], tree[2]))
+        else:
+            result = tree_builtin(e1, tree[2], evaluate_db)
+            if result is None:
+                result = ('app', e1, tree[2])
+    elif tree[0] in ('plus', 'minus', 'times', 'leq'):
+        left = evaluate_db(tree[1])
+        right = evaluate_db(tree[2])
+        if left[0] == 'num' and right[0] == 'num':
+            result = ('num', arithmetic[tree[0]](left[1], right[1]))
+        else:
+            result = (tree[0], left, right)
+    elif tree[0] == 'neg':
+        operand = evaluate_db(tree[1])
+        if operand[0] == 'num':
+            result = ('num', -operand[1])
+        else:
+            result = ('neg', operand)
+    elif tree[0] == 'eq':
+        left = evaluate_db(tree[1])
+        right = evaluate_db(tree[2])
+        result = ('num', 1.0 if ast_equal(left, right) else 0.0)
+    elif tree[0] == 'if':
+        cond = evaluate_db(tree[1])
+        if cond[0] == 'num':
+            if cond[1] != 0:
+                result = evaluate_db(tree[2])
+            else:
+                result = evaluate_db(tree[3])
+        else:
+            result = ('if', cond, tree[2], tree[3])
+    elif tree[0] == 'let':
+        # let x = e1 in e2 --> (\x.e2) e1
+        result = evaluate_db(('app', ('lam', tree[1], tree[3]), tree[2]))
+    elif tree[0] == 'letrec':
+        # letrec f = e1 in e2 --> e2 [rec/0], e1 and e2 both see f as index 0
+        if stats is not None:
+            stats.counts['substitute'] += 1
+        result = evaluate_db(instantiate(tree[3], ('rec', tree[1], tree[2], Cell())))
+    elif tree[0] == 'rec':
+        # rec --> e1 [rec/0], evaluated once (see Cell)
+        cell = tree[3]
+        if cell.value is None:
+            if stats is not None:
+                stats.counts['unfold'] += 1
+                stats.counts['substitute'] += 1
+            cell.value = evaluate_db(instantiate(tree[2], tree))
+        result = cell.value
+    elif tree[0] == 'fix':
+        f = evaluate_db(tree[1])
+        if f[0] == 'lam':
+            result = evaluate_db(('rec', f[1], f[2], Cell()))
+        else:
+            result = evaluate_db(('app', f, ('fix', f)))
+    elif tree[0] == 'seq':
+        result = ('seq', evaluate_db(tree[1]), evaluate_db(tree[2]))
+    elif tree[0] == 'cons':
+        result = cons_value(evaluate_db(tree[1]), evaluate_db(tree[2]))
     elif tree[0] == 'hd':
-        return ('hd', substitute(tree[1], name, replacement))
+        expr = evaluate_db(tree[1])
+        result = list_head(expr)
+        if result is None:
+            result = ('hd', expr)
     elif tree[0] == 'tl':
-        return ('tl', substitute(tree[1], name, replacement))
+        expr = evaluate_db(tree[1])
+        result = list_tail(expr)
+        if result is None:
+            result = ('tl', expr)
     else:
-        raise Exception('Unknown tree', tree)
+        result = tree
+    if stats is not None:
+        stats.depth -= 1
+    return result
 
-def linearize(ast):
-    if ast[0] == 'var':
-        return ast[1]
-    elif ast[0] == 'lam':
-        return "(" + "\\" + ast[1] + "." + linearize(ast[2]) + ")"
-    elif ast[0] == 'app':
-        return "(" + linearize(ast[1]) + " " + linearize(ast[2]) + ")"
-    elif ast[0] == 'num':
-        # Format number: show as integer if whole number, otherwise as float
-        val = ast[1]
-        if val == int(val):
-            return str(int(val)) + ".0"
-        else:
-            return str(val)
-    elif ast[0] == 'plus':
-        return "(" + linearize(ast[1]) + " + " + linearize(ast[2]) + ")"
-    elif ast[0] == 'minus':
-        return "(" + linearize(ast[1]) + " - " + linearize(ast[2]) + ")"
-    elif ast[0] == 'times':
-        return "(" + linearize(ast[1]) + " * " + linearize(ast[2]) + ")"
-    elif ast[0] == 'neg':
-        return "(-" + linearize(ast[1]) + ")"
-    elif ast[0] == 'leq':
-        return "(" + linearize(ast[1]) + " <= " + linearize(ast[2]) + ")"
-    elif ast[0] == 'eq':
-        return "(" + linearize(ast[1]) + " == " + linearize(ast[2]) + ")"
-    elif ast[0] == 'if':
-        return "(if " + linearize(ast[1]) + " then " + linearize(ast[2]) + " else " + linearize(ast[3]) + ")"
-    elif ast[0] == 'let':
-        return "(let " + ast[1] + " = " + linearize(ast[2]) + " in " + linearize(ast[3]) + ")"
-    elif ast[0] == 'letrec':
-        return "(letrec " + ast[1] + " = " + linearize(ast[2]) + " in " + linearize(ast[3]) + ")"
-    elif ast[0] == 'fix':
-        return "(fix " + linearize(ast[1]) + ")"
-    elif ast[0] == 'seq':
-        return linearize(ast[1]) + " ;; " + linearize(ast[2])
-    elif ast[0] == 'cons':
-        return "(" + linearize(ast[1]) + " : " + linearize(ast[2]) + ")"
-    elif ast[0] == 'nil':
-        return "#"
-    elif ast[0] == 'hd':
-        return "(hd " + linearize(ast[1]) + ")"
-    elif ast[0] == 'tl':
-        return "(tl " + linearize(ast[1]) + ")"
+# rebuild names for linearize: binders keep their hint unless it would capture
+# a free variable or shadow an enclosing binder, then they get a fresh name
+def from_debruijn(tree, names=(), free=None):
+    if free is None:
+        free = free_names(tree)
+    if tree[0] == 'idx':
+        k = tree[1]
+        while k:
+            names = names[1]
+            k -= 1
+        return ('var', names[0])
+    elif tree[0] in ('lam', 'let', 'letrec'):
+        name = tree[1]
+        if name in free or in_scope(names, name):
+            name = name_generator.generate()
+        inner = (name, names)
+        if tree[0] == 'lam':
+            return ('lam', name, from_debruijn(tree[2], inner, free))
+        elif tree[0] == 'let':
+            return ('let', name, from_debruijn(tree[2], names, free), from_debruijn(tree[3], inner, free))
+        else:
+            return ('letrec', name, from_debruijn(tree[2], inner, free), from_debruijn(tree[3], inner, free))
+    elif tree[0] == 'rec':
+        return from_debruijn(('fix', ('lam', tree[1], tree[2])), names, free)
+    elif tree[0] in ('var', 'num', 'nil', 'packed'):
+        return tree
+    else:
+        return (tree[0],) + tuple(from_debruijn(child, names, free) for child in tree[1:])
+
+def in_scope(names, name):
+    while names:
+        if names[0] == name:
+            return True
+        names = names[1]
+    return False
+
+def free_names(tree, found=None):
+    if found is None:
+        found = set()
+    if tree[0] == 'var':
+        found.add(tree[1])
+    elif tree[0] in ('lam', 'rec'):
+        free_names(tree[2], found)
+    elif tree[0] in ('let', 'letrec'):
+        free_names(tree[2], found)
+        free_names(tree[3], found)
+    elif tree[0] not in ('idx', 'num', 'nil', 'packed'):
+        for child in tree[1:]:
+            free_names(child, found)
+    return found
+
+def evaluate_debruijn(tree):
+    return from_debruijn(evaluate_db(to_debruijn(tree)))
+
+engines = {
+    'substitution': evaluate,
+    'environment': evaluate_environment,
+    'debruijn': evaluate_debruijn,
+    'machine': evaluate_iterative,
+    'compiled': evaluate_compiled,
+    'python': evaluate_python,
+    'hashcons': evaluate_hashconsed,
+    'bytecode': evaluate_bytecode,
+}
+
+# engines that take need=True
+need_engines = {'environment', 'machine', 'compiled', 'bytecode'}
+
+# instrumentation
+# interpret(..., stats=Stats()) fills the Stats in with the wall time of every phase, what
+# evaluation did and how deep it went, exportable as JSON
+#   phases       seconds spent in parse (Lark), transform (CST to AST), optimize (see Optimizer),
+#                evaluate and linearize
+#   nodes        evaluations per node kind (not for the compiled, bytecode and python engines,
+#                which do not look at nodes while they run)
+#   counts       beta: beta reductions (closure calls for the environment engines)
+#                unfold: recursive bindings made by letrec and fix
+#                substitute: substitutions started (substitute or instantiate at the top)
+#                built: nodes made by substitution (the parts it shares are not counted)
+#                fresh_names: names made by name_generator
+#   max_depth    peak recursion depth of the evaluator (stack size for the machine)
+#   peak_memory  peak bytes allocated while evaluating, only with Stats(memory=True) as
+#                tracemalloc slows evaluation down several times
+# AST nodes are plain tuples, so there is no count of live nodes: built and peak_memory
+# stand in for it
+# the engines count when 'active_stats' is set, a test per node that costs little next to
+# the work done for the node, and no extra Python frames, so a run with stats recurses
+# exactly as deep as one without
+
+active_stats = None
+
+class Stats:
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.engine = None
+        self.parse_cache = None
+        self.phases = {'parse': 0.0, 'transform': 0.0, 'optimize': 0.0, 'evaluate': 0.0, 'linearize': 0.0}
+        self.nodes = Counter()
+        self.counts = Counter()
+        self.depth = 0
+        self.max_depth = 0
+        self.peak_memory = None
+
+    # called by an evaluator for every node, which lowers depth again when it returns
+    def enter(self, tag):
+        self.nodes[tag] += 1
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+
+    def to_dict(self):
+        return {
+            'engine': self.engine,
+            'parse_cache': self.parse_cache,
+            'phases_ms': {phase: round(seconds * 1000, 3) for phase, seconds in self.phases.items()},
+            'nodes': dict(self.nodes.most_common()),
+            'counts': {name: self.counts[name] for name in ('beta', 'unfold', 'substitute', 'built', 'fresh_names')},
+            'max_depth': self.max_depth,
+            'peak_memory': self.peak_memory,
+        }
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), indent=indent)
+
+    def report(self):
+        phases = ", ".join(f"{phase} {seconds * 1000:.2f} ms" for phase, seconds in self.phases.items())
+        counts = ", ".join(f"{name} {count}" for name, count in self.to_dict()['counts'].items())
+        return f"{phases}\n{sum(self.nodes.values())} nodes evaluated, {counts}, max depth {self.max_depth}"
+
+# the Stats of an enclosing run are put back afterwards, so runs may nest
+def evaluate_with_stats(run, ast, call_by_need, engine, stats):
+    global active_stats
+    stats.engine = engine
+    stats.depth = 0
+    fresh_names = name_generator.counter
+    outer = active_stats
+    active_stats = stats
+    tracing = stats.memory and not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        return run(ast, need=True) if call_by_need else run(ast)
+    finally:
+        stats.phases['evaluate'] = time.perf_counter() - start
+        if tracing:
+            stats.peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        active_stats = outer
+        stats.counts['fresh_names'] = name_generator.counter - fresh_names
+
+# profiling
+# profile_program runs a program on the machine and attributes its evaluation to the
+# functions bound by let and letrec: calls, evaluation steps (machine transitions) and wall
+# time, both inclusive (with the functions it calls) and exclusive (in the function itself)
+# a call of a curried function f = \x.\y.body starts when its last argument is supplied
+# and ends when the value of body returns; builtins are profiled as functions too, what
+# they apply runs inside them
+# the profile is kept per calling context, with direct recursion folded into one frame, and
+# written as collapsed stacks for flamegraph tools (flamegraph.pl, speedscope) or as Chrome
+# trace events (chrome://tracing, Perfetto)
+# the cost is constant per call: a clock read at the start and end of every call, no work
+# per step but a counter; trace events are kept for the first max_events calls only
+# the end of a call is marked by a frame on the machine stack, but a tail call of the function
+# running is counted on the frame of its caller, like direct recursion, so a letrec loop still
+# runs in constant space; other tail calls of profiled functions are not tail calls while profiling
+
+active_profile = None
+
+class FunctionProfile:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.0 # inclusive, counted for the outermost of recursive calls only
+        self.self_time = 0.0
+        self.steps = 0
+        self.self_steps = 0
+        self.active = 0
+
+class CallNode:
+    def __init__(self, name):
+        self.name = name
+        self.children = {}
+        self.self_time = 0.0
+        self.self_steps = 0
+
+class Profile:
+    def __init__(self, max_events=100000):
+        self.max_events = max_events
+        self.names = {} # id of the innermost body of a bound function -> name
+        self.functions = {}
+        self.root = CallNode('(program)')
+        self.stack = [] # [node, function, start, steps at start, time and steps of callees, event]
+        self.steps = 0
+        self.events = []
+        self.dropped_events = 0
+        self.start = self.time = 0.0
+
+    # find the functions bound by let and letrec in 'tree'
+    def name_functions(self, tree):
+        todo = [tree]
+        while todo:
+            tree = todo.pop()
+            if tree[0] in ('let', 'letrec') and tree[2][0] == 'lam':
+                body = tree[2]
+                while body[0] == 'lam':
+                    body = body[2]
+                self.names[id(body)] = tree[1]
+            todo += [child for child in tree[1:] if isinstance(child, tuple)]
+
+    def enter(self, name):
+        now = time.perf_counter()
+        parent = self.stack[-1][0] if self.stack else self.root
+        if parent.name == name:
+            node = parent # direct recursion
+        else:
+            node = parent.children.get(name)
+            if node is None:
+                node = parent.children[name] = CallNode(name)
+        function = self.functions.get(name)
+        if function is None:
+            function = self.functions[name] = FunctionProfile(name)
+        function.calls += 1
+        function.active += 1
+        event = None
+        if len(self.events) < self.max_events:
+            event = [name, now, None]
+            self.events.append(event)
+        else:
+            self.dropped_events += 1
+        self.stack.append([node, function, now, self.steps, 0.0, 0, event])
+
+    # a call made in tail position by the function of the innermost call, which it continues
+    def tail_call(self):
+        self.stack[-1][1].calls += 1
+
+    def leave(self):
+        now = time.perf_counter()
+        node, function, start, steps, callee_time, callee_steps, event = self.stack.pop()
+        elapsed, steps = now - start, self.steps - steps
+        node.self_time += elapsed - callee_time
+        node.self_steps += steps - callee_steps
+        function.self_time += elapsed - callee_time
+        function.self_steps += steps - callee_steps
+        function.active -= 1
+        if function.active == 0:
+            function.time += elapsed
+            function.steps += steps
+        if self.stack:
+            self.stack[-1][4] += elapsed
+            self.stack[-1][5] += steps
+        if event is not None:
+            event[2] = elapsed
+
+    # a builtin called by the machine, profiled under its name
+    def builtin(self, function, arg, need):
+        call = builtin_call(function, arg)
+        if call is None:
+            return None
+        self.enter(call[0])
+        try:
+            return env_builtin(function, arg, need, run_machine)
+        finally:
+            self.leave()
+
+    def run(self, tree, need=False):
+        global active_profile
+        self.name_functions(tree)
+        active_profile = self
+        self.start = time.perf_counter()
+        try:
+            return evaluate_machine(tree, need)
+        finally:
+            active_profile = None
+            self.time = time.perf_counter() - self.start
+            while self.stack: # an error ended the program
+                self.leave()
+            top = self.root.children.values()
+            self.root.self_time = self.time - sum(self.functions[node.name].time for node in top)
+            self.root.self_steps = self.steps - sum(self.functions[node.name].steps for node in top)
+
+    def to_dict(self):
+        return {
+            'time_ms': round(self.time * 1000, 3),
+            'steps': self.steps,
+            'functions': [{'name': f.name, 'calls': f.calls,
+                           'time_ms': round(f.time * 1000, 3), 'self_time_ms': round(f.self_time * 1000, 3),
+                           'steps': f.steps, 'self_steps': f.self_steps}
+                          for f in sorted(self.functions.values(), key=lambda f: -f.self_time)],
+            'dropped_events': self.dropped_events,
+        }
+
+    def report(self):
+        lines = [f"{'function':<20} {'calls':>9} {'self ms':>10} {'total ms':>10} {'self steps':>11} {'steps':>11} {'self %':>7}"]
+        for f in sorted(self.functions.values(), key=lambda f: -f.self_time):
+            share = 100 * f.self_time / self.time if self.time else 0.0
+            lines.append(f"{f.name:<20} {f.calls:>9} {f.self_time * 1000:>10.2f} {f.time * 1000:>10.2f} "
+                         f"{f.self_steps:>11} {f.steps:>11} {share:>6.1f}%")
+        lines.append(f"{'(program)':<20} {'':>9} {self.root.self_time * 1000:>10.2f} {self.time * 1000:>10.2f} "
+                     f"{self.root.self_steps:>11} {self.steps:>11}")
+        return "\n".join(lines)
+
+    # one line per calling context: frames separated by ';' and the exclusive time
+    # in microseconds, or the exclusive steps with weight='steps'
+    def write_collapsed(self, output, weight='time'):
+        todo = [(self.root, self.root.name)]
+        while todo:
+            node, path = todo.pop()
+            value = round(node.self_time * 1e6) if weight == 'time' else node.self_steps
+            if value > 0:
+                output.write(f"{path} {value}\n")
+            todo += [(child, path + ";" + child.name) for child in reversed(list(node.children.values()))]
+
+    def write_chrome_trace(self, output):
+        events = [{'name': name, 'ph': 'X', 'ts': round((start - self.start) * 1e6, 3),
+                   'dur': round(elapsed * 1e6, 3), 'pid': 1, 'tid': 1}
+                  for name, start, elapsed in self.events if elapsed is not None]
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                   'otherData': {'dropped_events': self.dropped_events}}, output)
+
+def profile_program(source_code, call_by_need=False, profile=None):
+    profile = profile or Profile()
+    value = profile.run(parse_cache.parse(source_code), call_by_need)
+    return linearize(readback(value)), profile
+
+# memoization
+# with memo, calls of functions bound by letrec are looked up in a cache before their body
+# is evaluated: for f = \x.\y.body the key is f's closure and the values of x and y,
+# interned by hashcons so that equal lists share one node and compare by identity
+# looking a call up evaluates nothing: it is looked up only if the values of its arguments
+# are known already (see known_value), otherwise it is skipped and runs as without memo,
+# so an argument the body does not use is never evaluated
+# a function given an argument that is not data (a number or a list of data, e.g. a
+# function) is no longer memoized, the call goes on as usual
+# only for the engines of closures (need_engines), a call of f is the application of the
+# closure of its innermost lambda, recognized by the identity of its body
+# the cache is an LRU of 'size' results shared by all functions
+
+active_memo = None
+
+class MemoFunction:
+    def __init__(self, name, arity, body):
+        self.name = name
+        self.arity = arity
+        self.body = body # keeps the id of body in Memo.functions valid
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0 # calls with an argument not evaluated yet
+        self.disabled = None # why memoization was turned off
+
+class Memo:
+    def __init__(self, names=None, size=10000):
+        self.names = names # names of the functions to memoize, None for all
+        self.size = size
+        self.functions = {} # id of the innermost body -> MemoFunction
+        self.entries = OrderedDict() # key -> (pinned objects, result)
+        self.evictions = 0
+
+    def register(self, tree):
+        todo = [tree]
+        while todo:
+            tree = todo.pop()
+            if tree[0] == 'letrec' and tree[2][0] == 'lam' and (self.names is None or tree[1] in self.names):
+                body, arity = tree[2], 0
+                while body[0] == 'lam':
+                    body, arity = body[2], arity + 1
+                self.functions[id(body)] = MemoFunction(tree[1], arity, body)
+            todo += reversed([child for child in tree[1:] if isinstance(child, tuple)]) # in source order
+
+    # (key, env, cached result) of a call of the function with 'body', whose arguments are
+    # bound in 'env' (returned as it is), the key is None if the call is not memoized
+    def prepare(self, body, env):
+        function = self.functions[id(body)]
+        if function.disabled is not None:
+            return None, env, None
+        interned_values = []
+        outer = env
+        for _ in range(function.arity):
+            value = known_value(outer[1])
+            if value is None:
+                function.skipped += 1
+                return None, env, None
+            interned = intern_value(value)
+            if interned is None:
+                function.disabled = f"argument {outer[0]} is not data"
+                return None, env, None
+            interned_values.append(interned)
+            outer = outer[2]
+        # outer is where f was defined
+        lookup = (id(body), id(outer)) + tuple(id(interned) for interned in interned_values)
+        entry = self.entries.get(lookup)
+        if entry is not None:
+            function.hits += 1
+            self.entries.move_to_end(lookup)
+            return None, env, entry[1]
+        function.misses += 1
+        return (lookup, (outer, interned_values)), env, None
+
+    def store(self, key, result):
+        # the key holds ids, the entry keeps their objects alive so no id is reused
+        lookup, pinned = key
+        self.entries[lookup] = (pinned, result)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # run(env) evaluates the body
+    def call(self, body, env, run):
+        key, env, cached = self.prepare(body, env)
+        if cached is not None:
+            return cached
+        result = run(env)
+        if key is not None:
+            self.store(key, result)
+        return result
+
+    def to_dict(self):
+        return {
+            'size': self.size,
+            'entries': len(self.entries),
+            'evictions': self.evictions,
+            'functions': [{'name': f.name, 'hits': f.hits, 'misses': f.misses, 'skipped': f.skipped,
+                           'hit_rate': round(f.hits / (f.hits + f.misses), 4) if f.hits + f.misses else 0.0,
+                           'disabled': f.disabled}
+                          for f in self.functions.values()],
+        }
+
+    def report(self):
+        lines = []
+        for f in self.functions.values():
+            calls = f.hits + f.misses
+            rate = f.hits / calls if calls else 0.0
+            line = f"memo {f.name}: {f.hits} hits, {f.misses} misses, {f.skipped} skipped, hit rate {rate:.1%}"
+            lines.append(line + (f", off: {f.disabled}" if f.disabled else ""))
+        lines.append(f"memo cache: {len(self.entries)}/{self.size} results, {self.evictions} evicted")
+        return "\n".join(lines)
+
+# the value of an argument if it is known without evaluating anything that could fail or not
+# terminate: a value, a forced thunk, or a thunk of a number, #, a lambda, or of arithmetic,
+# ==, :, hd and tl on such terms; None if something would have to be evaluated (a call, say),
+# or it is further than 'limit' thunks away
+def known_value(value, limit=50):
+    if not isinstance(value, Thunk):
+        return value
+    if value.value is not None:
+        return value.value
+    if isinstance(value, Speculated):
+        return value.result
+    if value.tree is None or limit == 0:
+        return None
+    return known_term(value.tree, value.env, limit - 1)
+
+def known_term(tree, env, limit):
+    tag = tree[0]
+    if tag == 'var':
+        value = lookup(env, tree[1])
+        return tree if value is None else known_value(value, limit) # a free variable is stuck
+    elif tag == 'lam':
+        return ('closure', tree[1], tree[2], env)
+    elif tag in ('num', 'nil', 'packed'):
+        return tree
+    elif tag not in arithmetic and tag not in ('eq', 'cons', 'neg', 'hd', 'tl'):
+        return None
+    operands = []
+    for child in tree[1:]:
+        operand = known_term(child, env, limit)
+        if operand is None:
+            return None
+        operands.append(operand)
+    if tag in arithmetic:
+        left, right = operands
+        if left[0] == 'num' and right[0] == 'num':
+            return ('num', arithmetic[tag](left[1], right[1]))
+    elif tag == 'eq':
+        return ('num', 1.0 if values_equal(operands[0], operands[1]) else 0.0)
+    elif tag == 'cons':
+        return cons_value(operands[0], operands[1])
+    elif tag == 'neg':
+        if operands[0][0] == 'num':
+            return ('num', -operands[0][1])
     else:
-        return str(ast)
+        return (list_head if tag == 'hd' else list_tail)(operands[0])
+    return None # stuck
+
+# the interned node of a number or a list of data (see HashConsing.make), None for other values
+def intern_value(value):
+    make = hashcons.make
+    if value[0] == 'num':
+        return make('num', value[1])
+    elements = list_elements(value)
+    if elements is None:
+        return None
+    result = make('nil')
+    for element in reversed(elements):
+        element = intern_value(element)
+        if element is None:
+            return None
+        result = make('cons', element, result)
+    return result
+
+# memo: a Memo, True to memoize every letrec function or a collection of their names
+def evaluate_memoized(ast, engine=None, call_by_need=False, memo=True):
+    global active_memo
+    engine = engine or 'environment'
+    if engine not in need_engines:
+        raise ValueError(f"engine {engine!r} does not support memoization")
+    if not isinstance(memo, Memo):
+        memo = Memo(None if memo is True else set(memo))
+    memo.register(ast)
+    active_memo = memo
+    try:
+        return engines[engine](ast, need=call_by_need)
+    finally:
+        active_memo = None
+
+# the text of a value is produced as a stream of pieces, in order
+# the tree is walked with an explicit stack of nodes still to print and of text
+# still to close them with, so deep terms, long lists and long ;; chains need no
+# Python recursion, and every piece is made once, so the work is linear in the output
+def linearize_parts(ast):
+    stack = [ast]
+    while stack:
+        ast = stack.pop()
+        if type(ast) is str:
+            yield ast
+        elif ast[0] == 'var':
+            yield ast[1]
+        elif ast[0] == 'lam':
+            yield "(" + "\\" + ast[1] + "."
+            stack += (")", ast[2])
+        elif ast[0] == 'app':
+            yield "("
+            stack += (")", ast[2], " ", ast[1])
+        elif ast[0] == 'num':
+            yield format_number(ast[1])
+        elif ast[0] in infix_operators:
+            yield "("
+            stack += (")", ast[2], infix_operators[ast[0]], ast[1])
+        elif ast[0] == 'neg':
+            yield "(-"
+            stack += (")", ast[1])
+        elif ast[0] == 'if':
+            yield "(if "
+            stack += (")", ast[3], " else ", ast[2], " then ", ast[1])
+        elif ast[0] in ('let', 'letrec'):
+            yield "(" + ast[0] + " " + ast[1] + " = "
+            stack += (")", ast[3], " in ", ast[2])
+        elif ast[0] == 'fix':
+            yield "(fix "
+            stack += (")", ast[1])
+        elif ast[0] == 'rec':
+            yield "(fix (" + "\\" + ast[1] + "."
+            stack += ("))", ast[2])
+        elif ast[0] == 'seq':
+            stack += (ast[2], " ;; ", ast[1])
+        elif ast[0] == 'cons':
+            # the numbers of a list are printed in one go, other elements through the stack
+            closing = 0
+            while ast[0] == 'cons' and ast[1][0] == 'num':
+                yield "(" + format_number(ast[1][1]) + " : "
+                closing += 1
+                ast = ast[2]
+            if closing:
+                stack.append(")" * closing)
+            if ast[0] == 'cons':
+                yield "("
+                stack += (")", ast[2], " : ", ast[1])
+            else:
+                stack.append(ast)
+        elif ast[0] == 'packed':
+            values = ast[1]
+            for i in range(ast[2] - 1, -1, -1):
+                yield "(" + format_number(values[i]) + " : "
+            yield "#" + ")" * ast[2]
+        elif ast[0] == 'nil':
+            yield "#"
+        elif ast[0] == 'hd':
+            yield "(hd "
+            stack += (")", ast[1])
+        elif ast[0] == 'tl':
+            yield "(tl "
+            stack += (")", ast[1])
+        else:
+            yield str(ast)
+
+infix_operators = {'plus': " + ", 'minus': " - ", 'times': " * ", 'leq': " <= ", 'eq': " == "}
+
+# Format number: show as integer if whole number, otherwise as float
+def format_number(val):
+    if val == int(val):
+        return str(int(val)) + ".0"
+    else:
+        return str(val)
+
+def linearize(ast):
+    return "".join(linearize_parts(ast))
+
+# write the text of a value to a file, in blocks of 'block' pieces, so the whole
+# text is never held in memory at once
+def write_linearized(ast, output, block=4096):
+    parts = []
+    for part in linearize_parts(ast):
+        parts.append(part)
+        if len(parts) >= block:
+            output.write("".join(parts))
+            parts.clear()
+    output.write("".join(parts))
+
+# long-lived mode: one program per line of 'lines', one result per line of 'output'
+# the parser, transformer and caches are made once and used for every program
+# a program that fails is answered with "Error: <first line of the message>" and the
+# next one is run, output is flushed after every line so a program can be driven through a pipe
+# with json_lines every line is a JSON string or an object with "expression" (and an
+# optional "id", copied to the answer), every answer an object with "result" or "error"
+def run_batch(lines, output, engine=None, call_by_need=False, json_lines=False, timing=False):
+    failures = 0
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        answer = {}
+        start = time.perf_counter()
+        try:
+            request = json.loads(line) if json_lines else line
+            if isinstance(request, dict):
+                if 'id' in request:
+                    answer['id'] = request['id']
+                request = request['expression']
+            answer['result'] = interpret(request, engine=engine, call_by_need=call_by_need)
+        except Exception as e:
+            message = str(e).strip().splitlines()
+            answer['error'] = message[0] if message else type(e).__name__
+            failures += 1
+        elapsed = (time.perf_counter() - start) * 1000
+        if json_lines:
+            if timing:
+                answer['time_ms'] = round(elapsed, 3)
+            output.write(json.dumps(answer) + "\n")
+        else:
+            text = answer['result'] if 'result' in answer else "Error: " + answer['error']
+            if timing:
+                text += f"\t{elapsed:.3f} ms"
+            output.write(text + "\n")
+        output.flush()
+    return failures
 
 def main():
-    import sys
-    if len(sys.argv) != 2:
-        #print("Usage: python interpreter.py <filename or expression>", file=sys.stderr)
-        sys.exit(1)
+    import argparse
+    arg_parser = argparse.ArgumentParser(description="lambdaF interpreter")
+    arg_parser.add_argument('input', nargs='?', help="filename or expression (default: read programs from stdin, one per line)")
+    arg_parser.add_argument('--engine', choices=sorted(engines), help="evaluation engine (default: substitution)")
+    arg_parser.add_argument('--need', action='store_true', help="call-by-need: evaluate each argument at most once")
+    arg_parser.add_argument('--dump-python', action='store_true', help="print the Python source generated for the program")
+    arg_parser.add_argument('--dump-bytecode', action='store_true', help="print the bytecode of the program (see --engine bytecode)")
+    arg_parser.add_argument('--ast-cache', metavar='DIR', help="keep parsed programs in DIR and reuse them on later runs")
+    arg_parser.add_argument('--json', action='store_true', help="read and write JSON lines on stdin/stdout")
+    arg_parser.add_argument('--time', action='store_true', help="report the time taken by every program read from stdin")
+    arg_parser.add_argument('--stats', action='store_true', help="print the time of every phase and counters of the evaluation as JSON on stderr")
+    arg_parser.add_argument('--memory', action='store_true', help="with --stats, also measure peak memory (slower)")
+    arg_parser.add_argument('--optimize', action='store_true', help="optimize the program before evaluating it and report the rewrites on stderr")
+    arg_parser.add_argument('--passes', help=f"optimizer passes (comma separated, default: {','.join(optimizer_passes)}), implies --optimize")
+    arg_parser.add_argument('--memo', action='store_true', help="cache the results of letrec functions and report hit rates on stderr")
+    arg_parser.add_argument('--memo-functions', metavar='NAMES', help="only memoize these letrec functions (comma separated, implies --memo)")
+    arg_parser.add_argument('--memo-size', type=int, default=10000, help="results kept by --memo (default: 10000)")
+    arg_parser.add_argument('--profile', action='store_true', help="run on the machine and print the time and steps of every function on stderr")
+    arg_parser.add_argument('--flamegraph', metavar='FILE', help="write the collapsed stacks of the profile to FILE (implies --profile)")
+    arg_parser.add_argument('--trace', metavar='FILE', help="write the calls of the profile to FILE as Chrome trace events (implies --profile)")
+    args = arg_parser.parse_args()
+    if args.need and (args.engine or 'environment') not in need_engines:
+        arg_parser.error(f"--need is not supported by the {args.engine} engine")
 
-    input_arg = sys.argv[1]
+    parse_cache.directory = args.ast_cache
+    if args.input is None:
+        failures = run_batch(sys.stdin, sys.stdout, args.engine, args.need, args.json, args.time)
+        sys.exit(1 if failures else 0)
+
+    input_arg = args.input
 
     if os.path.isfile(input_arg):
         # If the input is a valid file path, read from the file
@@ -358,8 +3148,48 @@ def main():
         # Otherwise, treat the input as a direct expression
         expression = input_arg
 
-    result = interpret(expression)
-    print(f"\033[95m{result}\033[0m")
+    if args.dump_python:
+        print(python_source(expression))
+    if args.dump_bytecode:
+        print(disassemble(expression, args.need))
+    if args.profile or args.flamegraph or args.trace:
+        result, profile = profile_program(expression, call_by_need=args.need)
+        print(f"\033[95m{result}\033[0m")
+        print(profile.report(), file=sys.stderr)
+        if args.flamegraph:
+            with open(args.flamegraph, 'w') as file:
+                profile.write_collapsed(file)
+        if args.trace:
+            with open(args.trace, 'w') as file:
+                profile.write_chrome_trace(file)
+        return
+    memo = None
+    if args.memo or args.memo_functions:
+        memo = Memo(set(args.memo_functions.split(',')) if args.memo_functions else None, args.memo_size)
+    optimizer = None
+    if args.optimize or args.passes is not None:
+        try:
+            optimizer = Optimizer([name for name in args.passes.split(',') if name] if args.passes is not None else optimizer_passes)
+        except ValueError as e:
+            arg_parser.error(str(e))
+    reports = [part for part in (optimizer, memo) if part is not None]
+    if args.stats:
+        stats = Stats(args.memory)
+        result = interpret(expression, engine=args.engine, call_by_need=args.need, stats=stats,
+                           memo=memo, optimize=optimizer)
+        print(f"\033[95m{result}\033[0m")
+        print(stats.to_json(indent=1), file=sys.stderr)
+        for part in reports:
+            print(part.report(), file=sys.stderr)
+        return
+
+    # the result is written while it is linearized, not built as one string first
+    result_ast = evaluate_program(expression, engine=args.engine, call_by_need=args.need, memo=memo, optimize=optimizer)
+    sys.stdout.write("\033[95m")
+    write_linearized(result_ast, sys.stdout)
+    sys.stdout.write("\033[0m\n")
+    for part in reports:
+        print(part.report(), file=sys.stderr)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
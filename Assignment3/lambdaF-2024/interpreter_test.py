@@ -1,5 +1,20 @@
 from interpreter import interpret, substitute, evaluate, LambdaCalculusTransformer, parser, linearize
+from interpreter import evaluate_env, readback, to_debruijn, from_debruijn, Thunk, compile_program
+from interpreter import generate_python, compile_python, python_source, NotCompilable
+from interpreter import Stuck, Cons, NIL, truth, head, tail
+from interpreter import hashcons, evaluate_hc, HashConsing, free_vars, name_generator, Cell, GRAMMAR_PATH
+from interpreter import ParseCache, run_batch, write_linearized, evaluate_program
+from interpreter import engines, cons_value, list_tail, ast_equal, Stats, profile_program, Profile, Memo, Optimizer
+from interpreter import compile_bytecode, disassemble
+import interpreter
+from run_corpus import read_corpus, run_corpus
 from lark import Lark, Transformer
+import os
+import subprocess
+import sys
+import tempfile
+import io
+import json
 from colorama import Fore, Style
 
 # for testing the grammar, the parser and the conversion to ASTs
@@ -260,6 +275,813 @@ def test_milestone3():
     
     print(f"\n{BLUE}Milestone 3: {passed}/{len(tests)} tests passed{RESET}\n")
 
+# result of test.lc (see README.md)
+TEST_LC_RESULT = "120.0 ;; 55.0 ;; (1.0 : (3.0 : (3.0 : (4.0 : (5.0 : #)))))"
+
+def test_environment():
+    """The environment-based engine gives the same results as substitution"""
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    tests = [
+        r"\x.(\y.y)x",
+        r"(\x.a x) ((\x.x)b)",
+        r"(\x.\y.x + y) 3 4",
+        r"(\x.y) ((\x.x x) (\x.x x))",
+        r"let f = \x.x*6 in let f = \x.x+1 in f (f 2) + 10",
+        r"letrec f = \n. if n==0 then 1 else n*f(n-1) in f 4",
+        r"(\x. if a then x else 2) 1",
+        r"1+1 ;; (\x.x)a ;; (\x.x+x)2",
+        r"(1-2) : (2+2) : # == (-1):4:#",
+        r"tl a",
+        r"letrec map = \f. \xs. if xs==# then # else (f (hd xs)) : (map f (tl xs)) in (map (\x.x+1) (1:2:3:#))",
+    ]
+
+    for input_expr in tests:
+        expected = interpret(input_expr)
+        assert interpret(input_expr, engine='environment') == expected
+        print(f"ENV {MAGENTA}{input_expr}{RESET} == {expected}")
+    assert interpret(open("test.lc").read(), engine='environment') == TEST_LC_RESULT
+
+    # closures keep their environment, readback substitutes it into the body
+    assert evaluate_env(ast(r"(\x.\y.x) a"))[0] == 'closure'
+    assert readback(evaluate_env(ast(r"(\x.\y.x) a")))[2] == ('var', 'a')
+
+    print("\nevaluate_env(): All tests passed!\n")
+
+def test_debruijn():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # bound variables become indices, free variables keep their names
+    assert to_debruijn(ast(r"\x.\y.x y z")) == ('lam', 'x', ('lam', 'y', ('app', ('app', ('idx', 1), ('idx', 0)), ('var', 'z'))))
+    print(f"DB {MAGENTA}\\x.\\y.x y z{RESET} == \\.\\.1 0 z")
+
+    assert to_debruijn(ast(r"letrec f = \n. f n in f")) == ('letrec', 'f', ('lam', 'n', ('app', ('idx', 1), ('idx', 0))), ('idx', 0))
+    print(f"DB {MAGENTA}letrec f = \\n. f n in f{RESET} == letrec (\\.1 0) in 0")
+
+    # names are rebuilt from the hints, renaming only where a hint would capture
+    assert linearize(from_debruijn(to_debruijn(ast(r"\x.(\y.y)x")))) == r"(\x.((\y.y) x))"
+    assert interpret(r"(\x.\y.x) a", engine='debruijn') == r"(\y.a)"
+    assert interpret(r"(\x.\y.x y) y", engine='debruijn') != r"(\y.(y y))"
+    print(f"DB {MAGENTA}(\\x.\\y.x) a{RESET} == (\\y.a)")
+
+    for input_expr in [r"(\x.x * x) 2 * 3", r"let f = \x.x*6 in let f = \x.x+1 in f (f 2) + 10"]:
+        assert interpret(input_expr, engine='debruijn') == interpret(input_expr)
+    assert interpret(open("test.lc").read(), engine='debruijn') == TEST_LC_RESULT
+
+    print("\nevaluate_db(): All tests passed!\n")
+
+def test_call_by_need():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # a shared thunk remembers its value, a call-by-name thunk does not
+    shared = Thunk(ast(r"1+2"), (), shared=True)
+    assert shared.force() == ('num', 3.0) and shared.value == ('num', 3.0)
+    assert Thunk(ast(r"1+2"), ()).force() == ('num', 3.0) and Thunk(ast(r"1+2"), ()).value is None
+
+    tests = [
+        (r"(\x.y) ((\x.x x) (\x.x x))", "y"),
+        (r"(\x.a x) ((\x.x)b)", r"(a ((\x.x) b))"),
+        (r"letrec fib = \n. if n <= 1 then n else fib (n-1) + fib (n-2) in (\x.x*x*x) (fib 10)", "166375.0"),
+        (r"let f = \x.x*6 in let f = \x.x+1 in f (f 2) + 10", "14.0"),
+        (open("test.lc").read(), TEST_LC_RESULT),
+    ]
+    for input_expr, expected in tests:
+        assert interpret(input_expr, call_by_need=True) == expected
+        print(f"NEED {MAGENTA}{input_expr}{RESET} == {expected}")
+
+    print("\ncall-by-need: All tests passed!\n")
+
+def test_machine():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    tests = [
+        r"\x.(\y.y)x",
+        r"(\x.a x) ((\x.x)b)",
+        r"(\x.y) ((\x.x x) (\x.x x))",
+        r"(if 1 == 1 then \x.x+1 else \x.x+2) 5 + 10",
+        r"(\x. if a then x else 2) 1",
+        r"1+1 ;; (\x.x)a ;; (\x.x+x)2",
+        r"(1-2) : (2+2) : # == (-1):4:#",
+        r"hd a",
+        r"letrec f = \n. if n==0 then 0 else 1 + 2*(n-1) + f(n-1) in f 6",
+    ]
+    for input_expr in tests:
+        expected = interpret(input_expr)
+        assert interpret(input_expr, engine='machine') == expected
+        assert interpret(input_expr, engine='machine', call_by_need=True) == expected
+        print(f"MACHINE {MAGENTA}{input_expr}{RESET} == {expected}")
+    assert interpret(open("test.lc").read(), engine='machine') == TEST_LC_RESULT
+
+    # far deeper than the Python recursion limit
+    loop = r"letrec loop = \n. if n == 0 then 42 else loop (n-1) in loop 20000"
+    assert interpret(loop, engine='machine', call_by_need=True) == "42.0"
+    print(f"MACHINE {MAGENTA}{loop}{RESET} == 42.0")
+
+    long_list = r"letrec range = \n. if n == 0 then # else n : (range (n-1)) in "
+    length = r"letrec len = \xs.\acc. if xs == # then acc else len (tl xs) (acc+1) in len (range 20000) 0"
+    assert interpret(long_list + length, engine='machine', call_by_need=True) == "20000.0"
+    assert interpret(long_list + "range 20000", engine='machine', call_by_need=True).startswith("(20000.0 : (19999.0 : ")
+    print(f"MACHINE {MAGENTA}len (range 20000) 0{RESET} == 20000.0")
+
+    print("\nevaluate_machine(): All tests passed!\n")
+
+def test_compile_program():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    tests = [
+        (r"\x.(\y.y)x", r"(\x.((\y.y) x))"),
+        (r"(\x.a x) ((\x.x)b)", r"(a ((\x.x) b))"),
+        (r"(\x.x) (1---2)", "-1.0"),
+        (r"(\x.x * x) (-2) * (-3)", "-12.0"),
+        (r"if 0 then 2 else if 1 then 3 else 4", "3.0"),
+        (r"let f = \x.x*6 in let f = \x.x+1 in f (f 2) + 10", "14.0"),
+        (r"letrec f = \n. if n==0 then 1 else n*f(n-1) in f 4", "24.0"),
+        (r"(if 1 == 1 then \x.x+1 else \x.x+2) 5 + 10", "16.0"),
+        (r"1+1 ;; (\x.x)a ;; (\x.x+x)2", "2.0 ;; a ;; 4.0"),
+        (r"(\x.\y.x) 1:# a", "(1.0 : #)"),
+        (r"1:2 == 1:3", "0.0"),
+        (r"tl a", "(tl a)"),
+        (r"letrec map = \f. \xs. if xs==# then # else (f (hd xs)) : (map f (tl xs)) in (map (\x.x+1) (1:2:3:#))", "(2.0 : (3.0 : (4.0 : #)))"),
+        (open("test.lc").read(), TEST_LC_RESULT),
+    ]
+    for input_expr, expected in tests:
+        program = compile_program(input_expr)
+        assert program() == expected
+        assert program() == expected # a compiled program can be run again
+        assert compile_program(input_expr, call_by_need=True)() == expected
+        print(f"COMPILED {MAGENTA}{input_expr}{RESET} == {expected}")
+
+    print("\ncompile_program(): All tests passed!\n")
+
+def test_python_codegen():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # letrec becomes a def, if a Python conditional, arithmetic works on floats
+    fib = r"letrec fib = \n. if n <= 1 then n else fib (n-1) + fib (n-2) in fib 15"
+    source = generate_python(ast(fib))
+    assert "def fib_1(n_2):" in source and "if n_2 <= 1.0:" in source
+    assert compile_python(ast(fib)) is compile_python(ast(fib)) # compiled once
+    assert interpret(fib, engine='python') == "610.0"
+    print(f"PYTHON {MAGENTA}{fib}{RESET} == 610.0")
+
+    assert interpret(open("test.lc").read(), engine='python') == TEST_LC_RESULT
+    assert python_source(open("test.lc").read()).count("def main():") == 3
+
+    # outside the compilable subset or stuck at run time: the result of evaluate
+    tests = [
+        r"\x.(\y.y)x",
+        r"(\x.y) ((\x.x x) (\x.x x))",
+        r"letrec map = \f. \xs. if xs==# then # else (f (hd xs)) : (map f (tl xs)) in (map (\x.x+1) (1:2:3:#))",
+        r"letrec f = \x.\y. x in f 1 (hd #)",
+        r"letrec f = \x. if x then 1 else 2 in f (1:#)",
+        r"let x = 1 in let x = x + 1 in x : x * 10 : #",
+        r"letrec f = \x. x + 1 in f (1:#)",
+        r"letrec f = \x. 2 * x in f #",
+        r"letrec f = \x. if 1 <= x then 1 else 2 in f (1:#)",
+        r"letrec f = \x. hd x in f 3",
+        r"letrec f = \x. tl x in f #",
+    ]
+    for input_expr in tests:
+        expected = interpret(input_expr)
+        assert interpret(input_expr, engine='python') == expected
+        print(f"PYTHON {MAGENTA}{input_expr}{RESET} == {expected}")
+
+    # the generated code signals a stuck term with Stuck, any other exception is a bug
+    namespace = {'Cons': Cons, 'NIL': NIL, 'truth': truth, 'head': head, 'tail': tail}
+    exec(compile_python(ast(r"letrec f = \x. x - 1 in f (hd (2:#) : #)")), namespace)
+    try:
+        namespace['main']()
+        assert False
+    except Stuck:
+        pass
+
+    try:
+        generate_python(ast(r"\x.x"))
+        assert False
+    except NotCompilable:
+        pass
+
+    print("\nPython code generation: All tests passed!\n")
+
+def test_hashcons():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    tests = [
+        r"(\x.a x) ((\x.x)b)",
+        r"(\x.\y.x + y) 3 4",
+        r"1:2 == 1:2",
+        r"1:2 == 1:3",
+        r"(1-2) : (2+2) : # == (-1):4:#",
+        r"(\x.x) == (\x.x)",
+        r"letrec map = \f. \xs. if xs==# then # else (f (hd xs)) : (map f (tl xs)) in (map (\x.x+1) (1:2:3:#))",
+    ]
+    for input_expr in tests:
+        expected = interpret(input_expr)
+        assert interpret(input_expr, engine='hashcons') == expected
+        print(f"HASHCONS {MAGENTA}{input_expr}{RESET} == {expected}")
+
+    # equal lists are one object
+    hashcons.clear()
+    pair = evaluate_hc(ast(r"(1:2:#) : ((0+1):(1+1):#) : #"))
+    assert pair[1] is pair[2][1]
+    assert hashcons.hits > 0 and 0 < hashcons.hit_rate() < 1
+    print(f"HASHCONS {MAGENTA}{hashcons.report()}{RESET}")
+
+    # == stays correct when a new generation starts between two equal lists
+    small = HashConsing(limit=2)
+    a = small.make('cons', small.make('num', 1.0), small.make('nil'))
+    b = small.make('cons', small.make('num', 1.0), small.make('nil'))
+    assert small.generations > 1 and a is not b and a == b
+
+    print("\nhash-consing: All tests passed!\n")
+
+def test_shared_substitution():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # free variables, binders of let and letrec included
+    assert free_vars(ast(r"\x.x y")) == {'y'}
+    assert free_vars(ast("let x = x in x y")) == {'x', 'y'}
+    assert free_vars(ast("letrec f = f x in f")) == {'x'}
+    print(f"FREE {MAGENTA}\\x.x y, let x = x in x y, letrec f = f x in f{RESET} == y, x y, x")
+
+    # a subtree without the name is not copied
+    tree = ast(r"(\z.z) (a b) x")
+    result = substitute(tree, 'x', ('num', 1.0))
+    assert result[1] is tree[1]
+    print(f"SHARE {MAGENTA}((\\z.z) (a b) x) [1/x]{RESET} keeps ((\\z.z) (a b))")
+
+    # no fresh name unless the replacement could be captured
+    counter = name_generator.counter
+    assert substitute(ast(r"\y.x y"), 'x', ('var', 'z')) == ast(r"\y.z y")
+    assert substitute(ast("let y = x in x y"), 'x', ('num', 2.0)) == ast("let y = 2 in 2 y")
+    assert name_generator.counter == counter
+    assert substitute(ast(r"\y.x y"), 'x', ('var', 'y'))[1] != 'y'
+    assert name_generator.counter == counter + 1
+    print(f"SUBST {MAGENTA}(\\y.x y) [z/x]{RESET} == (\\y.z y) without renaming")
+
+    # results of the substitution engine are unchanged
+    assert interpret(open("test.lc").read()) == TEST_LC_RESULT
+    print(f"EVAL {MAGENTA}test.lc{RESET} == {TEST_LC_RESULT}")
+
+    print("\nAll tests passed!")
+
+def test_recursive_bindings():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # letrec substitutes a back-pointer, the body of f is not copied into itself
+    value = evaluate(ast(r"letrec f = \x. f x in f"))
+    assert value[0] == 'lam' and value[2][1][0] == 'rec' and isinstance(value[2][1][3], Cell)
+    print(f"EVAL {MAGENTA}letrec f = \\x. f x in f{RESET} refers to f through a rec node")
+
+    # the environment of a letrec closure is a cycle
+    closure = evaluate_env(ast(r"letrec f = \x. f x in f"), (), True)
+    frame = closure[3]
+    assert frame[0] == 'f' and frame[1].force() is closure and frame[1].env is None
+    print(f"EVAL {MAGENTA}letrec f = \\x. f x in f{RESET} closure environment refers to itself")
+
+    tests = [
+        (r"letrec fib = \n. if n <= 1 then n else fib (n-1) + fib (n-2) in fib 15", "610.0"),
+        (r"(fix (\f.\n. if n <= 0 then 0 else n + f (n-1))) 100", "5050.0"),
+        (r"letrec even = \n. if n == 0 then 1 else if n == 1 then 0 else even (n-2) in even 10", "1.0"),
+        (r"(\y. letrec f = \x. y in f 1) 5", "5.0"),
+        (r"letrec f = \x. f in f 1", r"(\x.(fix (\f.(\x.f))))"),
+    ]
+    for source_code, expected in tests:
+        assert interpret(source_code) == expected
+        if not expected.startswith('('):
+            # functions are printed with other binder names by the other engines
+            for engine in ('environment', 'debruijn', 'machine', 'compiled', 'hashcons'):
+                assert interpret(source_code, engine=engine) == expected
+            for engine in ('environment', 'machine', 'compiled'):
+                assert interpret(source_code, engine=engine, call_by_need=True) == expected
+        print(f"EVAL {MAGENTA}{source_code}{RESET} == {expected}")
+
+    print("\nAll tests passed!")
+
+def test_parser_cache():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # the grammar is found next to interpreter.py and its tables are cached there
+    assert os.path.isabs(GRAMMAR_PATH) and os.path.exists(GRAMMAR_PATH + ".cache")
+    print(f"CACHE {MAGENTA}{GRAMMAR_PATH}.cache{RESET} exists")
+
+    # running from another directory works
+    script = os.path.join(os.path.dirname(GRAMMAR_PATH), "interpreter.py")
+    output = subprocess.run([sys.executable, script, "1 + 2"], cwd=os.path.dirname(os.path.dirname(GRAMMAR_PATH)),
+                            capture_output=True, text=True, check=True).stdout
+    assert "3.0" in output
+    print(f"RUN {MAGENTA}interpreter.py \"1 + 2\"{RESET} from the parent directory == 3.0")
+
+    print("\nAll tests passed!")
+
+def test_parse_cache():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    cache = ParseCache(size=2)
+    first = cache.parse("1 + 2")
+    assert cache.parse("1 + 2") is first and (cache.hits, cache.misses) == (1, 1)
+    print(f"PARSE {MAGENTA}1 + 2{RESET} twice: 1 miss, 1 hit")
+
+    # least recently used source is dropped
+    cache.parse("3")
+    cache.parse("4")
+    assert cache.parse("1 + 2") is not first and cache.misses == 4
+    print(f"PARSE {MAGENTA}1 + 2{RESET} after two other sources with size 2: parsed again")
+
+    # ASTs on disk are reused by a fresh cache
+    with tempfile.TemporaryDirectory() as directory:
+        source_code = open("test.lc").read()
+        ParseCache(directory=directory).parse(source_code)
+        other = ParseCache(directory=directory)
+        assert other.parse(source_code) == ast(source_code) and other.disk_hits == 1 and other.misses == 0
+    print(f"PARSE {MAGENTA}test.lc{RESET} from the disk cache == parsed AST")
+
+    print("\nAll tests passed!")
+
+def test_batch():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # one result per line, errors inline, empty lines skipped
+    output = io.StringIO()
+    failures = run_batch(["(\\x.x*x) 3\n", "\n", "1 +\n", "1:#\n"], output)
+    lines = output.getvalue().splitlines()
+    assert failures == 1 and lines[0] == "9.0" and lines[1].startswith("Error: ") and lines[2] == "(1.0 : #)"
+    print(f"BATCH {MAGENTA}(\\x.x*x) 3 / 1 + / 1:#{RESET} == 9.0 / Error: ... / (1.0 : #)")
+
+    # JSON lines with ids and timing
+    output = io.StringIO()
+    run_batch(['{"id": 4, "expression": "2*3"}', '"hd #"'], output, engine='machine', json_lines=True, timing=True)
+    answers = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert answers[0]['id'] == 4 and answers[0]['result'] == "6.0" and answers[1]['result'] == "(hd #)"
+    assert all('time_ms' in answer for answer in answers)
+    print(f"BATCH {MAGENTA}JSON lines{RESET} == {answers}")
+
+    print("\nAll tests passed!")
+
+def test_corpus_runner():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    cases = read_corpus("testing-data.txt")
+    results = run_corpus(cases, workers=2)
+    assert [record['line'] for record in results] == [case[1] for case in cases]
+    assert all(record['status'] == 'pass' for record in results)
+    print(f"CORPUS {MAGENTA}testing-data.txt{RESET} on 2 workers: {len(results)} passed")
+
+    # fresh names do not depend on what ran before in the same worker
+    renaming = ("-", 1, r"(\x.\y.x y) y", "?")
+    alone = run_corpus([renaming], workers=1)[0]['result']
+    after = run_corpus(cases + [renaming], workers=1)[-1]['result']
+    assert alone == after
+    sharded = run_corpus(cases + [renaming] * 4, workers=2, engine='environment', chunksize=3)
+    assert len({record['result'] for record in sharded[-4:]}) == 1
+    print(f"CORPUS {MAGENTA}{renaming[2]}{RESET} == {alone} wherever it runs")
+
+    print("\nAll tests passed!")
+
+def test_streaming_linearize():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # written in small blocks, the text is the same as the one linearize returns
+    for source in ["test.lc", r"\x.if x <= 1 then (let y = -x in y:#) else fix (\f.f x)", r"1 ;; (\x.x) ;; hd #"]:
+        if os.path.isfile(source):
+            source = open(source).read()
+        result = evaluate_program(source)
+        output = io.StringIO()
+        write_linearized(result, output, block=2)
+        assert output.getvalue() == linearize(result)
+    print(f"STREAM {MAGENTA}test.lc{RESET} == linearize")
+
+    # long lists, long ;; chains and deep terms do not use the Python stack
+    numbers = ('nil',)
+    for i in range(100000):
+        numbers = ('cons', ('num', float(i)), numbers)
+    chain = ('num', 0.0)
+    for i in range(100000):
+        chain = ('seq', chain, ('app', ('var', 'f'), ('num', 1.0)))
+    deep = ('var', 'x')
+    for i in range(100000):
+        deep = ('lam', 'x', ('app', deep, ('var', 'y')))
+    assert linearize(numbers).startswith("(99999.0 : (99998.0 : ") and linearize(numbers).endswith("#" + ")" * 100000)
+    assert linearize(chain).count(" ;; ") == 100000
+    assert linearize(deep).count("(\\x.") == 100000
+    print(f"STREAM {MAGENTA}100000 elements / ;; parts / binders{RESET} without recursion")
+
+    print("\nAll tests passed!")
+
+def test_packed_lists():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # a fully evaluated list of numbers is one array, the head at its end
+    numbers = evaluate(ast("1:2:3:#"))
+    assert numbers[0] == 'packed' and list(numbers[1]) == [3.0, 2.0, 1.0] and numbers[2] == 3
+    assert evaluate(ast(r"(\x.x):1:#"))[0] == 'cons' and evaluate(ast("(1:#):#"))[0] == 'cons'
+    print(f"PACKED {MAGENTA}1:2:3:#{RESET} == {numbers[:1] + (list(numbers[1]),) + numbers[2:]}")
+
+    # tl shares the array, cons appends to it while the list ends the array
+    rest = list_tail(numbers)
+    assert rest[1] is numbers[1] and rest[2] == 2
+    longer = cons_value(('num', 0.0), numbers)
+    assert longer[1] is numbers[1] and linearize(numbers) == "(1.0 : (2.0 : (3.0 : #)))"
+    # consing onto a view that is not at the end copies it, the other lists do not change
+    other = cons_value(('num', 5.0), rest)
+    assert other[1] is not numbers[1]
+    assert linearize(other) == "(5.0 : (2.0 : (3.0 : #)))" and linearize(longer) == "(0.0 : (1.0 : (2.0 : (3.0 : #))))"
+    print(f"PACKED {MAGENTA}tl / cons{RESET} share the array")
+
+    # == and printing work on packed lists, cons chains and mixtures of both
+    assert ast_equal(numbers, ('cons', ('num', 1.0), ('cons', ('num', 2.0), rest[:2] + (1,))))
+    assert not ast_equal(numbers, longer) and not ast_equal(numbers, ('nil',))
+    program = r"letrec map = \f.\xs. if xs == # then # else (f (hd xs)) : (map f (tl xs)) in " \
+              r"let l = map (\x.x*2) (1:2:3:#) in (l == 2:4:6:#) : (hd (tl l)) : (7 : tl l)"
+    expected = "(1.0 : (4.0 : (7.0 : (4.0 : (6.0 : #)))))"
+    for engine in engines:
+        assert interpret(program, engine=engine) == expected
+    print(f"PACKED {MAGENTA}map / == / tl{RESET} == {expected} on every engine")
+
+    print("\nAll tests passed!")
+
+def test_builtins():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    tests = [
+        (r"length (1:2:3:#)", "3.0"),
+        (r"append (1:2:#) (3:#)", "(1.0 : (2.0 : (3.0 : #)))"),
+        (r"append ((\x.x):#) (3:#)", r"((\x.x) : (3.0 : #))"),
+        (r"map (\x.x*2) (1:2:3:#)", "(2.0 : (4.0 : (6.0 : #)))"),
+        (r"map (map (\x.x+1)) ((1:#):(2:3:#):#)", "((2.0 : #) : ((3.0 : (4.0 : #)) : #))"),
+        (r"foldl (\a.\x.a-x) 0 (1:2:3:#)", "-6.0"),
+        (r"foldl (\a.\x. x : a) # (1:2:3:#)", "(3.0 : (2.0 : (1.0 : #)))"),
+        (r"filter (\x.x<=2) (1:5:2:#)", "(1.0 : (2.0 : #))"),
+        (r"sort (5:3:4:3:1:#)", "(1.0 : (3.0 : (3.0 : (4.0 : (5.0 : #)))))"),
+        (r"sort #", "#"),
+        # not a list or not numbers: the application is left as it is
+        (r"map f 5", "((map f) 5.0)"),
+        (r"sort (1:(\x.x):#)", r"(sort (1.0 : ((\x.x) : #)))"),
+        # a program's own definition comes first
+        (r"letrec map = \f.\xs. 7 in map 1 2", "7.0"),
+    ]
+    for input_expr, expected in tests:
+        for engine in engines:
+            assert interpret(input_expr, engine=engine) == expected
+        print(f"BUILTIN {MAGENTA}{input_expr}{RESET} == {expected}")
+
+    # the seed of foldl is only evaluated if f uses it, as with the letrec definition
+    letrec_foldl = r"letrec foldl = \f.\z.\xs. if xs == # then z else foldl f (f z (hd xs)) (tl xs) in "
+    source = r"foldl (\a.\x. x) ((\x. x x) (\x. x x)) (1:2:#)"
+    for engine in engines:
+        assert interpret(source, engine=engine) == interpret(letrec_foldl + source, engine=engine) == "2.0"
+        if engine in interpreter.need_engines:
+            assert interpret(source, engine=engine, call_by_need=True) == "2.0"
+    print(f"BUILTIN {MAGENTA}{source}{RESET} == 2.0 as with the letrec foldl")
+
+    # so are the accumulators f returns: the divergent one made at 2 is dropped at 3
+    f = r"(\a.\x. if x == 2 then (letrec l = \n. l n in l 0) else x)"
+    source = f"foldl {f} 0 (1:2:3:#)"
+    for engine in engines:
+        assert interpret(source, engine=engine) == interpret(letrec_foldl + source, engine=engine) == "3.0"
+        if engine in interpreter.need_engines:
+            assert interpret(source, engine=engine, call_by_need=True) == "3.0"
+    print(f"BUILTIN {MAGENTA}{source}{RESET} == 3.0 as with the letrec foldl")
+
+    # an f that always evaluates its accumulator gets it evaluated, one that may not a thunk
+    assert interpreter.strict_accumulator(ast(r"\a.\x. x + a"))
+    assert interpreter.strict_accumulator(ast(r"\a.\x. x : (if a then 1 else 0)"))
+    assert not interpreter.strict_accumulator(ast(r"\a.\x. if x then a else 0"))
+    assert not interpreter.strict_accumulator(ast(r"\a.\x. x a"))
+    assert not interpreter.strict_accumulator(ast(r"\a.\a. a"))
+
+    # on the machine a builtin forces its arguments and applies functions without recursion:
+    # a list of 10^4 elements made by a letrec loop, a function running a long loop
+    countdown = r"letrec r = \n. if n <= 0 then # else n : (r (n-1)) in "
+    loop = r"letrec loop = \n. if n <= 0 then 0 else loop (n-1) in "
+    tests = [
+        (countdown + "length (r 10000)", "10000.0"),
+        (countdown + r"foldl (\a.\x. if x <= 0 then a else a + x) 0 (r 10000)", "50005000.0"),
+        (countdown + r"foldl (\a.\x. a+x) 0 (filter (\x. x <= 10000) (map (\x. x*2) (r 10000)))", "25005000.0"),
+        (loop + r"map (\x. loop 5000) (1:#)", "(0.0 : #)"),
+        (loop + r"length (filter (\x. loop 5000 == 0) (1:2:#))", "2.0"),
+    ]
+    for input_expr, expected in tests:
+        assert interpret(input_expr, engine='machine', call_by_need=True) == expected
+        print(f"BUILTIN {MAGENTA}{input_expr}{RESET} == {expected} on the machine")
+
+    # same results as the letrec definitions of test.lc
+    source = open("test.lc").read()
+    numbers = "(7 : 2 : 9 : 2 : 0.5 : 8 : #)"
+    hand_written = source[source.index("letrec insert"):source.rindex("sort (")] + "sort " + numbers
+    assert interpret(hand_written, engine='machine', call_by_need=True) == interpret("sort " + numbers)
+    print(f"BUILTIN {MAGENTA}sort {numbers}{RESET} == insertion sort of test.lc")
+
+    print("\nAll tests passed!")
+
+def test_stats():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    source = r"letrec fact = \n. if n == 0 then 1 else n * fact (n-1) in fact 5"
+    for engine in engines:
+        stats = Stats()
+        result = interpret(source, engine=engine, stats=stats)
+        assert result == interpret(source, engine=engine) == "120.0"
+        assert stats.engine == engine
+        assert set(stats.phases) == {'parse', 'transform', 'optimize', 'evaluate', 'linearize'}
+        if engine != 'python':
+            # fact is called 6 times, with 5, 4, ..., 0, and bound once
+            assert stats.counts['beta'] == 6
+            assert stats.counts['unfold'] == 1
+        if engine in ('substitution', 'hashcons', 'debruijn', 'environment', 'machine'):
+            assert stats.nodes['app'] >= 6 and stats.max_depth > 0
+        if engine in ('substitution', 'hashcons', 'debruijn'):
+            assert stats.counts['substitute'] > 0 and stats.counts['built'] > 0
+        print(f"STATS {MAGENTA}{engine}{RESET}: {stats.to_json()}")
+
+    assert interpreter.active_stats is None
+
+    # counting adds no Python frames, a run with stats goes exactly as deep as one without
+    source = r"letrec s = \n. if n == 0 then 0 else n + s (n-1) in s 1500"
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(10000)
+    try:
+        stats = Stats()
+        assert interpret(source, engine='environment', stats=stats) == interpret(source, engine='environment') == "1125750.0"
+    finally:
+        sys.setrecursionlimit(limit)
+    assert stats.counts['beta'] == 1501 and stats.max_depth > 1500
+    print(f"STATS {MAGENTA}s 1500{RESET}: max depth {stats.max_depth}")
+
+    # an inner run keeps its own counters and hands the outer Stats back
+    outer, inner = Stats(), Stats()
+    interpreter.active_stats = outer
+    try:
+        interpret(r"(\x.x) 1", stats=inner)
+        assert interpreter.active_stats is outer
+    finally:
+        interpreter.active_stats = None
+    assert inner.counts['beta'] == 1 and not outer.counts
+
+    # the first run of a new program parses it, later runs find it in the cache
+    source = r"(\x.x) 31"
+    first, second = Stats(), Stats()
+    interpret(source, stats=first)
+    interpret(source, stats=second)
+    assert first.parse_cache == 'miss' and first.phases['parse'] > 0
+    assert second.parse_cache == 'memory' and second.phases['parse'] == 0
+
+    # peak memory is only measured on request
+    stats = Stats(memory=True)
+    interpret("1:2:3:#", engine='machine', call_by_need=True, stats=stats)
+    assert stats.peak_memory > 0
+    assert json.loads(stats.to_json())['counts']['beta'] == 0
+    print(f"STATS {MAGENTA}memory{RESET}: {stats.peak_memory} bytes")
+
+    print("\nAll tests passed!")
+
+def test_profile():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    source = open("test.lc").read()
+    for need in (False, True):
+        result, profile = profile_program(source, call_by_need=need)
+        assert result == interpret(source, engine='machine', call_by_need=need)
+        functions = profile.functions
+        # f is the factorial of test.lc, applied to 5, 4, ..., 0
+        assert functions['f'].calls == 6
+        assert functions['fib'].calls == 177
+        assert set(functions) == {'f', 'fib', 'insert', 'sort'}
+        for f in functions.values():
+            assert 0 < f.self_steps <= f.steps <= profile.steps
+            assert 0 <= f.self_time <= f.time <= profile.time
+        assert sum(f.self_steps for f in functions.values()) + profile.root.self_steps == profile.steps
+        print(f"PROFILE {MAGENTA}test.lc{RESET} need={need}: {json.dumps(profile.to_dict()['functions'][0])}")
+
+    # collapsed stacks: direct recursion is one frame, builtins are functions
+    source = r"letrec count = \n. if n == 0 then sort (3:1:2:#) else count (n-1) in let main = \u. count 3 in main 0"
+    result, profile = profile_program(source)
+    assert result == "(1.0 : (2.0 : (3.0 : #)))"
+    assert profile.functions['count'].calls == 4 and profile.functions['sort'].calls == 1
+    output = io.StringIO()
+    profile.write_collapsed(output, weight='steps')
+    stacks = [line.rsplit(" ", 1)[0] for line in output.getvalue().splitlines()]
+    # the steps of a builtin are those of the machine evaluating its arguments, here the list
+    assert stacks == ["(program)", "(program);main", "(program);main;count", "(program);main;count;sort"]
+    output = io.StringIO()
+    profile.write_collapsed(output)
+    assert output.getvalue().splitlines()[-1].startswith("(program);main;count;sort ")
+
+    # trace events are kept for the first max_events calls
+    _, profile = profile_program(source, profile=Profile(max_events=2))
+    output = io.StringIO()
+    profile.write_chrome_trace(output)
+    trace = json.loads(output.getvalue())
+    # the tail calls of count go on in the event of its first call, only sort is dropped
+    assert [event['name'] for event in trace['traceEvents']] == ['main', 'count']
+    assert trace['otherData']['dropped_events'] == 1
+    print(f"PROFILE {MAGENTA}{source}{RESET}")
+    print(profile.report())
+
+    # a tail loop runs in constant space while profiled, its calls are all counted (with need,
+    # without it n is a chain of thunks n-1)
+    class Deepest(Profile):
+        depth = 0
+
+        def enter(self, name):
+            Profile.enter(self, name)
+            self.depth = max(self.depth, len(self.stack))
+
+    source = r"letrec loop = \n. if n <= 0 then 0 else loop (n-1) in loop 200000"
+    stats = interpreter.active_stats = Stats()
+    try:
+        result, profile = profile_program(source, call_by_need=True, profile=Deepest())
+    finally:
+        interpreter.active_stats = None
+    assert result == "0.0" and profile.functions['loop'].calls == 200001
+    assert profile.depth == 1 and stats.max_depth < 10
+    print(f"PROFILE {MAGENTA}loop 200000{RESET}: machine stack {stats.max_depth}, profile stack {profile.depth}")
+
+    print("\nAll tests passed!")
+
+def test_memo():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    fib = r"letrec fib = \n. if n <= 1 then n else fib (n-1) + fib (n-2) in fib 30"
+    for engine in ('environment', 'machine', 'compiled'):
+        for need in (False, True):
+            memo = Memo()
+            # 2.7 million calls without memoization, one per n with it
+            assert interpret(fib, engine=engine, call_by_need=need, memo=memo) == "832040.0"
+            function, = memo.functions.values()
+            assert (function.name, function.misses, function.hits) == ('fib', 31, 28)
+    print(f"MEMO {MAGENTA}{fib}{RESET}: {memo.report()}")
+
+    # the same results as without memoization, on the programs of test.lc
+    source = open("test.lc").read()
+    memo = Memo()
+    assert interpret(source, engine='machine', memo=memo) == interpret(source, engine='machine')
+    assert [f.name for f in memo.functions.values()] == ['f', 'fib', 'insert', 'sort']
+
+    # list arguments are interned, equal lists are one key
+    source = r"letrec len = \xs. if xs == # then 0 else 1 + len (tl xs) in len (1:2:3:#) + len (7:2:3:#)"
+    memo = Memo(names={'len'})
+    assert interpret(source, engine='environment', memo=memo) == "6.0"
+    assert memo.functions.popitem()[1].hits == 1 # len (2:3:#)
+
+    # a closure depends on where it was made, not only on its arguments
+    source = r"let g = \k. letrec f = \n. n + k in f 1 in g 1 + g 2"
+    assert interpret(source, engine='compiled', memo=True) == "5.0"
+
+    # a function argument turns memoization off for the function
+    source = r"letrec map = \f.\xs. if xs == # then # else (f (hd xs)) : (map f (tl xs)) in map (\x.x*2) (1:2:#)"
+    memo = Memo()
+    assert interpret(source, engine='machine', call_by_need=True, memo=memo) == "(2.0 : (4.0 : #))"
+    function, = memo.functions.values()
+    assert function.disabled == "argument f is not data" and function.hits + function.misses == 0
+
+    # an argument the body does not use is not evaluated, the call is not looked up
+    source = r"letrec f = \x.\y. x in f 1 ((\x. x x) (\x. x x))"
+    for engine in ('environment', 'machine', 'compiled', 'bytecode'):
+        for need in (False, True):
+            memo = Memo()
+            assert interpret(source, engine=engine, call_by_need=need, memo=memo) == interpret(source, engine=engine) == "1.0"
+            function, = memo.functions.values()
+            assert (function.skipped, function.hits + function.misses, function.disabled) == (1, 0, None)
+    print(f"MEMO {MAGENTA}{source}{RESET} == 1.0, the call is skipped")
+
+    # the cache is bounded, the least recently used results go first
+    memo = Memo(size=5)
+    assert interpret(fib, engine='machine', memo=memo) == "832040.0"
+    assert len(memo.entries) == 5 and memo.evictions == 26
+    print(f"MEMO {MAGENTA}{fib}{RESET} with size 5: {memo.report()}")
+
+    # only the engines of closures memoize
+    try:
+        interpret(fib, engine='substitution', memo=True)
+        assert False
+    except ValueError:
+        pass
+
+    print("\nAll tests passed!")
+
+def test_optimizer():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    def optimized(source, passes=('beta', 'inline', 'dead', 'fold')):
+        optimizer = Optimizer(passes)
+        return linearize(optimizer.run(LambdaCalculusTransformer().transform(parser.parse(source)))), optimizer
+
+    tests = [
+        # (source, passes, optimized program)
+        (r"2 * 3 + 1", ('fold',), "7.0"),
+        (r"-(4 - 5) <= 1", ('fold',), "1.0"),
+        (r"if 1 == 1 then a else b", ('fold',), "a"),
+        (r"\x. x * (2 * 3)", ('fold',), r"(\x.(x * 6.0))"),
+        (r"let x = 2 in x * x", ('inline',), "(2.0 * 2.0)"),
+        (r"let x = 2 in x * x", ('inline', 'fold'), "4.0"),
+        (r"let x = y in \z. x z", ('inline',), r"(\z.(y z))"),
+        # y would be captured by \y
+        (r"let x = y in \y. x y", ('inline',), r"(let x = y in (\y.(x y)))"),
+        (r"let x = f 1 in 5", ('dead',), "5.0"),
+        (r"letrec f = \n. f n in 5", ('dead',), "5.0"),
+        (r"(\x. x + 1) 2", ('beta',), "(let x = 2.0 in (x + 1.0))"),
+        (r"(\x. x + 1) 2", ('beta', 'inline', 'fold'), "3.0"),
+        (r"(\x. 7) (f 1)", ('beta', 'dead'), "7.0"),
+        # a binding that is used and not trivial stays
+        (r"let x = f 1 in x + x", ('beta', 'inline', 'dead', 'fold'), "(let x = (f 1.0) in (x + x))"),
+    ]
+    for source, passes, expected in tests:
+        result, optimizer = optimized(source, passes)
+        assert result == expected, (source, result)
+        print(f"OPTIMIZE {MAGENTA}{source}{RESET} with {','.join(passes)} == {expected}")
+
+    # the same results on every engine
+    source = r"letrec f = \n. if n == 0 then 0 else (let k = 2 * 3 + 1 in let unused = n * n in (\d. d + k - 7) 1 + f (n - 1)) in f 10"
+    _, optimizer = optimized(source)
+    assert optimizer.counts == {'beta': 1, 'inline': 2, 'dead': 1, 'fold': 4}
+    assert optimizer.nodes_after < optimizer.nodes_before
+    for engine in engines:
+        assert interpret(source, engine=engine, optimize=True) == interpret(source, engine=engine) == "10.0"
+    print(f"OPTIMIZE {MAGENTA}{source}{RESET}: {optimizer.report()}")
+    source = open("test.lc").read()
+    assert interpret(source, optimize=True) == interpret(source)
+    # an unused binding is dropped even if it would not terminate
+    assert interpret(r"let x = (letrec loop = \n. loop n in loop 1) in 3", optimize={'dead'}) == "3.0"
+
+    try:
+        Optimizer(['fold', 'unroll'])
+        assert False
+    except ValueError:
+        pass
+
+    print("\nAll tests passed!")
+
+def test_bytecode():
+    MAGENTA = '\033[95m'
+    RESET = '\033[0m'
+
+    # the same results as interpret() on the corpora, by name and by need
+    sources = [case[2] for name in ("testing-data.txt", "testing-data-M1.txt") for case in read_corpus(name)]
+    for source in sources + [open("test.lc").read()]:
+        expected = interpret(source)
+        assert interpret(source, engine='bytecode') == expected
+        assert interpret(source, engine='bytecode', call_by_need=True) == expected
+    print(f"BYTECODE {MAGENTA}testing-data.txt, testing-data-M1.txt, test.lc{RESET}: {len(sources) + 1} programs as interpret()")
+
+    tests = [
+        (r"(\x.a x) ((\x.x)b)", r"(a ((\x.x) b))"),
+        (r"(\x.y) ((\x.x x) (\x.x x))", "y"),
+        (r"(\x. if a then x else 2) 1", "(if a then 1.0 else 2.0)"),
+        (r"let g = if 1 then \x.x+1 else \x.x in g 4", "5.0"),
+        (r"(fix (\f.\n. if n == 0 then 1 else n * f (n-1))) 5", "120.0"),
+        (r"fix a", "(a (fix a))"),
+        (r"map (\x.x*2) (1:2:#) ;; hd a ;; -(1:#)", "(2.0 : (4.0 : #)) ;; (hd a) ;; (-(1.0 : #))"),
+    ]
+    for input_expr, expected in tests:
+        assert interpret(input_expr, engine='bytecode') == expected
+        assert interpret(input_expr, engine='bytecode', call_by_need=True) == interpret(input_expr, engine='machine', call_by_need=True)
+        print(f"BYTECODE {MAGENTA}{input_expr}{RESET} == {expected}")
+
+    # an argument computed early is printed as the expression it was until it is forced
+    source = r"letrec f = \n. if n == 0 then \x.n-1 else f (n-1) in f 1"
+    assert interpret(source, engine='bytecode').endswith(".((1.0 - 1.0) - 1.0))")
+    assert interpret(source, engine='bytecode', call_by_need=True).endswith(".(0.0 - 1.0))")
+    print(f"BYTECODE {MAGENTA}{source}{RESET} == (\\x.((1.0 - 1.0) - 1.0)), with need (\\x.(0.0 - 1.0))")
+
+    # far deeper than the Python recursion limit, in and out of tail position
+    for source, expected in [(r"letrec loop = \n.\acc. if n == 0 then acc else loop (n-1) (acc+n) in loop 20000 0", "200010000.0"),
+                             (r"letrec sum = \n. if n == 0 then 0 else n + sum (n-1) in sum 20000", "200010000.0")]:
+        assert interpret(source, engine='bytecode') == interpret(source, engine='bytecode', call_by_need=True) == expected
+        print(f"BYTECODE {MAGENTA}{source}{RESET} == {expected}")
+
+    # flat arrays, and a listing of every block
+    fib = r"letrec fib = \n. if n <= 1 then n else fib (n-1) + fib (n-2) in fib 15"
+    program = compile_bytecode(ast(fib))
+    assert program.code.typecode == 'l' and program.numbers.typecode == 'd'
+    assert len(program.blocks) == 4 # the program, fib and the thunks of n-1 and n-2
+    listing = disassemble(fib)
+    assert listing.startswith("block 0: program") and "TEST_CONST" in listing and "TAILCALL_VAR" in listing
+    assert interpret(fib, engine='bytecode', memo=True) == "610.0"
+    print(listing)
+
+    print("\nAll tests passed!")
+
 if __name__ == "__main__":
     print(Fore.GREEN + "\nTEST PARSING\n" + Style.RESET_ALL); test_parse()
     print(Fore.GREEN + "\nTEST SUBSTITUTION\n" + Style.RESET_ALL); test_substitute()
@@ -273,4 +1095,25 @@ if __name__ == "__main__":
     
     print(Fore.BLUE + "\nTEST MILESTONE 1 (Arithmetic)\n" + Style.RESET_ALL); test_milestone1()
     print(Fore.BLUE + "\nTEST MILESTONE 2 (Conditionals, Let, Letrec)\n" + Style.RESET_ALL); test_milestone2()
-    print(Fore.BLUE + "\nTEST MILESTONE 3 (Sequencing, Lists)\n" + Style.RESET_ALL); test_milestone3()
\ No newline at end of file
+    print(Fore.BLUE + "\nTEST MILESTONE 3 (Sequencing, Lists)\n" + Style.RESET_ALL); test_milestone3()
+    print(Fore.GREEN + "\nTEST ENVIRONMENT ENGINE\n" + Style.RESET_ALL); test_environment()
+    print(Fore.GREEN + "\nTEST DE BRUIJN ENGINE\n" + Style.RESET_ALL); test_debruijn()
+    print(Fore.GREEN + "\nTEST CALL-BY-NEED\n" + Style.RESET_ALL); test_call_by_need()
+    print(Fore.GREEN + "\nTEST ITERATIVE MACHINE\n" + Style.RESET_ALL); test_machine()
+    print(Fore.GREEN + "\nTEST CLOSURE COMPILATION\n" + Style.RESET_ALL); test_compile_program()
+    print(Fore.GREEN + "\nTEST PYTHON CODE GENERATION\n" + Style.RESET_ALL); test_python_codegen()
+    print(Fore.GREEN + "\nTEST HASH-CONSING\n" + Style.RESET_ALL); test_hashcons()
+    print(Fore.GREEN + "\nTEST SHARED SUBSTITUTION\n" + Style.RESET_ALL); test_shared_substitution()
+    print(Fore.GREEN + "\nTEST RECURSIVE BINDINGS\n" + Style.RESET_ALL); test_recursive_bindings()
+    print(Fore.GREEN + "\nTEST PARSER CACHE\n" + Style.RESET_ALL); test_parser_cache()
+    print(Fore.GREEN + "\nTEST PARSE CACHE\n" + Style.RESET_ALL); test_parse_cache()
+    print(Fore.GREEN + "\nTEST BATCH MODE\n" + Style.RESET_ALL); test_batch()
+    print(Fore.GREEN + "\nTEST CORPUS RUNNER\n" + Style.RESET_ALL); test_corpus_runner()
+    print(Fore.GREEN + "\nTEST STREAMING LINEARIZE\n" + Style.RESET_ALL); test_streaming_linearize()
+    print(Fore.GREEN + "\nTEST PACKED LISTS\n" + Style.RESET_ALL); test_packed_lists()
+    print(Fore.GREEN + "\nTEST LIST BUILTINS\n" + Style.RESET_ALL); test_builtins()
+    print(Fore.GREEN + "\nTEST STATS\n" + Style.RESET_ALL); test_stats()
+    print(Fore.GREEN + "\nTEST PROFILER\n" + Style.RESET_ALL); test_profile()
+    print(Fore.GREEN + "\nTEST MEMOIZATION\n" + Style.RESET_ALL); test_memo()
+    print(Fore.GREEN + "\nTEST OPTIMIZER\n" + Style.RESET_ALL); test_optimizer()
+    print(Fore.GREEN + "\nTEST BYTECODE VM\n" + Style.RESET_ALL); test_bytecode()
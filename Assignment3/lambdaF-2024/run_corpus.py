@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Run testing-data corpora (interpreter, <expression>, <expected>) on a pool of worker processes"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import interpreter
+
+def read_corpus(filename):
+    # each line is: interpreter, <expression>, <expected>
+    cases = []
+    with open(filename) as file:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line:
+                continue
+            _, rest = line.split(', ', 1)
+            expression, expected = rest.rsplit(', ', 1)
+            cases.append((filename, number, expression, expected))
+    return cases
+
+# settings of the worker processes, set once by init_worker
+options = {'engine': None, 'need': False}
+
+def init_worker(engine, need, ast_cache):
+    # the parser is built when interpreter is imported, so once per worker
+    options['engine'] = engine
+    options['need'] = need
+    interpreter.parse_cache.directory = ast_cache
+
+def run_case(case):
+    filename, number, expression, expected = case
+    # fresh names are numbered from 1 for every expression, as if it ran in a process of
+    # its own, so results do not depend on which worker got which lines
+    interpreter.name_generator.counter = 0
+    start = time.perf_counter()
+    try:
+        result = interpreter.interpret(expression, engine=options['engine'], call_by_need=options['need'])
+        status = 'pass' if result == expected else 'fail'
+    except Exception as e:
+        message = str(e).strip().splitlines()
+        result = message[0] if message else type(e).__name__
+        status = 'error'
+    elapsed = time.perf_counter() - start
+    return {'file': filename, 'line': number, 'expression': expression, 'expected': expected,
+            'result': result, 'status': status, 'time_ms': round(elapsed * 1000, 3)}
+
+def run_corpus(cases, workers=None, engine=None, need=False, ast_cache=None, chunksize=None):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        init_worker(engine, need, ast_cache)
+        return [run_case(case) for case in cases]
+    # a few chunks per worker keeps the pool busy when some lines take much longer than others
+    chunksize = chunksize or max(1, len(cases) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(engine, need, ast_cache)) as pool:
+        return list(pool.map(run_case, cases, chunksize=chunksize))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('files', nargs='+', help="testing-data files")
+    arg_parser.add_argument('--workers', type=int, help="number of worker processes (default: number of CPUs)")
+    arg_parser.add_argument('--engine', choices=sorted(interpreter.engines), help="evaluation engine (default: substitution)")
+    arg_parser.add_argument('--need', action='store_true', help="call-by-need")
+    arg_parser.add_argument('--ast-cache', metavar='DIR', help="directory for parsed programs shared by the workers")
+    arg_parser.add_argument('--chunksize', type=int, help="lines handed to a worker at a time")
+    arg_parser.add_argument('--report', metavar='FILE', help="write the result of every line to FILE as JSON")
+    args = arg_parser.parse_args()
+    if args.need and (args.engine or 'environment') not in interpreter.need_engines:
+        arg_parser.error(f"--need is not supported by the {args.engine} engine")
+
+    cases = []
+    for filename in args.files:
+        cases += read_corpus(filename)
+    start = time.perf_counter()
+    results = run_corpus(cases, args.workers, args.engine, args.need, args.ast_cache, args.chunksize)
+    elapsed = time.perf_counter() - start
+
+    for record in results:
+        if record['status'] != 'pass':
+            print(f"{record['status'].upper()} {record['file']}:{record['line']}: {record['expression']}")
+            print(f"    Expected: {record['expected']}")
+            print(f"    Got:      {record['result']}")
+    counts = {status: sum(record['status'] == status for record in results) for status in ('pass', 'fail', 'error')}
+    slowest = max(results, key=lambda record: record['time_ms'], default=None)
+    print(f"{len(results)} lines: {counts['pass']} passed, {counts['fail']} failed, {counts['error']} errors "
+          f"in {elapsed:.2f}s")
+    if slowest is not None:
+        print(f"slowest: {slowest['file']}:{slowest['line']} ({slowest['time_ms']:.1f} ms)")
+    if args.report:
+        with open(args.report, 'w') as file:
+            json.dump({'elapsed_s': round(elapsed, 3), 'counts': counts, 'lines': results}, file, indent=1)
+    sys.exit(0 if counts['pass'] == len(results) else 1)
+
+if __name__ == "__main__":
+    main()
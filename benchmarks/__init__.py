@@ -0,0 +1,7 @@
+"""Benchmarks of the calculator (Assignment1), lambdaC (Assignment2) and lambdaF (Assignment3)
+
+    python3 -m benchmarks                          run every workload, print a table
+    python3 -m benchmarks --output results.json    also save the results
+    python3 -m benchmarks --baseline results.json  compare with saved results
+    python3 -m benchmarks.generate calculator-file 100000 > lines.txt
+"""
@@ -0,0 +1,161 @@
+"""Run the benchmarks, report latency percentiles, throughput and peak memory as JSON,
+and compare with a saved baseline"""
+
+import argparse
+import gc
+import json
+import math
+import platform
+import sys
+import time
+import tracemalloc
+
+from .workloads import workloads, lambdaF
+
+# the lambdaC evaluator recurses once per reduction, the sizes here are far past the
+# default limit of 1000
+RECURSION_LIMIT = 100000
+
+def percentile(sorted_values, p):
+    # nearest rank
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def measure(workload, size=None, repeat=5, warmup=1, memory=True, **options):
+    run, units = workload.make(size, **options)
+    for _ in range(warmup):
+        run()
+    times = []
+    for _ in range(repeat):
+        gc.collect() # garbage of the previous run is not collected on this run's time
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    # an extra run for memory, as tracemalloc slows the program down several times
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    median = percentile(times, 50)
+    return {
+        'size': size or workload.size,
+        'unit': workload.unit,
+        'units': units,
+        'runs': repeat,
+        'latency_ms': {
+            'min': round(times[0] * 1000, 3),
+            'p50': round(median * 1000, 3),
+            'p90': round(percentile(times, 90) * 1000, 3),
+            'p99': round(percentile(times, 99) * 1000, 3),
+            'max': round(times[-1] * 1000, 3),
+            'mean': round(sum(times) / len(times) * 1000, 3),
+        },
+        'throughput': round(units / median, 3), # units per second, at the median
+        'peak_memory': peak,
+    }
+
+# the workloads of 'baseline' that got slower (by the median) or use more memory than
+# 'threshold' allows, with one line of report for every workload in both
+def compare(results, baseline, threshold):
+    lines, regressions = [], []
+    for name, result in results['workloads'].items():
+        before = baseline['workloads'].get(name)
+        if before is None:
+            continue
+        if before['size'] != result['size'] or before.get('options') != result.get('options'):
+            lines.append(f"{name:<22} not compared: run with other settings than the baseline")
+            continue
+        change = result['latency_ms']['p50'] / before['latency_ms']['p50'] - 1
+        status = 'ok'
+        if change > threshold:
+            status = 'SLOWER'
+            regressions.append(name)
+        elif change < -threshold:
+            status = 'faster'
+        line = (f"{name:<22} {before['latency_ms']['p50']:>10.2f} ms -> {result['latency_ms']['p50']:>10.2f} ms "
+                f"{change:>+8.1%}  {status}")
+        if before['peak_memory'] and result['peak_memory']:
+            memory = result['peak_memory'] / before['peak_memory'] - 1
+            line += f", memory {memory:+.1%}"
+            if memory > threshold:
+                line += " MORE MEMORY"
+                if name not in regressions:
+                    regressions.append(name)
+        lines.append(line)
+    return lines, regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(prog="python3 -m benchmarks", description=__doc__)
+    arg_parser.add_argument('workloads', nargs='*', metavar='WORKLOAD',
+                            help=f"workloads to run (default: all of {', '.join(workloads)})")
+    arg_parser.add_argument('--size', action='append', default=[], metavar='WORKLOAD=N',
+                            help="size of a workload (terms, lines, list length, fib n, numeral)")
+    arg_parser.add_argument('--repeat', type=int, default=5, help="timed runs per workload")
+    arg_parser.add_argument('--warmup', type=int, default=1, help="untimed runs first")
+    arg_parser.add_argument('--no-memory', action='store_true', help="skip the (slow) run measuring peak memory")
+    arg_parser.add_argument('--engine', help="lambdaF engine (default: machine)")
+    arg_parser.add_argument('--by-name', action='store_true', help="lambdaF call-by-name (default: call-by-need)")
+    arg_parser.add_argument('--output', metavar='FILE', help="write the results to FILE as JSON")
+    arg_parser.add_argument('--baseline', metavar='FILE', help="compare with the results saved in FILE")
+    arg_parser.add_argument('--threshold', type=float, default=0.10,
+                            help="relative slowdown (or memory growth) counted as a regression (default: 0.10)")
+    args = arg_parser.parse_args()
+
+    names = args.workloads or list(workloads)
+    unknown = [name for name in names if name not in workloads]
+    if unknown:
+        arg_parser.error(f"unknown workload {unknown[0]!r}")
+    sizes = {}
+    for setting in args.size:
+        name, _, size = setting.partition('=')
+        if name not in workloads or not size.isdigit():
+            arg_parser.error(f"bad --size {setting!r}")
+        sizes[name] = int(size)
+    options = {'engine': args.engine or 'machine', 'need': not args.by_name}
+    if any(name.startswith('lambdaF') for name in names):
+        interpreter = lambdaF()
+        if options['engine'] not in interpreter.engines:
+            arg_parser.error(f"unknown engine {options['engine']!r}")
+        if options['need'] and options['engine'] not in interpreter.need_engines:
+            arg_parser.error(f"the {options['engine']} engine needs --by-name")
+
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), RECURSION_LIMIT))
+    results = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'workloads': {},
+    }
+    print(f"{'workload':<22} {'size':>8} {'p50 (ms)':>10} {'p90 (ms)':>10} {'p99 (ms)':>10} "
+          f"{'throughput':>18} {'peak (KiB)':>11}")
+    for name in names:
+        workload = workloads[name]
+        result = measure(workload, sizes.get(name), args.repeat, args.warmup, not args.no_memory, **options)
+        if name.startswith('lambdaF'):
+            result['options'] = options
+        results['workloads'][name] = result
+        latency = result['latency_ms']
+        peak = f"{result['peak_memory'] / 1024:.1f}" if result['peak_memory'] is not None else "-"
+        print(f"{name:<22} {result['size']:>8} {latency['p50']:>10.2f} {latency['p90']:>10.2f} {latency['p99']:>10.2f} "
+              f"{result['throughput']:>10.0f} {workload.unit + '/s':<7} {peak:>11}", flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        lines, regressions = compare(results, baseline, args.threshold)
+        print(f"\ncompared with {args.baseline} (threshold {args.threshold:.0%}):")
+        for line in lines:
+            print(line)
+        if regressions:
+            print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Synthetic inputs of any size for the benchmarks, reproducible from a seed"""
+
+import random
+import sys
+
+# calculator
+
+# a single expression of n terms such as 7*x, 3^2, log 8 base 2 or -4, joined by + and -
+# as a balanced tree, so the depth (and the recursion of the transformers) grows with log n
+def calculator_expression(n, seed=354):
+    rng = random.Random(seed)
+    terms = [calculator_term(rng) for _ in range(n)]
+    while len(terms) > 1:
+        joined = [f"({terms[i]} {rng.choice('+-')} {terms[i + 1]})" for i in range(0, len(terms) - 1, 2)]
+        if len(terms) % 2:
+            joined.append(terms[-1])
+        terms = joined
+    return terms[0] if terms else "0"
+
+def calculator_term(rng):
+    kind = rng.randrange(5)
+    a, b = rng.randint(1, 9), rng.randint(1, 9)
+    if kind == 0:
+        return f"{a}*{b}"
+    elif kind == 1:
+        return f"{a}^{rng.randint(0, 3)}"
+    elif kind == 2:
+        return f"log {2 ** a} base 2"
+    elif kind == 3:
+        return f"-{a}.{b}"
+    return str(a)
+
+# n lines of a few terms each, as read by the bulk file mode (--file)
+def calculator_lines(n, terms=8, seed=354):
+    rng = random.Random(seed)
+    return [" + ".join(calculator_term(rng) for _ in range(terms)) for _ in range(n)]
+
+# lambdaC
+
+def church_numeral(n):
+    return r"(\f.\x." + "f (" * n + "x" + ")" * n + ")"
+
+# the parity of m * n, computed by applying the product to 'not' starting from 'true',
+# so the whole product is reduced: evaluate only reduces the head of a term
+def church_times_parity(m, n):
+    true, false = r"(\a.\b.a)", r"(\a.\b.b)"
+    times = r"(\m.\n.\f.m (n f))"
+    return rf"({times} {church_numeral(m)} {church_numeral(n)}) (\p.p {false} {true}) {true} even odd"
+
+# lambdaF
+
+def fib_program(n):
+    return rf"letrec fib = \n. if n <= 1 then n else fib (n-1) + fib (n-2) in fib {n}"
+
+INSERTION_SORT = r"""letrec insert = \x.\xs.
+    if xs == # then
+        x : #
+    else if (x <= (hd xs)) then
+        x : xs
+    else
+        (hd xs) : (insert x (tl xs))
+in
+letrec sort = \xs.
+    if xs == # then
+        #
+    else
+        insert (hd xs) (sort (tl xs))
+in
+"""
+
+MAP = r"letrec map = \f.\xs. if xs == # then # else (f (hd xs)) : (map f (tl xs)) in "
+
+# n random numbers as a list literal, in chunks joined with append: the parser recurses
+# once per element of a literal
+def list_literal(n, chunk=100, seed=354):
+    rng = random.Random(seed)
+    numbers = [str(rng.randint(0, 999)) for _ in range(n)]
+    chunks = ["(" + " : ".join(numbers[i:i + chunk] + ["#"]) + ")" for i in range(0, n, chunk)]
+    literal = chunks.pop() if chunks else "#"
+    while chunks:
+        literal = "append " + chunks.pop() + " (" + literal + ")"
+    return literal
+
+def sort_program(n):
+    return INSERTION_SORT + "sort (" + list_literal(n) + ")"
+
+def map_program(n):
+    return MAP + r"map (\x.x*x+1) (" + list_literal(n) + ")"
+
+generators = {
+    'calculator-expression': lambda n: [calculator_expression(n)],
+    'calculator-file': calculator_lines,
+    'lambdaC-times': lambda n: [church_times_parity(n, n + 1)],
+    'lambdaF-fib': lambda n: [fib_program(n)],
+    'lambdaF-sort': lambda n: [sort_program(n)],
+    'lambdaF-map': lambda n: [map_program(n)],
+}
+
+def main():
+    if len(sys.argv) != 3 or sys.argv[1] not in generators:
+        sys.exit(f"usage: python3 -m benchmarks.generate {{{','.join(generators)}}} SIZE")
+    for line in generators[sys.argv[1]](int(sys.argv[2])):
+        print(line.replace("\n", " "))
+
+if __name__ == "__main__":
+    main()
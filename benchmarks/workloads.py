@@ -0,0 +1,99 @@
+"""The workloads: what is run and how many units of work one run is"""
+
+import atexit
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+
+from . import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the interpreters are single files in the assignment directories (one with a '-' in its
+# name), so they are loaded by path, under names of their own
+def load(name, path):
+    module = sys.modules.get(name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, path))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        spec.loader.exec_module(module)
+    return module
+
+def calculator():
+    return load('calculator_cfg', os.path.join('Assignment1', 'calculator_cfg.py'))
+
+def lambdaC():
+    return load('lambdaC_interpreter', os.path.join('Assignment2', 'lambdaC-2024', 'interpreter-typed.py'))
+
+def lambdaF():
+    return load('lambdaF_interpreter', os.path.join('Assignment3', 'lambdaF-2024', 'interpreter.py'))
+
+class Workload:
+    def __init__(self, name, unit, size, prepare):
+        self.name = name
+        self.unit = unit # the unit of work, throughput is in units per second
+        self.size = size # default size
+        self.prepare = prepare # (size, options) -> (run, units): a function doing one run,
+                               # and the units of work of a run
+
+    # every run does the whole job: the caches of compiled and parsed programs are emptied
+    # first, so a change to the parser shows as much as a change to evaluation
+    def make(self, size=None, **options):
+        return self.prepare(size or self.size, options)
+
+def calculator_expression(size, options):
+    calc = calculator()
+    expression = generate.calculator_expression(size)
+    def run():
+        return calc.compile_expression(expression)(None)
+    return run, size
+
+def calculator_file(size, options):
+    calc = calculator()
+    file = tempfile.NamedTemporaryFile('w', suffix='.txt', delete=False)
+    with file:
+        file.write("\n".join(generate.calculator_lines(size)) + "\n")
+    atexit.register(os.unlink, file.name)
+    def run():
+        calc.cached_compile.cache_clear()
+        lines, failures = calc.evaluate_file(file.name, io.BytesIO(), workers=1)
+        assert lines == size and failures == 0
+    return run, size
+
+def lambdaC_times(size, options):
+    interpreter = lambdaC()
+    source = generate.church_times_parity(size, size + 1)
+    expected = 'even' if size * (size + 1) % 2 == 0 else 'odd'
+    def run():
+        assert interpreter.interpret(source) == expected
+    return run, size * (size + 1) # applications of not
+
+def lambdaF_program(program, units):
+    def prepare(size, options):
+        interpreter = lambdaF()
+        source = program(size)
+        engine = options.get('engine') or 'machine'
+        need = options.get('need', True)
+        def run():
+            interpreter.parse_cache.entries.clear()
+            return interpreter.interpret(source, engine=engine, call_by_need=need)
+        return run, units(size)
+    return prepare
+
+def fib_calls(n):
+    a, b = 1, 1 # fib n makes 2 fib(n+1) - 1 calls
+    for _ in range(n):
+        a, b = b, a + b
+    return 2 * a - 1
+
+workloads = {workload.name: workload for workload in [
+    Workload('calculator-expression', 'terms', 100000, calculator_expression),
+    Workload('calculator-file', 'lines', 20000, calculator_file),
+    Workload('lambdaC-times', 'steps', 60, lambdaC_times),
+    Workload('lambdaF-fib', 'calls', 18, lambdaF_program(generate.fib_program, fib_calls)),
+    Workload('lambdaF-sort', 'elements', 200, lambdaF_program(generate.sort_program, lambda n: n)),
+    Workload('lambdaF-map', 'elements', 10000, lambdaF_program(generate.map_program, lambda n: n)),
+]}